@@ -0,0 +1,126 @@
+import logging, math, threading, time
+from collections import Counter, deque
+import metrics
+
+# Admission control in front of generation: priority queues with caps overall, for batch work and per client.
+logger = logging.getLogger(__name__)
+
+admission_wait_seconds = metrics.Histogram("gistify_admission_wait_seconds", "Time requests spent queued for admission", ["priority"])
+admission_total = metrics.Counter("gistify_admission_total", "Admission decisions by priority and outcome", ["priority", "outcome"])
+
+class AdmissionRejected(Exception):
+    """A request turned away by admission control, answered with status and a Retry-After hint."""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+class _Ticket:
+    def __init__(self):
+        self.since = time.monotonic()
+
+class AdmissionController:
+    """Admits generation work by priority with caps on concurrent requests overall, for batch work and per client.
+
+    Clients count against their cap while queued as well as while running. Batch work normally waits while any
+    interactive request is queued, but once the oldest batch request has waited batch_aging_seconds it goes
+    next, so a steady stream of questions can't starve summaries. Retry-After hints come from a moving average
+    of how long admitted requests of each priority hold their slot.
+    """
+
+    def __init__(self, max_active, max_active_batch, max_per_user, queue_sizes, batch_aging_seconds=None):
+        self.max_active = max_active
+        self.max_active_batch = max(1, min(max_active_batch, max_active))
+        self.max_per_user = max_per_user
+        self.queue_sizes = queue_sizes
+        self.batch_aging_seconds = batch_aging_seconds
+        self.condition = threading.Condition()
+        self.waiting = {priority: deque() for priority in queue_sizes}
+        self.active = {priority: 0 for priority in queue_sizes}
+        self.per_user = Counter()
+        self.hold_seconds = {"interactive": 5.0, "batch": 30.0}
+
+    def _batch_aged(self):
+        """Whether the oldest queued batch request has waited long enough to go ahead of interactive ones."""
+        if self.batch_aging_seconds is None or not self.waiting["batch"] or self.active["batch"] >= self.max_active_batch:
+            return False
+        return time.monotonic() - self.waiting["batch"][0].since >= self.batch_aging_seconds
+
+    def _can_start(self, priority, ticket):
+        if sum(self.active.values()) >= self.max_active or self.waiting[priority][0] is not ticket:
+            return False
+        if priority == "batch":
+            return self.active["batch"] < self.max_active_batch and (not self.waiting["interactive"] or self._batch_aged())
+        return not self._batch_aged()
+
+    def _retry_after(self, priority):
+        # Roughly how long the requests already queued ahead will take to drain
+        slots = self.max_active if priority == "interactive" else self.max_active_batch
+        return max(1, math.ceil(self.hold_seconds[priority] * (len(self.waiting[priority]) + 1) / slots))
+
+    def _reject(self, priority, outcome, message, status):
+        admission_total.inc(priority=priority, outcome=outcome)
+        logger.warning(f"Admission: rejected {priority} request ({outcome})")
+        raise AdmissionRejected(message, status, self._retry_after(priority))
+
+    def acquire(self, priority, user=None, timeout=None):
+        """Wait up to timeout seconds (None waits indefinitely) for a slot, then return a release callable.
+
+        Raises AdmissionRejected when the client is over its cap, the queue is full or the timeout passes.
+        """
+        start = time.perf_counter()
+        with self.condition:
+            if user is not None and self.per_user[user] >= self.max_per_user:
+                self._reject(priority, "user_limit", "Too many requests in progress for this user, please retry shortly", 429)
+            if len(self.waiting[priority]) >= self.queue_sizes[priority]:
+                self._reject(priority, "queue_full", "The service is busy, please retry shortly", 503)
+            ticket = _Ticket()
+            self.waiting[priority].append(ticket)
+            if user is not None:
+                self.per_user[user] += 1
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._can_start(priority, ticket):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.waiting[priority].remove(ticket)
+                    self._release_user(user)
+                    self.condition.notify_all()
+                    self._reject(priority, "deadline", "The service is busy, please retry shortly", 503)
+                self.condition.wait(remaining)
+            self.waiting[priority].popleft()
+            self.active[priority] += 1
+            # Whoever is next in line may be able to start as well
+            self.condition.notify_all()
+
+        admission_wait_seconds.observe(time.perf_counter() - start, priority=priority)
+        admission_total.inc(priority=priority, outcome="admitted")
+        admitted = time.perf_counter()
+        released = []
+
+        def release():
+            if released:
+                return
+            released.append(True)
+            with self.condition:
+                self.active[priority] -= 1
+                self._release_user(user)
+                self.hold_seconds[priority] = 0.8 * self.hold_seconds[priority] + 0.2 * (time.perf_counter() - admitted)
+                self.condition.notify_all()
+        return release
+
+    def _release_user(self, user):
+        if user is not None:
+            self.per_user[user] -= 1
+            if self.per_user[user] <= 0:
+                del self.per_user[user]
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                "active": dict(self.active),
+                "queued": {priority: len(waiting) for priority, waiting in self.waiting.items()},
+                "users": len(self.per_user),
+                "hold_seconds": {priority: round(seconds, 3) for priority, seconds in self.hold_seconds.items()},
+            }
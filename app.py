@@ -1,29 +1,34 @@
-from flask import Flask, request, jsonify 
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-import os, uuid, logging, re 
+import os, uuid, logging, re, hashlib, json, threading, time, queue, tempfile, random, contextvars, socket
+from contextlib import contextmanager, closing
+import pymongo
 import torch
-from transformers import T5Tokenizer, T5ForConditionalGeneration
+from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+from transformers.modeling_outputs import BaseModelOutput
 import chromadb
-from chromadb.config import Settings 
-from PyPDF2 import PdfReader
+from pdf_extraction import iter_pdf_pages, start_extraction_pool
+from chunking import iter_token_chunks
+import context_packing
+from admission_control import AdmissionController, AdmissionRejected, admission_wait_seconds, admission_total
+from generation_control import GenerationController, quality_gate_stats, quality_gate_lock
+from document_artifacts import detect_sections, textrank, extractive_digest, build_keyword_index, tokenize_terms, bm25_search, reciprocal_rank_fusion
+from inference_backends import load_generation_model, load_embedding_model
+import metrics
 from docx import Document
 from werkzeug.utils import secure_filename
 from chromadb import PersistentClient
 from pymongo import MongoClient
-from datetime import datetime
+from datetime import datetime, timedelta
 import cloudinary
 import cloudinary.uploader
-import cloudinary.api
-import requests
-from io import BytesIO
 from dotenv import load_dotenv
 import cloudinary.utils
-from bson import ObjectId
-from pymongo.errors import WriteError
-from sentence_transformers import SentenceTransformer
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import WriteError, DuplicateKeyError, DocumentTooLarge
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from collections import Counter
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
 
 app = Flask(__name__)
 CORS(app)
@@ -34,325 +39,1168 @@ cloudinary.config(
     api_key=os.getenv("CLOUDINARY_API_KEY", "495726973616313"),
     api_secret=os.getenv("CLOUDINARY_API_SECRET", "cPM0j222fiNUVb1rHXuugZ2AZ-A")
 )
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
+# Prompts, retrieved chunks and generated text are only logged for this fraction of requests, and only with LOG_LEVEL=DEBUG
+PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv("PAYLOAD_LOG_SAMPLE_RATE", 0.01))
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/gistifyDB")
-mongo_client = MongoClient(MONGO_URI)
+# connect=False defers the connection to first use, so a preloading gunicorn master never holds sockets its forked workers would share
+mongo_client = MongoClient(MONGO_URI, connect=False)
 db = mongo_client["gistifyDB"]
 summaries_collection = db["Summary"]
+summary_cache_collection = db["SummaryCache"]
+document_index_collection = db["DocumentIndex"]
+# One entry per reference an upload holds on an indexed document, so only its holder can release it
+document_links_collection = db["DocumentLinks"]
+summary_jobs_collection = db["SummaryJobs"]
+chunk_summaries_collection = db["ChunkSummaries"]
+document_artifacts_collection = db["DocumentArtifacts"]
+answer_cache_collection = db["AnswerCache"]
+cloudinary_uploads_collection = db["CloudinaryUploads"]
+
+SUMMARY_CACHE_TTL_SECONDS = int(os.getenv("SUMMARY_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", 5000))
+SUMMARY_JOB_WORKERS = int(os.getenv("SUMMARY_JOB_WORKERS", 2))
+SUMMARY_JOB_MAX_PENDING = int(os.getenv("SUMMARY_JOB_MAX_PENDING", 20))
+SUMMARY_JOB_TTL_SECONDS = int(os.getenv("SUMMARY_JOB_TTL_SECONDS", 24 * 60 * 60))
+# Each process renews a lease on the jobs it has queued or running; any process takes over jobs whose lease
+# has lapsed, such as those of a worker that died, so no job waits for a full restart
+SUMMARY_JOB_HEARTBEAT_SECONDS = int(os.getenv("SUMMARY_JOB_HEARTBEAT_SECONDS", 30))
+SUMMARY_JOB_LEASE_SECONDS = int(os.getenv("SUMMARY_JOB_LEASE_SECONDS", 120))
+# Bump when the summarization pipeline changes in a way that should invalidate cached summaries
+SUMMARY_PIPELINE_VERSION = 5
+
+# /ask answers are cached per document and matched by normalized question text, then by MiniLM similarity
+# of the question to cached ones. Each document keeps its ANSWER_CACHE_MAX_PER_DOC most recently used answers.
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+ANSWER_CACHE_MAX_PER_DOC = int(os.getenv("ANSWER_CACHE_MAX_PER_DOC", 200))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.93))
+# Bump when the answer pipeline changes in a way that should invalidate cached answers
+ANSWER_PIPELINE_VERSION = 2
+
+# "retrieval" summarizes the top retrieved chunks; "map_reduce" summarizes every part of the document
+# and reduces those summaries hierarchically. SUMMARY_MAP_REDUCE_TOKEN_BUDGET caps the document tokens
+# read by map calls, so the cost of a map-reduce summary stops growing past that document size.
+SUMMARY_MODES = ("retrieval", "map_reduce")
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "retrieval")
+SUMMARY_MAP_INPUT_TOKENS = int(os.getenv("SUMMARY_MAP_INPUT_TOKENS", 768))
+SUMMARY_MAP_BATCH_SIZE = int(os.getenv("SUMMARY_MAP_BATCH_SIZE", 8))
+SUMMARY_MAP_REDUCE_TOKEN_BUDGET = int(os.getenv("SUMMARY_MAP_REDUCE_TOKEN_BUDGET", 32768))
+SUMMARY_REDUCE_MAX_LEVELS = 4
+
+# Sections, extractive digest, token counts and keyword index are computed in the background after ingest
+PRECOMPUTE_ARTIFACTS = os.getenv("PRECOMPUTE_ARTIFACTS", "1") == "1"
+DOCUMENT_ARTIFACTS_VERSION = 3
+DIGEST_MAX_WORDS = int(os.getenv("DIGEST_MAX_WORDS", 150))
+
+# Extraction processes per gunicorn worker, started with it; below 2 PDFs are extracted serially. At most half
+# the cores by default, since torch needs the rest. Only PDFs of PDF_PARALLEL_MIN_PAGES or more are split.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", min(4, (os.cpu_count() or 1) // 2)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 64))
+
+# all-MiniLM-L6-v2 truncates inputs at 256 word pieces, so chunks stay comfortably below that
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 200))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 40))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 4))
 
 UPLOAD_FOLDER = 'Uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB max
 
-# Initialize ChromaDB client
-chroma_client = PersistentClient(path="./chroma_db")
-collection = chroma_client.get_or_create_collection(name="research_papers")
+# Inference backends: torch, torch-int8 (dynamic quantization) or onnx (ONNX Runtime, exported once
+# into MODEL_CACHE_DIR). Run benchmarks/backends.py to check a backend's parity before switching.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", INFERENCE_BACKEND)
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "./model_cache")
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+MODEL_NAME = os.getenv("GENERATION_MODEL_NAME", "google/flan-t5-base")
+
+# ChromaDB, the SentenceTransformer and FLAN-T5 are loaded in parallel by load_models() in the
+# background, so the app answers /healthz and /readyz while they are still booting.
+chroma_client = None
+collection = None
+embedding_model = None
+tokenizer = None
+model = None
+
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", 5))
+STARTUP_RETRY_AFTER_SECONDS = int(os.getenv("STARTUP_RETRY_AFTER_SECONDS", 15))
+READINESS_TIMEOUT_SECONDS = float(os.getenv("READINESS_TIMEOUT_SECONDS", 2))
+
+# With CHROMA_HOST set, vectors live in a separate Chroma server (`chroma run --path ./chroma_db`) that
+# any number of web workers can share. Without it, a single process owns CHROMA_PATH through PersistentClient.
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", 8000))
+
+# Generation settings per summary type. These are also part of the summary cache key,
+# so changing them invalidates previously cached summaries.
+SUMMARY_GENERATION_PARAMS = {
+    "concise": {
+        "max_length": 500,
+        "min_length": 250,
+        "length_penalty": 0.8,
+        "num_beams": 5,
+        "temperature": 0.6,
+        "do_sample": True,
+        "no_repeat_ngram_size": 3
+    },
+    "analytical": {
+        "max_length": 600,
+        "min_length": 400,
+        "length_penalty": 1.0,
+        "num_beams": 5,
+        "temperature": 0.6,
+        "do_sample": True,
+        "no_repeat_ngram_size": 3
+    },
+    "comprehensive": {
+        "max_length": 700,
+        "min_length": 500,
+        "length_penalty": 1.2,
+        "num_beams": 5,
+        "temperature": 0.6,
+        "do_sample": True,
+        "no_repeat_ngram_size": 3
+    },
+    "default": {
+        "max_length": 500,
+        "min_length": 300,
+        "length_penalty": 1.0,
+        "num_beams": 5,
+        "temperature": 0.6,
+        "do_sample": True,
+        "no_repeat_ngram_size": 3
+    },
+}
+SUMMARY_QUESTION_GENERATION_PARAMS = {
+    "max_length": 300,
+    "min_length": 150,
+    "length_penalty": 0.8,
+    "num_beams": 4,
+    "temperature": 0.6,
+    "do_sample": True,
+    "no_repeat_ngram_size": 3
+}
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 2048))
+# FLAN-T5's input window; retrieved context is packed to fit it exactly instead of being truncated blindly
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1024))
+MIN_PARTIAL_CHUNK_TOKENS = 32
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", 8))
+GENERATION_BATCHING = os.getenv("GENERATION_BATCHING", "1") == "1"
+GENERATION_MAX_BATCH_SIZE = int(os.getenv("GENERATION_MAX_BATCH_SIZE", 8))
+GENERATION_BATCH_WAIT_MS = float(os.getenv("GENERATION_BATCH_WAIT_MS", 25))
+# Admission control in front of generation. Interactive /ask requests and batch summaries wait in separate
+# queues; interactive ones are admitted first and batch work never holds more than ADMISSION_MAX_ACTIVE_BATCH
+# of the ADMISSION_MAX_ACTIVE slots, so questions aren't stuck behind long summaries. Requests left waiting past
+# their queue timeout, or arriving to a full queue, get 503; a client over ADMISSION_MAX_PER_USER gets 429.
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", 4))
+ADMISSION_MAX_ACTIVE_BATCH = int(os.getenv("ADMISSION_MAX_ACTIVE_BATCH", 2))
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", 2))
+ADMISSION_QUEUE_SIZES = {
+    "interactive": int(os.getenv("ADMISSION_INTERACTIVE_QUEUE_SIZE", 32)),
+    "batch": int(os.getenv("ADMISSION_BATCH_QUEUE_SIZE", 8)),
+}
+ADMISSION_QUEUE_TIMEOUTS = {
+    "interactive": float(os.getenv("ADMISSION_INTERACTIVE_QUEUE_TIMEOUT", 15)),
+    "batch": float(os.getenv("ADMISSION_BATCH_QUEUE_TIMEOUT", 60)),
+}
+# A batch request or prompt that has waited this long goes ahead of interactive ones, so summaries can't starve
+BATCH_AGING_SECONDS = float(os.getenv("BATCH_AGING_SECONDS", 20))
+# Clients that proxy for many users; their requests are capped per user only when they send a user_id
+ADMISSION_TRUSTED_PROXIES = {address.strip() for address in os.getenv("ADMISSION_TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if address.strip()}
+# Chat sessions: /ask keeps each (user, doc_id)'s chunks and embeddings in memory, so follow-up questions
+# retrieve without a Chroma query. T5 encoder states are cached per prompt, so quality gate retries and repeated
+# prompts only run the decoder. Both caches are bounded by the bytes they hold; 0 disables them.
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 30 * 60))
+SESSION_MAX_QUERIES = 32
+ENCODER_CACHE_MAX_BYTES = int(os.getenv("ENCODER_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+# Fuse BM25 over the document's keyword index with vector results for user questions
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+RRF_K = int(os.getenv("RRF_K", 60))
+
+ANSWER_GENERATION_PARAMS = {
+    "max_length": 400,
+    "min_length": 50,
+    "length_penalty": 1.0,
+    "num_beams": 3,
+    "temperature": 0.9,
+    "do_sample": True,
+    "no_repeat_ngram_size": 3
+}
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry and counts hits and misses."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            return self.entries.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class SizedLRUCache(LRUCache):
+    """LRUCache bounded by the total size of its entries in bytes, as reported by callers, instead of their count."""
+
+    def __init__(self, max_bytes):
+        super().__init__(max_size=None)
+        self.max_bytes = max_bytes
+        self.sizes = {}
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def put(self, key, value, size):
+        """Store value, evicting least recently used entries to make room. Returns False if it can never fit."""
+        with self.lock:
+            if key in self.entries:
+                del self.entries[key]
+                self.total_bytes -= self.sizes.pop(key)
+            if size > self.max_bytes:
+                return False
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                evicted, _ = self.entries.popitem(last=False)
+                self.total_bytes -= self.sizes.pop(evicted)
+                self.evictions += 1
+            return True
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.sizes:
+                self.total_bytes -= self.sizes.pop(key)
+            return self.entries.pop(key, None)
+
+    def pop_where(self, predicate):
+        """Drop every entry whose key matches predicate."""
+        with self.lock:
+            keys = [key for key in self.entries if predicate(key)]
+        for key in keys:
+            self.pop(key)
+
+    def stats(self):
+        stats = super().stats()
+        del stats["max_size"]
+        with self.lock:
+            return {**stats, "bytes": self.total_bytes, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+generation_token_counts = LRUCache(20000)
+session_cache = SizedLRUCache(SESSION_CACHE_MAX_BYTES)
+encoder_cache = SizedLRUCache(ENCODER_CACHE_MAX_BYTES)
+context_packing_stats = {"requests": 0, "used_tokens": 0, "dropped_tokens": 0, "duplicate_chunks": 0}
+context_packing_lock = threading.Lock()
+
+# Per-stage latency. span() records a stage into the gistify_stage_seconds histogram and into the trace of the
+# request it runs for, which is kept in a context variable so pipeline threads and generation batches inherit it.
+stage_seconds = metrics.Histogram("gistify_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+request_seconds = metrics.Histogram("gistify_request_seconds", "Request latency by endpoint", ["endpoint", "method"])
+requests_total = metrics.Counter("gistify_requests_total", "Requests by endpoint and status code", ["endpoint", "method", "status"])
+
+class RequestTrace:
+    """Stage timings of one request or summary job, collected from every thread working on it."""
+
+    def __init__(self, request_id, sampled):
+        self.request_id = request_id
+        self.sampled = sampled
+        self.start = time.perf_counter()
+        self.status = 500
+        # Set on admission; the generation batcher serves interactive prompts first
+        self.priority = "interactive"
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def summary(self):
+        """Milliseconds per stage. Stages of concurrent branches overlap, so they can add up to more than the total."""
+        with self.lock:
+            return {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+
+class TraceGroup:
+    """Fans stage timings out to every request sharing a generation batch."""
+
+    def __init__(self, traces):
+        self.traces = traces
+        self.sampled = any(trace.sampled for trace in traces)
+
+    def add(self, stage, seconds):
+        for trace in self.traces:
+            trace.add(stage, seconds)
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+def start_trace(request_id):
+    """Make a new trace current, deciding once whether its payloads are logged. Returns (trace, reset token)."""
+    trace = RequestTrace(request_id, random.random() < PAYLOAD_LOG_SAMPLE_RATE)
+    return trace, current_trace.set(trace)
+
+def record_stage(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as one occurrence of a pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+_timed_iter_state = threading.local()
 
-# Initialize SentenceTransformer for embeddings
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+def timed_iter(stage, iterable):
+    """Yield from iterable, recording the time spent producing its items as one occurrence of stage.
 
-# Initialize FLAN-T5 model and tokenizer
-tokenizer = T5Tokenizer.from_pretrained("google/flan-t5-base", legacy=False)
-model = T5ForConditionalGeneration.from_pretrained("google/flan-t5-base", device_map="auto")
+    Time spent in nested timed_iter stages on the same thread is excluded, so chunking over
+    extracted pages doesn't count the extraction again.
+    """
+    iterator = iter(iterable)
+    total = 0.0
+    try:
+        while True:
+            stack = _timed_iter_state.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = time.perf_counter() - start
+                total += elapsed - stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+            yield item
+    finally:
+        record_stage(stage, total)
+
+def log_payload(message):
+    """Log request payloads at DEBUG for sampled requests. message is a callable, so other requests never format it."""
+    trace = current_trace.get()
+    if trace is not None and trace.sampled and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"[{getattr(trace, 'request_id', 'batch')}] {message()}")
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor whose tasks run in a copy of the submitter's context, so they add to its request trace."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def encode_query(query):
+    """Embed a query with the SentenceTransformer, memoizing repeated query texts."""
+    embedding = query_embedding_cache.get(query)
+    if embedding is None:
+        with span("embed_query"):
+            embedding = embedding_model.encode([query], normalize_embeddings=True)[0]
+        embedding.setflags(write=False)
+        query_embedding_cache.put(query, embedding)
+    return embedding
 
 def clean_text(text):
     text = re.sub(r"http\S+|www\S+|https\S+", "", text)
     text = re.sub(r"\s+", " ", text).strip()
     return text
 
-def get_text_from_pdf_from_url(url):
-    try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        pdf_stream = BytesIO(response.content)
-        reader = PdfReader(pdf_stream)
-        text = ""
-        for page in reader.pages:
-            page_text = page.extract_text() or ""
-            text += page_text
-        if not text.strip():
-            logger.error("No text extracted from PDF")
-            return ""
-        logger.info(f"Extracted {len(text)} characters from PDF")
-        return text
-    except Exception as e:
-        logger.error(f"Failed to extract text from PDF URL: {e}")
-        return ""
-
-def get_text_from_docx_from_url(url):
-    try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        docx_stream = BytesIO(response.content)
-        doc = Document(docx_stream)
-        text = ""
-        for para in doc.paragraphs:
-            if para.text.strip():
-                text += para.text + "\n"
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    if cell.text.strip():
-                        text += cell.text + "\n"
-        text = text.strip()
-        if not text:
-            logger.error("No text extracted from DOCX")
-            return ""
-        logger.info(f"Extracted {len(text)} characters from DOCX")
-        return text
-    except Exception as e:
-        logger.error(f"Failed to extract text from DOCX URL: {e}")
-        return ""
-
-def chunk_text(text, max_chunk_size=500):
-    """Split text into chunks of approximately max_chunk_size characters."""
-    chunks = []
-    current_chunk = ""
-    paragraphs = text.split('\n')
-    
-    for para in paragraphs:
-        para = para.strip()
-        if not para:
-            continue
-        if len(current_chunk) + len(para) + 1 <= max_chunk_size:
-            current_chunk += para + "\n"
-        else:
-            if current_chunk.strip():
-                chunks.append(current_chunk.strip())
-            current_chunk = para + "\n"
-    
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    
-    return chunks if chunks else [text[:max_chunk_size]]
+def extract_docx_text(source):
+    """Extract paragraph and table text from a DOCX path or file-like object."""
+    doc = Document(source)
+    parts = []
+    for para in doc.paragraphs:
+        if para.text.strip():
+            parts.append(para.text)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                if cell.text.strip():
+                    parts.append(cell.text)
+    return "\n".join(parts).strip()
+
+def count_embedding_tokens(texts):
+    """Token counts under the MiniLM tokenizer, which is what bounds what an embedding can see."""
+    return [len(ids) for ids in embedding_model.tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+def iter_chunks(paragraphs):
+    """Chunk paragraphs on sentence boundaries into overlapping, token-bounded chunks as they arrive."""
+    return iter_token_chunks(paragraphs, count_embedding_tokens, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+
+def chunk_text(text):
+    """Split text into overlapping chunks of at most CHUNK_MAX_TOKENS embedding tokens."""
+    return list(iter_chunks([text]))
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def prefetch(iterable, maxsize):
+    """Iterate iterable on a background thread, buffering at most maxsize items ahead of the consumer."""
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as e:
+            put((done, e))
+
+    # Run in a copy of the caller's context so stages timed on this thread count towards its request
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,), name="ingest-prefetch", daemon=True).start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
 
 def are_summaries_similar(summary1, summary2, threshold=0.9):
     """Check if two summaries are too similar using cosine similarity of embeddings."""
-    embeddings = embedding_model.encode([summary1, summary2])
-    similarity = cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
+    embeddings = embedding_model.encode([summary1, summary2], normalize_embeddings=True)
+    similarity = float(embeddings[0] @ embeddings[1])
     return similarity > threshold
 
+# Word counts the quality gates require
+ANSWER_MIN_WORDS = 20
+SUMMARY_QUESTION_MIN_WORDS = 50
+SUMMARY_MIN_WORDS = 200
+
+def content_words(text):
+    return {word for word in re.findall(r'\w+', text.lower()) if len(word) > 3}
+
+def max_phrase_repetition(text):
+    phrases = [text[i:i+10] for i in range(0, len(text), 10)]  # Check 10-char phrases
+    phrase_counts = Counter(phrases)
+    return max(phrase_counts.values()) if phrase_counts else 1
+
+def answer_requirements(question):
+    """(content words shared with the question, word count) an answer needs to pass the gate."""
+    # For summary questions, require stricter criteria
+    if is_summary_question(question):
+        return 3, SUMMARY_QUESTION_MIN_WORDS
+    return 2, ANSWER_MIN_WORDS
+
+def answer_quality_checks(answer, question):
+    """Evaluate each criterion of the answer gate separately."""
+    with span("relevance_check"):
+        relevant_words = content_words(question) & content_words(answer)
+        max_repetition = max_phrase_repetition(answer)
+        word_count = len(answer.split())
+        min_relevant_words, min_words = answer_requirements(question)
+
+        log_payload(lambda: f"Relevance check: common words = {sorted(relevant_words)}, word count = {word_count}, max repetition = {max_repetition}")
+
+        return {
+            "relevant_words": len(relevant_words) >= min_relevant_words,
+            "word_count": word_count >= min_words,
+            "repetition": max_repetition <= 2,
+        }
+
 def is_answer_relevant(answer, question):
     """Check if the answer is relevant to the question and document content."""
-    question_words = set(re.findall(r'\w+', question.lower()))
-    answer_words = set(re.findall(r'\w+', answer.lower()))
-    common_words = question_words.intersection(answer_words)
-    relevant_words = [word for word in common_words if len(word) > 3]
-        
-    # Check for repetition
-    answer_phrases = [answer[i:i+10] for i in range(0, len(answer), 10)]  # Check 10-char phrases
-    phrase_counts = Counter(answer_phrases)
-    max_repetition = max(phrase_counts.values()) if phrase_counts else 1
-    
-    # For summary questions, require stricter criteria
-    is_summary_question = any(phrase in question.lower() for phrase in ["summary of this paper", "summarize the paper", "what is the paper about"])
-    word_count = len(answer.split())
-    
-    logger.info(f"Relevance check: common words = {relevant_words}, word count = {word_count}, max repetition = {max_repetition}")
-    
-    if is_summary_question:
-        return (
-            len(relevant_words) >= 3 and
-            word_count >= 50 and
-            max_repetition <= 2
-        )
-    return (
-        len(relevant_words) >= 2 and
-        word_count >= 20 and
-        max_repetition <= 2
-    )
+    return all(answer_quality_checks(answer, question).values())
+
+def summary_quality_checks(summary):
+    """Evaluate each criterion of the summary gate separately."""
+    with span("relevance_check"):
+        max_repetition = max_phrase_repetition(summary)
+
+        # Check if summary resembles query instructions
+        query_like_terms = {'provide', 'summary', 'key findings', 'themes', 'conclusions', 'evaluations', 'implications'}
+        summary_words = set(re.findall(r'\w+', summary.lower()))
+        query_overlap = len(query_like_terms.intersection(summary_words))
+
+        word_count = len(summary.split())
+
+        logger.info(f"Word count = {word_count}, max repetition = {max_repetition}, query overlap = {query_overlap}")
+
+        return {
+            "word_count": word_count >= SUMMARY_MIN_WORDS,
+            "repetition": max_repetition <= 2,
+            "query_overlap": query_overlap <= 2,  # Reject if summary contains too many query-like terms
+        }
 
 def is_summary_relevant(summary, doc_id):
-    """Check if the summary is relevant to the document content."""    
-    # Check for repetition
-    summary_phrases = [summary[i:i+10] for i in range(0, len(summary), 10)]
-    phrase_counts = Counter(summary_phrases)
-    max_repetition = max(phrase_counts.values()) if phrase_counts else 1
-    
-    # Check if summary resembles query instructions
-    query_like_terms = {'provide', 'summary', 'key findings', 'themes', 'conclusions', 'evaluations', 'implications'}
-    summary_words = set(re.findall(r'\w+', summary.lower()))
-    query_overlap = len(query_like_terms.intersection(summary_words))
-    
-    word_count = len(summary.split())
-    
-    logger.info(f"Word count = {word_count}, max repetition = {max_repetition}, query overlap = {query_overlap}")
+    """Check if the summary is relevant to the document content."""
+    return all(summary_quality_checks(summary).values())
+
+def encode_prompts(prompts):
+    """T5 encoder states for prompts, padded into one batch, reusing the cached states of recently seen prompts.
+
+    Returns (encoder_outputs, attention_mask) for model.generate.
+    """
+    device = model.device
+    keys = [hashlib.sha256(prompt.encode("utf-8")).hexdigest() for prompt in prompts]
+    states = [encoder_cache.get(key) for key in keys]
+    missing = [i for i, state in enumerate(states) if state is None]
+    if missing:
+        with span("tokenize"):
+            inputs = tokenizer([prompts[i] for i in missing], return_tensors="pt", padding=True, truncation=True, max_length=1024).to(device)
+        with span("encode"), torch.no_grad():
+            hidden = model.get_encoder()(input_ids=inputs['input_ids'], attention_mask=inputs['attention_mask']).last_hidden_state
+        for row, i in enumerate(missing):
+            # Padding is on the right, so a prompt's states are the first attention_mask.sum() positions
+            states[i] = hidden[row, :int(inputs['attention_mask'][row].sum())].clone()
+            encoder_cache.put(keys[i], states[i], states[i].numel() * states[i].element_size())
+
+    longest = max(state.shape[0] for state in states)
+    hidden = states[0].new_zeros((len(states), longest, states[0].shape[-1]))
+    attention_mask = torch.zeros((len(states), longest), dtype=torch.long, device=device)
+    for row, state in enumerate(states):
+        hidden[row, :state.shape[0]] = state
+        attention_mask[row, :state.shape[0]] = 1
+    return BaseModelOutput(last_hidden_state=hidden), attention_mask
+
+def generate_batch(prompts, generation_params, reuse_encoder=True):
+    """Run one padded model.generate call over prompts sharing the same generation settings.
+
+    With reuse_encoder, encoder states come from encoder_cache where possible. The ONNX backend
+    runs its own encoder session, so it always encodes.
+    """
+    device = model.device
+    if reuse_encoder and ENCODER_CACHE_MAX_BYTES > 0 and INFERENCE_BACKEND != "onnx":
+        encoder_outputs, attention_mask = encode_prompts(prompts)
+        with span("generate"):
+            outputs = model.generate(encoder_outputs=encoder_outputs, attention_mask=attention_mask, **generation_params)
+    else:
+        with span("tokenize"):
+            inputs = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=1024).to(device)
+        with span("generate"):
+            outputs = model.generate(
+                input_ids=inputs['input_ids'],
+                attention_mask=inputs['attention_mask'],
+                **generation_params
+            )
+    with span("decode"):
+        return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+class PendingGeneration:
+    """A prompt waiting in the generation batcher for a batch with the same settings, or a call to run on its own."""
+
+    def __init__(self, key, prompt, generation_params, trace, call=None):
+        self.key = key
+        self.prompt = prompt
+        self.generation_params = generation_params
+        self.trace = trace
+        self.call = call
+        self.since = time.monotonic()
+        self.future = Future()
+
+    @property
+    def interactive(self):
+        return self.trace is None or self.trace.priority == "interactive"
+
+class GenerationBatcher:
+    """Coalesces concurrent generation requests with identical settings into single model.generate batches.
+
+    Batches run on a pool of workers, so prompts with different settings, such as a summary and the
+    advantages generated alongside it, run side by side instead of queueing behind each other. Batch-priority
+    work holds at most max_batch_workers of them, leaving the rest to interactive prompts, and batch prompts
+    that have waited aging_seconds are served before interactive ones.
+    """
+
+    def __init__(self, max_batch_size, wait_ms, workers, max_batch_workers=None, aging_seconds=None):
+        self.max_batch_size = max_batch_size
+        self.wait_seconds = wait_ms / 1000.0
+        self.num_workers = max(1, workers)
+        self.max_batch_workers = self.num_workers if max_batch_workers is None else max(1, min(max_batch_workers, self.num_workers))
+        self.aging_seconds = aging_seconds
+        self.pending = []
+        # Settings a worker is currently collecting a batch for, so two workers never claim the same prompts
+        self.forming = set()
+        self.condition = threading.Condition()
+        self.workers = []
+        self.stats = {"requests": 0, "batches": 0, "max_batch_size": 0, "batch_sizes": Counter(), "max_concurrent_batches": 0}
+        self.running = 0
+        # Workers collecting or running a batch, by the priority of the item that started it
+        self.busy = {"interactive": 0, "batch": 0}
+
+    def generate(self, prompt, generation_params):
+        """Queue a prompt and block until its batch has been generated."""
+        item = PendingGeneration(json.dumps(generation_params, sort_keys=True), prompt, generation_params, current_trace.get())
+        with self.condition:
+            self._start_workers()
+            self.pending.append(item)
+            self.stats["requests"] += 1
+            self.condition.notify_all()
+        return item.future.result()
+
+    def submit(self, call):
+        """Queue call() to run alone on a worker, such as a streamed generation. Returns its Future."""
+        item = PendingGeneration(object(), None, None, current_trace.get(), call)
+        with self.condition:
+            self._start_workers()
+            self.pending.append(item)
+            self.stats["requests"] += 1
+            self.condition.notify_all()
+        return item.future
+
+    def _start_workers(self):
+        # Started lazily, so a preloading gunicorn master never forks with worker threads it can't pass on
+        self.workers = [worker for worker in self.workers if worker.is_alive()]
+        while len(self.workers) < self.num_workers:
+            worker = threading.Thread(target=self._run, name=f"generation-worker-{len(self.workers)}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _select(self):
+        """The item whose settings the next batch uses.
+
+        That is the oldest batch item once it has aged, else the oldest interactive one, else the oldest batch
+        item, skipping batch items while batch work already holds all the workers it may.
+        """
+        available = [item for item in self.pending if item.key not in self.forming]
+        interactive = [item for item in available if item.interactive]
+        batch = [item for item in available if not item.interactive] if self.busy["batch"] < self.max_batch_workers else []
+        if batch and self.aging_seconds is not None and time.monotonic() - batch[0].since >= self.aging_seconds:
+            return batch[0]
+        if interactive:
+            return interactive[0]
+        return batch[0] if batch else None
+
+    def _next_batch(self):
+        with self.condition:
+            while (first := self._select()) is None:
+                self.condition.wait()
+            key = first.key
+            priority = "interactive" if first.interactive else "batch"
+            self.forming.add(key)
+            self.busy[priority] += 1
+            deadline = time.monotonic() + self.wait_seconds
+            while True:
+                # sorted is stable, so interactive requests go first and each class stays in arrival order
+                batch = sorted((item for item in self.pending if item.key == key), key=lambda item: not item.interactive)[:self.max_batch_size]
+                remaining = deadline - time.monotonic()
+                # Calls have a key of their own, so nothing can join them
+                if len(batch) >= self.max_batch_size or remaining <= 0 or first.call is not None:
+                    break
+                self.condition.wait(remaining)
+            self.forming.discard(key)
+            for item in batch:
+                self.pending.remove(item)
+            self.running += 1
+            self.stats["batches"] += 1
+            self.stats["batch_sizes"][len(batch)] += 1
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+            self.stats["max_concurrent_batches"] = max(self.stats["max_concurrent_batches"], self.running)
+            # Prompts with other settings may be waiting for this worker to stop collecting
+            self.condition.notify_all()
+            return batch, priority
+
+    def _run(self):
+        while True:
+            batch, priority = self._next_batch()
+            # Each request in the batch is charged the batch's full tokenize, generate and decode time
+            token = current_trace.set(TraceGroup([item.trace for item in batch if item.trace is not None]))
+            try:
+                if batch[0].call is not None:
+                    # Cancelled while queued, e.g. a stream whose client went away
+                    if batch[0].future.set_running_or_notify_cancel():
+                        self._run_call(batch[0])
+                    continue
+                outputs = generate_batch([item.prompt for item in batch], batch[0].generation_params)
+                for item, output in zip(batch, outputs):
+                    item.future.set_result(output)
+            except Exception as e:
+                logger.error(f"Batched generation failed for {len(batch)} requests: {str(e)}")
+                for item in batch:
+                    item.future.set_exception(e)
+            finally:
+                current_trace.reset(token)
+                with self.condition:
+                    self.running -= 1
+                    self.busy[priority] -= 1
+                    # Batch items may have been waiting for a worker of their own
+                    self.condition.notify_all()
+
+    @staticmethod
+    def _run_call(item):
+        try:
+            item.future.set_result(item.call())
+        except Exception as e:
+            logger.error(f"Generation call failed: {str(e)}")
+            item.future.set_exception(e)
+
+    def snapshot(self):
+        with self.condition:
+            batches = self.stats["batches"]
+            return {
+                "queue_depth": len(self.pending),
+                "workers": self.num_workers,
+                "max_batch_workers": self.max_batch_workers,
+                "running_batches": self.running,
+                "busy_workers": dict(self.busy),
+                "max_concurrent_batches": self.stats["max_concurrent_batches"],
+                "requests": self.stats["requests"],
+                "batches": batches,
+                "average_batch_size": self.stats["requests"] / batches if batches else 0.0,
+                "max_batch_size": self.stats["max_batch_size"],
+                "batch_sizes": {str(size): count for size, count in sorted(self.stats["batch_sizes"].items())},
+            }
+
+# One worker per admission slot, so the slots bound how many generations run at once, and summaries get no more
+# workers than their ADMISSION_MAX_ACTIVE_BATCH slots. Without batching every prompt is a batch of its own.
+generation_batcher = GenerationBatcher(
+    GENERATION_MAX_BATCH_SIZE if GENERATION_BATCHING else 1,
+    GENERATION_BATCH_WAIT_MS,
+    ADMISSION_MAX_ACTIVE,
+    ADMISSION_MAX_ACTIVE_BATCH,
+    BATCH_AGING_SECONDS,
+)
+# Fire-and-forget work such as Cloudinary uploads that responses don't wait for
+background_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="background")
+# Runs independent rag_pipeline branches of a single request concurrently, within the request's trace
+pipeline_executor = ContextThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+
+def generate_text(prompt, generation_params):
+    """Generate text for a single prompt on a batcher worker, batching with concurrent callers when enabled."""
+    return generation_batcher.generate(prompt, generation_params)
+
+admission = AdmissionController(ADMISSION_MAX_ACTIVE, ADMISSION_MAX_ACTIVE_BATCH, ADMISSION_MAX_PER_USER, ADMISSION_QUEUE_SIZES, BATCH_AGING_SECONDS)
+
+def client_key(user_id):
+    """Identify the client of the current request by user_id, or by address when it doesn't send one.
+
+    Returns None for a trusted proxy that sent no user_id, since its address stands for all of its users.
+    """
+    if user_id:
+        return f"user:{user_id}"
+    if request.remote_addr in ADMISSION_TRUSTED_PROXIES:
+        return None
+    return f"addr:{request.remote_addr}"
+
+def acquire_admission(priority, user=None, timeout=None):
+    """Wait for an admission slot as the current trace, recording the wait. Returns the release callable."""
+    start = time.perf_counter()
+    release = admission.acquire(priority, user, timeout)
+    record_stage("admission_wait", time.perf_counter() - start)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.priority = priority
+    return release
+
+def admit_request(priority, user_id=None):
+    """Admit the current request, holding its slot until the request, including any stream, has finished."""
+    g.release_admission = acquire_admission(priority, client_key(user_id), ADMISSION_QUEUE_TIMEOUTS[priority])
+
+def distances_to_similarities(distances):
+    """Cosine similarities from the distances Chroma returns, for normalized embeddings."""
+    distances = np.asarray(distances, dtype=np.float32)
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    # Squared L2 between unit vectors is 2 - 2cos; cosine and ip distances are 1 - cos
+    return 1.0 - distances / 2.0 if space == "l2" else 1.0 - distances
+
+def retrieve_context(query, top_k=15, doc_id=None, lexical=False):
+    """Retrieve the chunks of doc_id most relevant to query with a single embedding and Chroma query.
+
+    With lexical set, BM25 matches from the document's keyword index are fused in by reciprocal rank.
+    Returns chunk dicts in rank order with id, text, similarity (None for lexical-only matches) and
+    generation token count (None if not stored at ingest).
+    """
+    query_embedding = encode_query(query)
+    log_payload(lambda: f"Query: {query}")
+    log_payload(lambda: f"Query embedding (first 10 dims): {query_embedding[:10]}")
+
+    with span("chroma_query"):
+        results = collection.query(
+            query_embeddings=query_embedding[np.newaxis, :],
+            n_results=top_k,
+            where={"doc_id": doc_id},
+            include=["documents", "metadatas", "distances"]
+        )
+    documents = results['documents'][0] if results['documents'] else []
+    logger.info(f"ChromaDB query results for doc_id {doc_id}: {len(documents)} chunks")
+    if not documents:
+        return []
+
+    similarities = distances_to_similarities(results['distances'][0])
+    candidates = [
+        {
+            "id": chunk_id,
+            "text": document,
+            "similarity": float(similarity),
+            "tokens": (metadata or {}).get("t5_tokens"),
+        }
+        for chunk_id, document, similarity, metadata in zip(results['ids'][0], documents, similarities, results['metadatas'][0])
+    ]
+    return filter_retrieved(query, doc_id, candidates, top_k, lexical)
+
+def filter_retrieved(query, doc_id, candidates, top_k, lexical, known_chunks=None):
+    """Drop weak matches from vector-ranked candidates, keeping a few if too many are dropped, and fuse BM25 matches."""
+    retrieved = [chunk for chunk in candidates if chunk["similarity"] > 0.05]
+    log_payload(lambda: "\n".join(f"Chunk {i+1}: similarity = {chunk['similarity']:.3f}, content = {chunk['text'][:100]}..." for i, chunk in enumerate(retrieved)))
+    logger.info(f"Retrieved {len(retrieved)} relevant chunks after filtering (similarity > 0.05)")
     
-    return (
-        word_count >= 200 and
-        max_repetition <= 2 and
-        query_overlap <= 2  # Reject if summary contains too many query-like terms
+    # Too few chunks passed the filter, so fall back to the best unfiltered matches from the same query
+    if len(retrieved) < 3:
+        logger.info("Insufficient chunks, falling back to top unfiltered matches")
+        retrieved = candidates[:max(5, len(retrieved))]
+        logger.info(f"Total retrieved chunks after fallback: {len(retrieved)}")
+    if lexical:
+        retrieved = fuse_lexical_matches(query, doc_id, retrieved, top_k, known_chunks)
+    return retrieved
+
+def lexical_search(query, doc_id, top_k):
+    """BM25 matches for query in doc_id's keyword index as [(chunk_id, score)], or None without an index."""
+    artifacts = get_document_artifacts(doc_id)
+    if not artifacts or not artifacts.get("keyword_index"):
+        if PRECOMPUTE_ARTIFACTS:
+            schedule_document_artifacts(doc_id)
+        return None
+    with span("bm25"):
+        matches = bm25_search(artifacts["keyword_index"], tokenize_terms(query), top_k)
+    return [(artifacts["chunk_ids"][chunk], score) for chunk, score in matches]
+
+def fuse_lexical_matches(query, doc_id, retrieved, top_k, known_chunks=None):
+    """Merge BM25 matches into vector-ranked chunks with reciprocal rank fusion.
+
+    Lexical-only hits are looked up in known_chunks ({chunk_id: chunk}) when given, else fetched from Chroma.
+    """
+    matches = lexical_search(query, doc_id, top_k)
+    if not matches:
+        return retrieved
+    fused = reciprocal_rank_fusion([[chunk["id"] for chunk in retrieved], [chunk_id for chunk_id, _ in matches]], RRF_K)[:top_k]
+    by_id = {chunk["id"]: chunk for chunk in retrieved}
+    if known_chunks:
+        by_id.update({chunk_id: {**known_chunks[chunk_id], "similarity": None} for chunk_id, _ in fused if chunk_id not in by_id and chunk_id in known_chunks})
+    missing = [chunk_id for chunk_id, _ in fused if chunk_id not in by_id]
+    if missing:
+        # Only lexical-only hits need a fetch; their text and token counts come straight from Chroma by id
+        with span("chroma_query"):
+            fetched = collection.get(ids=missing, include=["documents", "metadatas"])
+        for chunk_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+            by_id[chunk_id] = {"id": chunk_id, "text": document, "similarity": None, "tokens": (metadata or {}).get("t5_tokens")}
+    bm25 = dict(matches)
+    logger.info(f"Hybrid retrieval: {len(matches)} BM25 matches, {len(missing)} not in vector results")
+    return [{**by_id[chunk_id], "bm25": bm25.get(chunk_id), "rrf": score} for chunk_id, score in fused if chunk_id in by_id]
+
+def count_generation_tokens(texts):
+    """Token counts under the FLAN-T5 tokenizer, excluding special tokens."""
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+def truncate_generation_tokens(text, tokens):
+    """text cut to its first tokens FLAN-T5 tokens."""
+    ids = tokenizer(text, add_special_tokens=False)["input_ids"][:tokens]
+    return tokenizer.decode(ids, skip_special_tokens=True)
+
+def pack_context(chunks, budget):
+    """Pack chunks into budget FLAN-T5 tokens with context_packing.pack_context, adding to context_packing_stats."""
+    context, stats = context_packing.pack_context(
+        chunks, budget, count_generation_tokens, truncate_generation_tokens, MIN_PARTIAL_CHUNK_TOKENS, generation_token_counts
     )
-
-def rag_pipeline(query, top_k=15, doc_id=None, use_model_knowledge=False, context_info=None, is_summary=False, summary_type=None):
-    try:
-        query_embedding = embedding_model.encode([query]).tolist()
-        logger.info(f"Query: {query}")
-        logger.info(f"Query embedding (first 10 dims): {query_embedding[0][:10]}")
-
-        retrieved_docs = []
-        if not use_model_knowledge and doc_id:
-            results = collection.query(
-                query_embeddings=query_embedding,
-                n_results=top_k,
-                where={"doc_id": doc_id}
+    with context_packing_lock:
+        context_packing_stats["requests"] += 1
+        for field in ("used_tokens", "dropped_tokens", "duplicate_chunks"):
+            context_packing_stats[field] += stats[field]
+    return context, stats
+
+def get_prompt_overhead(prompt_without_context):
+    """Tokens the prompt template and query take up, plus the end-of-sequence token."""
+    key = ("prompt", prompt_without_context)
+    overhead = generation_token_counts.get(key)
+    if overhead is None:
+        overhead = count_generation_tokens([prompt_without_context])[0] + 1
+        generation_token_counts.put(key, overhead)
+    return overhead
+
+class RetrievalContext:
+    """Per-request retrieval state, so retries and fallbacks reuse one embedding and Chroma query per query text."""
+
+    def __init__(self, doc_id, max_results=None):
+        self.doc_id = doc_id
+        self.results = OrderedDict()
+        self.max_results = max_results
+        self.lock = threading.Lock()
+
+    def search(self, query, top_k, lexical):
+        return retrieve_context(query, top_k=top_k, doc_id=self.doc_id, lexical=lexical)
+
+    def retrieve(self, query, top_k=15, lexical=False):
+        key = (query, top_k, lexical)
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                logger.info(f"Reusing {len(self.results[key])} retrieved chunks for query")
+                return list(self.results[key])
+        retrieved_docs = self.search(query, top_k, lexical)
+        with self.lock:
+            self.results[key] = retrieved_docs
+            if self.max_results and len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+        return list(retrieved_docs)
+
+class DocumentSession(RetrievalContext):
+    """A chat's retrieval state for one document, kept across /ask requests in session_cache.
+
+    Holds every chunk of the document with its embedding, so a follow-up question costs a query
+    embedding and one matrix product instead of a Chroma query, and remembers recent results.
+    """
+
+    def __init__(self, doc_id):
+        super().__init__(doc_id, max_results=SESSION_MAX_QUERIES)
+        with span("chroma_query"):
+            chunks = collection.get(where={"doc_id": doc_id}, include=["documents", "embeddings", "metadatas"])
+        self.ids = chunks["ids"]
+        self.chunks = {
+            chunk_id: {"id": chunk_id, "text": document, "tokens": (metadata or {}).get("t5_tokens")}
+            for chunk_id, document, metadata in zip(self.ids, chunks["documents"], chunks["metadatas"])
+        }
+        self.embeddings = np.asarray(chunks["embeddings"], dtype=np.float32).reshape(len(self.ids), -1)
+        self.embeddings /= np.maximum(np.linalg.norm(self.embeddings, axis=1, keepdims=True), 1e-12)
+        # Embeddings plus chunk text, with a rough allowance for the per-chunk dicts and remembered results
+        self.size = self.embeddings.nbytes + sum(len(chunk["text"]) for chunk in self.chunks.values()) + 512 * len(self.ids)
+        self.last_used = time.monotonic()
+
+    def search(self, query, top_k, lexical):
+        query_embedding = encode_query(query)
+        with span("session_search"):
+            similarities = self.embeddings @ query_embedding
+            top = np.argsort(-similarities)[:top_k]
+        candidates = [{**self.chunks[self.ids[i]], "similarity": float(similarities[i])} for i in top]
+        logger.info(f"Session retrieval for doc_id {self.doc_id}: {len(candidates)} chunks")
+        return filter_retrieved(query, self.doc_id, candidates, top_k, lexical, self.chunks)
+
+def get_document_session(user, doc_id):
+    """Return the chat session of user on doc_id, loading the document's chunks when there is none yet."""
+    key = (user, doc_id)
+    session = session_cache.get(key)
+    if session is not None and time.monotonic() - session.last_used <= SESSION_TTL_SECONDS:
+        session.last_used = time.monotonic()
+        return session
+    session = DocumentSession(doc_id)
+    if not session_cache.put(key, session, session.size):
+        logger.info(f"Session for doc_id {doc_id} needs {session.size} bytes, more than the session cache holds")
+    return session
+
+def is_summary_question(query):
+    return any(phrase in query.lower() for phrase in ["summary of this paper", "summarize the paper", "what is the paper about"])
+
+def build_prompt(query, context, use_model_knowledge=False, context_info=None, is_summary=False, summary_type=None):
+    if use_model_knowledge:
+        if is_summary:
+            prompt = (
+                f"Based on your knowledge of '{context_info}', generate a {summary_type} summary of at least 250 words. "
+                f"Focus on the document's key points, main findings, and high-level themes. "
+                f"Ensure the response is detailed, directly relevant to the document's content, "
+                f"and avoids repeating the query or using generic terms like 'general' or 'insufficient'. "
+                f"Do not include instructions or directives in the summary.\n"
+                f"Answer:"
+            )
+        elif is_summary_question(query):
+            prompt = (
+                f"Based on your knowledge of '{context_info}', provide a concise summary of the document in 150-200 words. "
+                f"Describe the paper's objectives, key findings, ethical concerns, and recommendations for responsible use. "
+                f"Ensure the response is directly relevant to the document's content, avoids vague terms like 'good' or 'bad', "
+                f"and does not repeat phrases unnecessarily.\nQuestion: {query}\nAnswer:"
             )
-            logger.info(f"ChromaDB query results for doc_id {doc_id}: {len(results['documents'][0]) if results['documents'] else 0} chunks")
-            if results['documents'] and results['embeddings']:
-                embeddings = results['embeddings'][0]
-                similarities = cosine_similarity([query_embedding[0]], embeddings)[0]
-                relevant_indices = [i for i, sim in enumerate(similarities) if sim > 0.05]
-                retrieved_docs = [results['documents'][0][i] for i in relevant_indices]
-                for i, idx in enumerate(relevant_indices):
-                    logger.info(f"Chunk {i+1}: similarity = {similarities[idx]:.3f}, content = {results['documents'][0][idx][:100]}...")
-                logger.info(f"Retrieved {len(retrieved_docs)} relevant chunks after filtering (similarity > 0.05)")
-            
-            # Secondary retrieval if insufficient chunks
-            if len(retrieved_docs) < 3:
-                logger.info("Insufficient chunks, attempting secondary retrieval with keyword filter")
-                keyword_results = collection.query(
-                    query_texts=query,
-                    n_results=5,
-                    where={"doc_id": doc_id}
-                )
-                if keyword_results['documents']:
-                    retrieved_docs.extend(keyword_results['documents'][0])
-                    for i, doc in enumerate(keyword_results['documents'][0]):
-                        logger.info(f"Secondary chunk {i+1}: content = {doc[:100]}...")
-                logger.info(f"Total retrieved chunks after secondary query: {len(retrieved_docs)}")
-        
-        if not retrieved_docs and not use_model_knowledge:
-            logger.warning(f"No documents retrieved for query: {query}")
-            context = ""
         else:
-            context = " ".join(retrieved_docs)
-            logger.info(f"Context (first 100 chars): {context[:100]}...")
-
-        if use_model_knowledge:
-            if is_summary:
-                prompt = (
-                    f"Based on your knowledge of '{context_info}', generate a {summary_type} summary of at least 250 words. "
-                    f"Focus on the document's key points, main findings, and high-level themes. "
-                    f"Ensure the response is detailed, directly relevant to the document's content, "
-                    f"and avoids repeating the query or using generic terms like 'general' or 'insufficient'. "
-                    f"Do not include instructions or directives in the summary.\n"
-                    f"Answer:"
-                )
-            else:
-                is_summary_question = any(phrase in query.lower() for phrase in ["summary of this paper", "summarize the paper", "what is the paper about"])
-                if is_summary_question:
-                    prompt = (
-                        f"Based on your knowledge of '{context_info}', provide a concise summary of the document in 150-200 words. "
-                        f"Describe the paper's objectives, key findings, ethical concerns, and recommendations for responsible use. "
-                        f"Ensure the response is directly relevant to the document's content, avoids vague terms like 'good' or 'bad', "
-                        f"and does not repeat phrases unnecessarily.\nQuestion: {query}\nAnswer:"
-                    )
-                else:
-                    prompt = (
-                        f"Based on your knowledge of '{context_info}', answer the question '{query}' in a clear, concise manner. "
-                        f"Provide a direct response with relevant details or examples. Use bullet points starting with '-' if listing items, "
-                        f"each max 50 words. Avoid generic terms like 'general' or 'insufficient'.\nQuestion: {query}\nAnswer:"
-                    )
+            prompt = (
+                f"Based on your knowledge of '{context_info}', answer the question '{query}' in a clear, concise manner. "
+                f"Provide a direct response with relevant details or examples. Use bullet points starting with '-' if listing items, "
+                f"each max 50 words. Avoid generic terms like 'general' or 'insufficient'.\nQuestion: {query}\nAnswer:"
+            )
+    else:
+        if is_summary:
+            prompt = (
+                f"Using the context below, generate a {summary_type} summary of the document in at least 250 words. "
+                f"Focus on the document's key points, main findings, and high-level themes. "
+                f"Ensure the response is detailed, directly derived from the context, "
+                f"and avoids repeating the query or using generic terms like 'general' or 'insufficient'. "
+                f"Do not include instructions or directives in the summary.\n"
+                f"Context: {context}\nAnswer:"
+            )
+        elif is_summary_question(query):
+            prompt = (
+                f"Using the context below, provide a concise summary of the document in 150-200 words. "
+                f"Describe the paper's objectives, key findings, ethical concerns, and recommendations for responsible use. "
+                f"Ensure the response is directly relevant to the document's content, avoids vague terms like 'good' or 'bad', "
+                f"and does not repeat phrases unnecessarily.\nContext: {context}\nQuestion: {query}\nAnswer:"
+            )
         else:
-            if is_summary:
-                prompt = (
-                    f"Using the context below, generate a {summary_type} summary of the document in at least 250 words. "
-                    f"Focus on the document's key points, main findings, and high-level themes. "
-                    f"Ensure the response is detailed, directly derived from the context, "
-                    f"and avoids repeating the query or using generic terms like 'general' or 'insufficient'. "
-                    f"Do not include instructions or directives in the summary.\n"
-                    f"Context: {context}\nAnswer:"
-                )
-            else:
-                is_summary_question = any(phrase in query.lower() for phrase in ["summary of this paper", "summarize the paper", "what is the paper about"])
-                if is_summary_question:
-                    prompt = (
-                        f"Using the context below, provide a concise summary of the document in 150-200 words. "
-                        f"Describe the paper's objectives, key findings, ethical concerns, and recommendations for responsible use. "
-                        f"Ensure the response is directly relevant to the document's content, avoids vague terms like 'good' or 'bad', "
-                        f"and does not repeat phrases unnecessarily.\nContext: {context}\nQuestion: {query}\nAnswer:"
-                    )
-                else:
-                    prompt = (
-                        f"Using the context below, answer the question '{query}' in a clear, concise manner. "
-                        f"Provide a direct response with relevant details or examples from the context. Use bullet points starting with '-' if listing items, "
-                        f"each max 50 words. If context is limited, provide a concise answer based on available information. "
-                        f"Avoid generic terms like 'general' or 'insufficient'.\nContext: {context}\nQuestion: {query}\nAnswer:"
-                    )
+            prompt = (
+                f"Using the context below, answer the question '{query}' in a clear, concise manner. "
+                f"Provide a direct response with relevant details or examples from the context. Use bullet points starting with '-' if listing items, "
+                f"each max 50 words. If context is limited, provide a concise answer based on available information. "
+                f"Avoid generic terms like 'general' or 'insufficient'.\nContext: {context}\nQuestion: {query}\nAnswer:"
+            )
+    return prompt
+
+def get_generation_params(query, is_summary=False, summary_type=None):
+    generation_params = {
+        "early_stopping": True
+    }
+    if is_summary:
+        generation_params.update(SUMMARY_GENERATION_PARAMS.get(summary_type, {}))
+    elif is_summary_question(query):
+        generation_params.update(SUMMARY_QUESTION_GENERATION_PARAMS)
+    else:
+        generation_params.update(ANSWER_GENERATION_PARAMS)
+    return generation_params
+
+def prepare_generation(query, top_k=15, doc_id=None, use_model_knowledge=False, context_info=None, is_summary=False, summary_type=None, retrieval=None, lexical=False):
+    """Retrieve context and build the prompt and generation settings for a query."""
+    retrieved_chunks = []
+    if not use_model_knowledge and doc_id:
+        if retrieval is None:
+            retrieval = RetrievalContext(doc_id)
+        retrieved_chunks = retrieval.retrieve(query, top_k=top_k, lexical=lexical)
+
+    if not retrieved_chunks and not use_model_knowledge:
+        logger.warning(f"No documents retrieved for query: {query}")
+        context = ""
+    else:
+        budget = CONTEXT_TOKEN_BUDGET - get_prompt_overhead(build_prompt(query, "", use_model_knowledge, context_info, is_summary, summary_type))
+        with span("pack_context"):
+            context, packing = pack_context(retrieved_chunks, budget)
+        logger.info(
+            f"Packed {packing['chunks']} chunks into {packing['used_tokens']}/{budget} context tokens, "
+            f"dropped {packing['dropped_tokens']} tokens and {packing['duplicate_chunks']} duplicate chunks"
+        )
+        log_payload(lambda: f"Context (first 100 chars): {context[:100]}...")
 
-        logger.info(f"Prompt (first 100 chars): {prompt[:100]}...")
+    prompt = build_prompt(query, context, use_model_knowledge, context_info, is_summary, summary_type)
+    log_payload(lambda: f"Prompt (first 100 chars): {prompt[:100]}...")
+    return prompt, get_generation_params(query, is_summary, summary_type)
 
-        device = next(model.parameters()).device
-        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024).to(device)
-        generation_params = {
-            "input_ids": inputs['input_ids'],
-            "attention_mask": inputs['attention_mask'],
-            "early_stopping": True
-        }
-        if is_summary:
-            if summary_type == "concise":
-                generation_params.update({
-                    "max_length": 500,
-                    "min_length": 250,
-                    "length_penalty": 0.8,
-                    "num_beams": 5,
-                    "temperature": 0.6,
-                    "do_sample": True,
-                    "no_repeat_ngram_size": 3
-                })
-            elif summary_type == "analytical":
-                generation_params.update({
-                    "max_length": 600,
-                    "min_length": 400,
-                    "length_penalty": 1.0,
-                    "num_beams": 5,
-                    "temperature": 0.6,
-                    "do_sample": True,
-                    "no_repeat_ngram_size": 3
-                })
-            elif summary_type == "comprehensive":
-                generation_params.update({
-                    "max_length": 700,
-                    "min_length": 500,
-                    "length_penalty": 1.2,
-                    "num_beams": 5,
-                    "temperature": 0.6,
-                    "do_sample": True,
-                    "no_repeat_ngram_size": 3
-                })
-        else:
-            is_summary_question = any(phrase in query.lower() for phrase in ["summary of this paper", "summarize the paper", "what is the paper about"])
-            if is_summary_question:
-                generation_params.update({
-                    "max_length": 300,
-                    "min_length": 150,
-                    "length_penalty": 0.8,
-                    "num_beams": 4,
-                    "temperature": 0.6,
-                    "do_sample": True,
-                    "no_repeat_ngram_size": 3
-                })
-            else:
-                generation_params.update({
-                    "max_length": 400,
-                    "min_length": 50,
-                    "length_penalty": 1.0,
-                    "num_beams": 3,
-                    "temperature": 0.9,
-                    "do_sample": True,
-                    "no_repeat_ngram_size": 3
-                })
-        outputs = model.generate(**generation_params)
-        answer = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        logger.info(f"Generated answer (first 100 chars): {answer[:100]}...")
+def rag_pipeline(query, top_k=15, doc_id=None, use_model_knowledge=False, context_info=None, is_summary=False, summary_type=None, retrieval=None, lexical=False):
+    try:
+        prompt, generation_params = prepare_generation(query, top_k, doc_id, use_model_knowledge, context_info, is_summary, summary_type, retrieval, lexical)
+        answer = generate_text(prompt, generation_params)
+        log_payload(lambda: f"Generated answer (first 100 chars): {answer[:100]}...")
         return answer if answer.strip() else "No relevant content available to generate a response."
     except Exception as e:
         logger.error(f"Error in RAG pipeline: {str(e)}")
         return f"Error generating response: {str(e)}"
 
+class StopOnEvent(StoppingCriteria):
+    """Ends generation once event is set, such as when the client of a stream has gone away."""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+def settle(futures):
+    """Cancel futures that haven't started and wait for the others, so no work outlives the request's admission slot."""
+    for future in futures:
+        if not future.cancel():
+            future.exception()
+
+def stream_text(prompt, generation_params):
+    """Yield decoded text pieces for a single prompt as the model produces them.
+
+    Generation runs on a batcher worker, so streams count against the same concurrency as batched prompts.
+    Closing the generator early, as Flask does when the client disconnects, stops generation at the next
+    token and waits for the worker to finish, so the request's admission slot is held until then.
+    """
+    device = model.device
+    with span("tokenize"):
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024).to(device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    # Streaming only works with a single hypothesis, so drop the beam search settings
+    params = {k: v for k, v in generation_params.items() if k not in ("num_beams", "length_penalty", "early_stopping")}
+    stop = threading.Event()
+
+    def generate():
+        try:
+            # Decoding happens incrementally inside the streamer, so it is part of this stage
+            with span("generate"):
+                model.generate(
+                    input_ids=inputs['input_ids'],
+                    attention_mask=inputs['attention_mask'],
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([StopOnEvent(stop)]),
+                    **params
+                )
+        except Exception:
+            # Unblock the consumer, which would otherwise wait for text that never comes
+            streamer.end()
+            raise
+
+    future = generation_batcher.submit(generate)
+    try:
+        for text in streamer:
+            if text:
+                yield text
+        future.result()
+    finally:
+        stop.set()
+        settle([future])
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 def clean_and_extend_answer(ans, question, source):
     ans = re.sub(r"[^\\w\\s.,;:!?()\\[\\]\"'-]", "", ans)
     ans = ans.strip()
@@ -364,9 +1212,551 @@ def clean_and_extend_answer(ans, question, source):
     sentences = [s for s in sentences if len(s.split()) > 2]
     return " ".join(sentences)
 
+summary_cache_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+summary_cache_lock = threading.Lock()
+mongo_indexes_ready = False
+
+document_stats_cache = LRUCache(1024)
+document_artifacts_cache = LRUCache(64)
+document_artifacts_pending = set()
+document_artifacts_lock = threading.Lock()
+
+def content_fingerprint(text):
+    """Return a stable hash of cleaned document text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def get_document_fingerprint(metadata, documents):
+    """Fingerprint stored at upload time, or one derived from the stored chunks for older documents."""
+    content_hash = metadata.get("content_hash") if metadata else None
+    if content_hash:
+        return content_hash
+    return content_fingerprint(" ".join(documents))
+
+def get_document_stats(doc_id):
+    """Return source, fingerprint, chunk count and total length for doc_id, or None if it doesn't exist.
+
+    Read from the document index; documents indexed before it existed are scanned once and memoized.
+    """
+    try:
+        with span("mongo_query"):
+            entry = document_index_collection.find_one({"doc_id": doc_id})
+        if entry:
+            return {
+                "source": entry.get("source"),
+                "content_hash": entry["_id"],
+                "chunk_count": entry["chunk_count"],
+                "total_length": entry["total_length"],
+            }
+    except Exception as e:
+        logger.warning(f"Document index lookup failed for doc_id {doc_id}: {e}")
+
+    stats = document_stats_cache.get(doc_id)
+    if stats:
+        return stats
+
+    all_chunks = collection.get(where={"doc_id": doc_id})
+    if not all_chunks.get("documents"):
+        return None
+    metadata = (all_chunks.get("metadatas") or [{}])[0] or {}
+    stats = {
+        "source": metadata.get("source"),
+        "content_hash": get_document_fingerprint(metadata, all_chunks["documents"]),
+        "chunk_count": len(all_chunks["documents"]),
+        "total_length": sum(len(doc) for doc in all_chunks["documents"]),
+    }
+    document_stats_cache.put(doc_id, stats)
+    return stats
+
+def summary_cache_key(content_hash, summary_type, mode="retrieval"):
+    settings = {
+        "model": MODEL_NAME,
+        "backend": INFERENCE_BACKEND,
+        "summary_type": summary_type,
+        "generation": SUMMARY_GENERATION_PARAMS.get(summary_type, {}),
+        "version": SUMMARY_PIPELINE_VERSION,
+    }
+    # Only map-reduce summaries carry the mode, so existing retrieval-mode keys stay valid
+    if mode != "retrieval":
+        settings["mode"] = mode
+    return hashlib.sha256(f"{content_hash}:{json.dumps(settings, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+def _record_summary_cache(event, count=1):
+    with summary_cache_lock:
+        summary_cache_stats[event] += count
+
+def ensure_mongo_indexes():
+    """Create the indexes used by the summary and answer caches and the document index on first use."""
+    global mongo_indexes_ready
+    if mongo_indexes_ready:
+        return
+    summary_cache_collection.create_index("createdAt", expireAfterSeconds=SUMMARY_CACHE_TTL_SECONDS)
+    summary_cache_collection.create_index("lastAccessed")
+    document_index_collection.create_index("doc_id")
+    document_index_collection.create_index("file_hash", sparse=True)
+    document_index_collection.create_index("file_hashes", sparse=True)
+    document_links_collection.create_index([("doc_id", 1), ("user_id", 1)])
+    summary_jobs_collection.create_index("createdAt", expireAfterSeconds=SUMMARY_JOB_TTL_SECONDS)
+    summary_jobs_collection.create_index("status")
+    chunk_summaries_collection.create_index("createdAt", expireAfterSeconds=SUMMARY_CACHE_TTL_SECONDS)
+    answer_cache_collection.create_index("createdAt", expireAfterSeconds=ANSWER_CACHE_TTL_SECONDS)
+    answer_cache_collection.create_index([("doc_id", 1), ("settings", 1), ("lastAccessed", 1)])
+    mongo_indexes_ready = True
+
+def get_cached_summary(cache_key):
+    """Return the cached summary response for cache_key, or None on a miss."""
+    try:
+        ensure_mongo_indexes()
+        now = datetime.utcnow()
+        with span("mongo_query"):
+            entry = summary_cache_collection.find_one_and_update(
+                {"_id": cache_key},
+                {"$set": {"lastAccessed": now}, "$inc": {"hits": 1}}
+            )
+        # TTL indexes are only swept periodically, so check expiry ourselves as well
+        if entry and (now - entry["createdAt"]).total_seconds() <= SUMMARY_CACHE_TTL_SECONDS:
+            _record_summary_cache("hits")
+            return {
+                "summary": entry["summary"],
+                "advantages": entry["advantages"],
+                "disadvantages": entry["disadvantages"],
+            }
+    except Exception as e:
+        logger.warning(f"Summary cache lookup failed: {e}")
+    _record_summary_cache("misses")
+    return None
+
+def store_cached_summary(cache_key, result):
+    try:
+        ensure_mongo_indexes()
+        now = datetime.utcnow()
+        with span("mongo_insert"):
+            summary_cache_collection.replace_one(
+                {"_id": cache_key},
+                {
+                    "summary": result["summary"],
+                    "advantages": result["advantages"],
+                    "disadvantages": result["disadvantages"],
+                    "createdAt": now,
+                    "lastAccessed": now,
+                    "hits": 0,
+                },
+                upsert=True
+            )
+        _record_summary_cache("stores")
+
+        # Evict least recently used entries once the cache grows past its limit
+        overflow = summary_cache_collection.estimated_document_count() - SUMMARY_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            stale_ids = [doc["_id"] for doc in summary_cache_collection.find({}, {"_id": 1}).sort("lastAccessed", 1).limit(overflow)]
+            if stale_ids:
+                evicted = summary_cache_collection.delete_many({"_id": {"$in": stale_ids}}).deleted_count
+                _record_summary_cache("evictions", evicted)
+                logger.info(f"Evicted {evicted} least recently used summaries from cache")
+    except Exception as e:
+        logger.warning(f"Failed to store summary in cache: {e}")
+
+answer_cache_stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+answer_cache_lock = threading.Lock()
+
+def _record_answer_cache(event, count=1):
+    with answer_cache_lock:
+        answer_cache_stats[event] += count
+
+def normalize_question(question):
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+def answer_cache_settings():
+    """Hash of everything besides the question and document that shapes an answer."""
+    settings = {
+        "model": MODEL_NAME,
+        "backend": INFERENCE_BACKEND,
+        "answer": ANSWER_GENERATION_PARAMS,
+        "summary_question": SUMMARY_QUESTION_GENERATION_PARAMS,
+        "hybrid_retrieval": HYBRID_RETRIEVAL,
+        "version": ANSWER_PIPELINE_VERSION,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+def answer_cache_key(doc_id, normalized, settings):
+    return hashlib.sha256(f"{doc_id}:{settings}:{normalized}".encode("utf-8")).hexdigest()
+
+def get_cached_answer(doc_id, question):
+    """Return (answer, provenance) for a cached answer to question about doc_id, or None on a miss.
+
+    An exact match on the normalized question wins; otherwise the cached question most similar to it
+    is used if its similarity reaches ANSWER_CACHE_SIMILARITY.
+    """
+    try:
+        ensure_mongo_indexes()
+        now = datetime.utcnow()
+        normalized = normalize_question(question)
+        settings = answer_cache_settings()
+        with span("answer_cache_lookup"):
+            entry = answer_cache_collection.find_one_and_update(
+                {"_id": answer_cache_key(doc_id, normalized, settings)},
+                {"$set": {"lastAccessed": now}, "$inc": {"hits": 1}}
+            )
+            match, similarity = "exact", 1.0
+            if not entry:
+                candidates = list(answer_cache_collection.find({"doc_id": doc_id, "settings": settings}, {"embedding": 1}))
+                if candidates:
+                    embeddings = np.stack([np.frombuffer(candidate["embedding"], dtype=np.float32) for candidate in candidates])
+                    similarities = embeddings @ encode_query(question)
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= ANSWER_CACHE_SIMILARITY:
+                        match, similarity = "semantic", float(similarities[best])
+                        entry = answer_cache_collection.find_one_and_update(
+                            {"_id": candidates[best]["_id"]},
+                            {"$set": {"lastAccessed": now}, "$inc": {"hits": 1}}
+                        )
+        # TTL indexes are only swept periodically, so check expiry ourselves as well
+        if entry and (now - entry["createdAt"]).total_seconds() <= ANSWER_CACHE_TTL_SECONDS:
+            _record_answer_cache(f"{match}_hits")
+            return entry["answer"], {
+                "match": match,
+                "similarity": round(similarity, 4),
+                "question": entry["question"],
+                "created_at": entry["createdAt"].isoformat(),
+                "hits": entry.get("hits", 0) + 1,
+            }
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed: {e}")
+    _record_answer_cache("misses")
+    return None
+
+def store_cached_answer(doc_id, question, answer):
+    try:
+        ensure_mongo_indexes()
+        now = datetime.utcnow()
+        normalized = normalize_question(question)
+        settings = answer_cache_settings()
+        with span("mongo_insert"):
+            answer_cache_collection.replace_one(
+                {"_id": answer_cache_key(doc_id, normalized, settings)},
+                {
+                    "doc_id": doc_id,
+                    "settings": settings,
+                    "question": question,
+                    "normalized": normalized,
+                    "embedding": np.asarray(encode_query(question), dtype=np.float32).tobytes(),
+                    "answer": answer,
+                    "createdAt": now,
+                    "lastAccessed": now,
+                    "hits": 0,
+                },
+                upsert=True
+            )
+        _record_answer_cache("stores")
+
+        # Keep each document's most recently used answers, which also bounds the semantic scan
+        overflow = answer_cache_collection.count_documents({"doc_id": doc_id, "settings": settings}) - ANSWER_CACHE_MAX_PER_DOC
+        if overflow > 0:
+            stale_ids = [doc["_id"] for doc in answer_cache_collection.find({"doc_id": doc_id, "settings": settings}, {"_id": 1}).sort("lastAccessed", 1).limit(overflow)]
+            if stale_ids:
+                _record_answer_cache("evictions", answer_cache_collection.delete_many({"_id": {"$in": stale_ids}}).deleted_count)
+    except Exception as e:
+        logger.warning(f"Failed to store answer in cache: {e}")
+
+def link_document(doc_id, user_id):
+    """Record that user_id (None for anonymous uploads) holds one reference to doc_id."""
+    try:
+        document_links_collection.insert_one({"doc_id": doc_id, "user_id": user_id, "createdAt": datetime.utcnow()})
+    except Exception as e:
+        # Without the link the reference can't be released, which keeps the document rather than losing it
+        logger.warning(f"Failed to link doc_id {doc_id} to user {user_id}: {e}")
+
+def acquire_indexed_document(query, file_hash=None):
+    """Link to an already indexed document matching query, bumping its reference count.
+
+    file_hash, if given, is recorded for the document, so the next upload of the same file skips extraction.
+    """
+    update = {"$inc": {"ref_count": 1}, "$set": {"lastLinked": datetime.utcnow()}}
+    if file_hash:
+        update["$addToSet"] = {"file_hashes": file_hash}
+    return document_index_collection.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+
+def find_file_copy(doc_id):
+    """(first chunk, cloudinary_url, upload status) of the file stored for an indexed document.
+
+    cloudinary_url is None while its background Cloudinary upload is still pending.
+    """
+    first_chunk = collection.get(ids=[f"{doc_id}_0"])
+    metadata = (first_chunk.get("metadatas") or [{}])[0] or {}
+    cloudinary_url = metadata.get("cloudinary_url")
+    upload = get_cloudinary_upload(metadata.get("cloudinary_upload_id"))
+    if upload and upload["status"] == "completed":
+        cloudinary_url = upload["cloudinary_url"]
+    return first_chunk, cloudinary_url, upload
+
+def ingest_chunks(chunks, metadata, doc_id):
+    """Embed chunks and write them to Chroma in batches as they arrive.
+
+    Chunking, embedding and Chroma writes run as separate stages connected by bounded queues,
+    so they overlap and at most a few batches are held in memory. Returns (chunk_count, total_length).
+    """
+    chunk_count = 0
+    total_length = 0
+    def embed(batch):
+        with span("embed"):
+            embeddings = embedding_model.encode(batch, normalize_embeddings=True)
+        with span("tokenize"):
+            return batch, embeddings, count_generation_tokens(batch)
+
+    batches = prefetch(batched(chunks, EMBED_BATCH_SIZE), INGEST_QUEUE_SIZE)
+    embedded = prefetch((embed(batch) for batch in batches), INGEST_QUEUE_SIZE)
+    for batch, embeddings, token_counts in embedded:
+        with span("chroma_add"):
+            collection.add(
+                ids=[f"{doc_id}_{chunk_count + i}" for i in range(len(batch))],
+                documents=batch,
+                embeddings=embeddings,
+                # Generation token counts let the context packer fill its budget without re-tokenizing chunks
+                metadatas=[{**metadata, "doc_id": doc_id, "t5_tokens": tokens} for tokens in token_counts]
+            )
+        chunk_count += len(batch)
+        total_length += sum(len(chunk) for chunk in batch)
+    logger.info(f"Ingested {chunk_count} chunks for doc_id {doc_id}")
+    return chunk_count, total_length
+
+def register_indexed_document(doc_id, content_hash, source, chunk_count, total_length, file_hash=None):
+    """Record a freshly ingested document in the dedup index.
+
+    If identical content was registered in the meantime, our copy is dropped in favour of it.
+    Returns (doc_id, deduplicated).
+    """
+    entry = {
+        "_id": content_hash,
+        "doc_id": doc_id,
+        "file_hash": file_hash,
+        "ref_count": 1,
+        "source": source,
+        "chunk_count": chunk_count,
+        "total_length": total_length,
+    }
+    for attempt in range(3):
+        try:
+            with span("mongo_insert"):
+                document_index_collection.insert_one({**entry, "createdAt": datetime.utcnow()})
+            return doc_id, False
+        except DuplicateKeyError:
+            existing = acquire_indexed_document({"_id": content_hash}, file_hash)
+            if existing:
+                collection.delete(where={"doc_id": doc_id})
+                logger.info(f"Identical content already indexed, linking to doc_id {existing['doc_id']}")
+                return existing["doc_id"], True
+            # The copy we collided with was released before we could link to it, so register ours instead
+            logger.info(f"Indexed copy of doc_id {doc_id}'s content was released, retrying registration")
+        except Exception as e:
+            logger.warning(f"Failed to register doc_id {doc_id} in document index: {e}")
+            return doc_id, False
+    logger.warning(f"Gave up registering doc_id {doc_id} in document index after {attempt + 1} attempts")
+    return doc_id, False
+
+def index_document(text, chunks, metadata):
+    """Embed and store chunks for cleaned text, reusing an existing copy of identical content.
+
+    Returns (doc_id, deduplicated).
+    """
+    content_hash = content_fingerprint(text)
+    try:
+        ensure_mongo_indexes()
+        existing = acquire_indexed_document({"_id": content_hash})
+        if existing:
+            logger.info(f"Duplicate content detected, linking to doc_id {existing['doc_id']} (refs: {existing['ref_count']})")
+            return existing["doc_id"], True
+    except Exception as e:
+        logger.warning(f"Document dedup lookup failed, indexing without dedup: {e}")
+
+    doc_id = str(uuid.uuid4())
+    try:
+        chunk_count, total_length = ingest_chunks(chunks, {**metadata, "content_hash": content_hash}, doc_id)
+    except Exception:
+        collection.delete(where={"doc_id": doc_id})
+        raise
+    return register_indexed_document(doc_id, content_hash, metadata.get("source"), chunk_count, total_length)
+
+def save_upload_to_tempfile(file, suffix):
+    """Stream an uploaded file to a temporary path, returning (path, sha256 of its bytes)."""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    file_hash = hashlib.sha256()
+    with os.fdopen(fd, "wb") as out:
+        while True:
+            block = file.stream.read(1024 * 1024)
+            if not block:
+                break
+            file_hash.update(block)
+            out.write(block)
+    return path, file_hash.hexdigest()
+
+def upload_to_cloudinary_in_background(path, upload_id, public_id):
+    """Upload a local file to Cloudinary, record the outcome under upload_id, then remove the file."""
+    try:
+        with span("cloudinary_upload"):
+            upload_result = cloudinary.uploader.upload(path, resource_type="raw", public_id=public_id, overwrite=True)
+        logger.info(f"File uploaded to Cloudinary: {upload_result.get('secure_url')}")
+        update_cloudinary_upload(upload_id, status="completed", url=upload_result.get("secure_url"))
+    except Exception as e:
+        logger.error(f"Background Cloudinary upload failed for {public_id}: {e}")
+        update_cloudinary_upload(upload_id, status="failed", error=str(e))
+    finally:
+        os.remove(path)
+
+def update_cloudinary_upload(upload_id, **fields):
+    fields["updatedAt"] = datetime.utcnow()
+    try:
+        cloudinary_uploads_collection.update_one({"_id": upload_id}, {"$set": fields})
+    except Exception as e:
+        logger.warning(f"Failed to update Cloudinary upload {upload_id}: {e}")
+
+def start_cloudinary_upload(path, upload_id, filename, doc_id):
+    """Record a pending upload and hand path to a background Cloudinary upload, which removes it when done.
+
+    Returns the upload's status as reported by /uploads/<upload_id>.
+    """
+    now = datetime.utcnow()
+    entry = {"_id": upload_id, "public_id": f"uploads/{upload_id}_{filename}", "doc_id": doc_id, "status": "pending", "createdAt": now, "updatedAt": now}
+    try:
+        cloudinary_uploads_collection.insert_one(entry)
+    except Exception as e:
+        logger.warning(f"Failed to record Cloudinary upload {upload_id}: {e}")
+    background_executor.submit(upload_to_cloudinary_in_background, path, upload_id, entry["public_id"])
+    return cloudinary_upload_status(entry)
+
+def get_cloudinary_upload(upload_id):
+    """Status of a background Cloudinary upload, or None if there is no record of it."""
+    if not upload_id:
+        return None
+    entry = cloudinary_uploads_collection.find_one({"_id": upload_id})
+    return cloudinary_upload_status(entry) if entry else None
+
+def cloudinary_upload_status(entry):
+    return {
+        "upload_id": entry["_id"],
+        "status": entry["status"],
+        "cloudinary_url": entry.get("url"),
+        "error": entry.get("error"),
+        "status_url": f"/uploads/{entry['_id']}",
+    }
+
+def release_document(doc_id, user_id):
+    """Drop one of user_id's references to doc_id, deleting its vectors once nothing links to it.
+
+    Returns the remaining reference count, or None if user_id holds no reference to doc_id.
+    """
+    ensure_mongo_indexes()
+    # Removing the link first means each reference can be released only once, by the user holding it
+    if document_links_collection.find_one_and_delete({"doc_id": doc_id, "user_id": user_id}) is None:
+        return None
+    entry = document_index_collection.find_one_and_update(
+        {"doc_id": doc_id},
+        {"$inc": {"ref_count": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if entry and entry["ref_count"] > 0:
+        logger.info(f"Released reference to doc_id {doc_id}, {entry['ref_count']} remaining")
+        return entry["ref_count"]
+
+    if entry:
+        # Only delete if no upload re-linked to the content in the meantime
+        deleted = document_index_collection.delete_one({"_id": entry["_id"], "ref_count": {"$lte": 0}}).deleted_count
+        if not deleted:
+            return 1
+    collection.delete(where={"doc_id": doc_id})
+    document_artifacts_collection.delete_one({"_id": doc_id})
+    answer_cache_collection.delete_many({"doc_id": doc_id})
+    document_stats_cache.pop(doc_id)
+    document_artifacts_cache.pop(doc_id)
+    session_cache.pop_where(lambda key: key[1] == doc_id)
+    logger.info(f"Deleted vectors for doc_id {doc_id}")
+    return 0
+
+def build_document_artifacts(doc_id):
+    """Compute and store a document's artifacts from the chunks and embeddings written at ingest."""
+    try:
+        start = time.perf_counter()
+        chunks = collection.get(where={"doc_id": doc_id}, include=["documents", "embeddings", "metadatas"])
+        if not chunks["ids"]:
+            return
+        position = lambda i: int(chunks["ids"][i].rsplit("_", 1)[-1]) if chunks["ids"][i].rsplit("_", 1)[-1].isdigit() else i
+        order = sorted(range(len(chunks["ids"])), key=position)
+        texts = [chunks["documents"][i] for i in order]
+        embeddings = np.asarray([chunks["embeddings"][i] for i in order], dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        chunk_tokens = [(chunks["metadatas"][i] or {}).get("t5_tokens") for i in order]
+        if None in chunk_tokens:
+            chunk_tokens = count_generation_tokens(texts)
+
+        scores = textrank(embeddings)
+        keyword_index = build_keyword_index(texts)
+        artifacts = {
+            "_id": doc_id,
+            "version": DOCUMENT_ARTIFACTS_VERSION,
+            "chunk_ids": [chunks["ids"][i] for i in order],
+            "chunk_tokens": chunk_tokens,
+            "total_tokens": sum(chunk_tokens),
+            "sections": detect_sections(texts),
+            "centrality": [round(float(score), 6) for score in scores],
+            "digest": extractive_digest(texts, embeddings, scores, lambda sentences: embedding_model.encode(sentences, normalize_embeddings=True), DIGEST_MAX_WORDS),
+            "keywords": keyword_index.pop("keywords"),
+            "keyword_index": keyword_index,
+            "createdAt": datetime.utcnow(),
+        }
+        try:
+            document_artifacts_collection.replace_one({"_id": doc_id}, artifacts, upsert=True)
+        except DocumentTooLarge:
+            logger.warning(f"Keyword index for doc_id {doc_id} exceeds the MongoDB document limit, storing artifacts without it")
+            artifacts["keyword_index"] = None
+            document_artifacts_collection.replace_one({"_id": doc_id}, artifacts, upsert=True)
+        document_artifacts_cache.put(doc_id, artifacts)
+        logger.info(f"Built artifacts for doc_id {doc_id} ({len(texts)} chunks) in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        logger.warning(f"Failed to build artifacts for doc_id {doc_id}: {e}")
+    finally:
+        with document_artifacts_lock:
+            document_artifacts_pending.discard(doc_id)
+
+def schedule_document_artifacts(doc_id):
+    """Queue artifact computation for doc_id unless it is done or already queued. Returns True if queued."""
+    with document_artifacts_lock:
+        if doc_id in document_artifacts_pending:
+            return True
+        if document_artifacts_cache.get(doc_id) is not None:
+            return False
+        document_artifacts_pending.add(doc_id)
+    try:
+        if document_artifacts_collection.count_documents({"_id": doc_id, "version": DOCUMENT_ARTIFACTS_VERSION}, limit=1):
+            with document_artifacts_lock:
+                document_artifacts_pending.discard(doc_id)
+            return False
+    except Exception as e:
+        logger.warning(f"Artifact lookup failed for doc_id {doc_id}: {e}")
+    background_executor.submit(build_document_artifacts, doc_id)
+    return True
+
+def get_document_artifacts(doc_id):
+    """Return a document's precomputed artifacts, or None if they haven't been built."""
+    artifacts = document_artifacts_cache.get(doc_id)
+    if artifacts is not None:
+        return artifacts
+    try:
+        artifacts = document_artifacts_collection.find_one({"_id": doc_id, "version": DOCUMENT_ARTIFACTS_VERSION})
+    except Exception as e:
+        logger.warning(f"Artifact lookup failed for doc_id {doc_id}: {e}")
+        return None
+    if artifacts:
+        document_artifacts_cache.put(doc_id, artifacts)
+    return artifacts
+
+def describe_document(doc_id, source, default_description):
+    """Describe a document for model-knowledge prompts by its keywords when they are available."""
+    artifacts = get_document_artifacts(doc_id)
+    if artifacts and artifacts.get("keywords"):
+        return f"{source} (a document about {', '.join(artifacts['keywords'][:6])})"
+    return f"{source} ({default_description})"
+
 @app.route('/')
 def home():
-    return jsonify({"status": "active", "model": "FLAN-T5", "endpoints": ["/upload", "/generate_signed_url", "/summarize", "/ask"]})
+    return jsonify({"status": "active", "model": "FLAN-T5", "endpoints": ["/upload", "/uploads/<upload_id>", "/generate_signed_url", "/summarize", "/summarize/jobs", "/jobs/<job_id>", "/ask", "/documents/<doc_id>", "/documents/<doc_id>/preview", "/cache/stats", "/generation/stats", "/metrics", "/healthz", "/readyz"]})
 
 @app.route("/generate_signed_url", methods=["GET"])
 def generate_signed_url():
@@ -388,6 +1778,8 @@ def upload_file():
         logger.warning("No file provided in upload request")
         return jsonify({"error": "No valid file uploaded"}), 400
 
+    local_path = None
+    user_id = request.form.get("user_id")
     try:
         filename = secure_filename(file.filename)
         ext = filename.rsplit('.', 1)[-1].lower()
@@ -395,59 +1787,95 @@ def upload_file():
             logger.error(f"Unsupported file type: {ext}")
             return jsonify({"error": "Only PDF and DOCX files are supported"}), 400
 
+        # Parse the bytes we already received instead of downloading them back from Cloudinary
+        with span("receive"):
+            local_path, file_hash = save_upload_to_tempfile(file, f".{ext}")
+
+        # Without a secure_url the file is uploaded to Cloudinary in the background, but only once it
+        # has been validated and isn't a duplicate. Until then the caller gets a status URL, not a file URL.
         cloudinary_url = request.form.get("secure_url")
-        if not cloudinary_url:
-            logger.info(f"No secure_url provided for {filename}, uploading to Cloudinary")
-            upload_result = cloudinary.uploader.upload(
-                file,
-                resource_type="raw",
-                public_id=f"uploads/{uuid.uuid4()}_{filename}",
-                overwrite=True
-            )
-            cloudinary_url = upload_result.get("secure_url")
+        upload = None
+        upload_id = None if cloudinary_url else str(uuid.uuid4())
+        logger.info(f"Processing file: {filename}, Cloudinary URL: {cloudinary_url or 'pending'}")
+
+        try:
+            ensure_mongo_indexes()
+            # file_hashes holds other files whose text turned out to be identical
+            existing = acquire_indexed_document({"$or": [{"file_hash": file_hash}, {"file_hashes": file_hash}]})
+        except Exception as e:
+            logger.warning(f"Document dedup lookup failed, indexing without dedup: {e}")
+            existing = None
+
+        if existing:
+            doc_id, deduplicated = existing["doc_id"], True
+            logger.info(f"Identical file already indexed, linking to doc_id {doc_id} (refs: {existing['ref_count']})")
+            first_chunk, stored_url, stored_upload = find_file_copy(doc_id)
+            sample = first_chunk["documents"][0][:250] if first_chunk.get("documents") else ""
             if not cloudinary_url:
-                logger.error("Failed to upload file to Cloudinary")
-                return jsonify({"error": "Failed to upload file to Cloudinary"}), 500
-            logger.info(f"File uploaded to Cloudinary: {cloudinary_url}")
-
-        logger.info(f"Processing file: {filename}, Cloudinary URL: {cloudinary_url}")
-
-        if ext == "pdf":
-            text = get_text_from_pdf_from_url(cloudinary_url)
-        elif ext == "docx":
-            text = get_text_from_docx_from_url(cloudinary_url)
+                # Reuse the stored copy of the identical file
+                cloudinary_url, upload = stored_url, stored_upload
         else:
-            text = ""
-
-        if not text or len(text.strip()) < 50:
-            logger.error(f"Text extraction failed or insufficient: {text[:100]}...")
-            return jsonify({"error": "Failed to extract sufficient text from file"}), 400
-
-        text = clean_text(text)
-        chunks = chunk_text(text, max_chunk_size=500)
-        if not chunks or all(not chunk.strip() for chunk in chunks):
-            logger.error("No valid chunks generated from text")
-            return jsonify({"error": "No valid content to process"}), 400
-
-        doc_embedding = embedding_model.encode(chunks).tolist()
-
-        doc_id = str(uuid.uuid4())
-        chunk_ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
-        collection.add(
-            ids=chunk_ids,
-            documents=chunks,
-            embeddings=doc_embedding,
-            metadatas=[{"source": filename, "cloudinary_url": cloudinary_url, "doc_id": doc_id} for _ in chunks]
-        )
-
-        logger.info(f"Uploaded document with doc_id: {doc_id}, chunks: {len(chunks)}")
+            if ext == "pdf":
+                pages = iter_pdf_pages(local_path, pages_per_task=PDF_PAGES_PER_TASK, min_parallel_pages=PDF_PARALLEL_MIN_PAGES)
+            else:
+                # Lazily, so the extraction is timed with the page iteration below
+                pages = map(extract_docx_text, [local_path])
+
+            content_hash = hashlib.sha256()
+            first_page = []
+
+            def cleaned_pages():
+                for page in pages:
+                    page = clean_text(page)
+                    if not page:
+                        continue
+                    # Hash as if the cleaned pages were joined with spaces, matching content_fingerprint(clean_text(text))
+                    content_hash.update(((" " if first_page else "") + page).encode("utf-8"))
+                    if not first_page:
+                        first_page.append(page)
+                    yield page
+
+            doc_id = str(uuid.uuid4())
+            metadata = {"source": filename, "cloudinary_url": cloudinary_url} if cloudinary_url else {"source": filename, "cloudinary_upload_id": upload_id}
+            try:
+                chunk_count, total_length = ingest_chunks(
+                    timed_iter("chunk", iter_chunks(timed_iter("extract", cleaned_pages()))),
+                    metadata,
+                    doc_id
+                )
+            except Exception:
+                collection.delete(where={"doc_id": doc_id})
+                raise
+
+            if total_length < 50:
+                logger.error(f"Text extraction failed or insufficient: {total_length} characters")
+                collection.delete(where={"doc_id": doc_id})
+                return jsonify({"error": "Failed to extract sufficient text from file"}), 400
+
+            sample = first_page[0][:250]
+            doc_id, deduplicated = register_indexed_document(doc_id, content_hash.hexdigest(), filename, chunk_count, total_length, file_hash=file_hash)
+            if deduplicated and not cloudinary_url:
+                # A different file with the same text is already stored, so reuse it instead of uploading this one
+                _, cloudinary_url, upload = find_file_copy(doc_id)
+
+        link_document(doc_id, user_id)
+        if not cloudinary_url and (upload is None or upload["status"] == "failed"):
+            upload = start_cloudinary_upload(local_path, upload_id, filename, doc_id)
+            # The background upload removes the file once it is done
+            local_path = None
+
+        logger.info(f"Uploaded document with doc_id: {doc_id}, deduplicated: {deduplicated}")
+        if PRECOMPUTE_ARTIFACTS:
+            schedule_document_artifacts(doc_id)
 
         return jsonify({
-            "message": "File uploaded to Cloudinary and ChromaDB",
-            "sample": text[:250],
+            "message": "File uploaded to Cloudinary and ChromaDB" if cloudinary_url else "File uploaded to ChromaDB, Cloudinary upload in progress",
+            "sample": sample,
             "source": filename,
             "cloudinary_url": cloudinary_url,
+            "cloudinary_upload": upload,
             "doc_id": doc_id,
+            "deduplicated": deduplicated,
             "file": {
                 "filePath": cloudinary_url,
                 "id": doc_id,
@@ -455,8 +1883,19 @@ def upload_file():
             }
         })
     except Exception as e:
-        logger.error(f"Upload error for {filename}: {str(e)}")
+        logger.error(f"Upload error for {file.filename}: {str(e)}")
         return jsonify({"error": f"An error occurred during upload: {str(e)}"}), 500
+    finally:
+        if local_path:
+            os.remove(local_path)
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def cloudinary_upload(upload_id):
+    """Progress of a background Cloudinary upload started by /upload; cloudinary_url is set once it completed."""
+    upload = get_cloudinary_upload(upload_id)
+    if not upload:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(upload)
 
 @app.route("/upload_text", methods=["POST"])
 def upload_text():
@@ -474,34 +1913,28 @@ def upload_text():
             return jsonify({"error": "Text content is too short"}), 400
 
         text = clean_text(text)
-        chunks = chunk_text(text, max_chunk_size=500)
+        with span("chunk"):
+            chunks = chunk_text(text)
         if not chunks or all(not chunk.strip() for chunk in chunks):
             logger.error("No valid chunks generated from text")
             return jsonify({"error": "No valid content to process"}), 400
 
-        doc_embedding = embedding_model.encode(chunks).tolist()
-
-        doc_id = str(uuid.uuid4())
-        chunk_ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
-        
-        collection.add(
-            ids=chunk_ids,
-            documents=chunks,
-            embeddings=doc_embedding,
-            metadatas=[{
-                "source": file_name,
-                "cloudinary_url": cloudinary_url,
-                "user_id": user_id,
-                "type": "text",
-                "doc_id": doc_id
-            } for _ in chunks]
-        )
+        doc_id, deduplicated = index_document(text, chunks, {
+            "source": file_name,
+            "cloudinary_url": cloudinary_url,
+            "user_id": user_id,
+            "type": "text"
+        })
 
-        logger.info(f"Uploaded text with doc_id: {doc_id}, chunks: {len(chunks)}")
+        link_document(doc_id, user_id)
+        logger.info(f"Uploaded text with doc_id: {doc_id}, chunks: {len(chunks)}, deduplicated: {deduplicated}")
+        if PRECOMPUTE_ARTIFACTS:
+            schedule_document_artifacts(doc_id)
 
         return jsonify({
             "message": "Text uploaded to ChromaDB",
             "doc_id": doc_id,
+            "deduplicated": deduplicated,
             "cloudinary_url": cloudinary_url,
             "file": {
                 "filePath": cloudinary_url,
@@ -513,84 +1946,300 @@ def upload_text():
         logger.error(f"Text upload error: {str(e)}")
         return jsonify({"error": "An error occurred during text upload"}), 500
 
-@app.route("/summarize", methods=["POST"])
-def summarize():
+@app.route("/documents/<doc_id>", methods=["DELETE"])
+def delete_document(doc_id):
+    user_id = request.args.get("user_id") or (request.get_json(silent=True) or {}).get("user_id")
     try:
-        doc_id = request.form.get("doc_id")
-        summary_type = request.form.get("summary_type")
-
-        if not doc_id or not summary_type:
-            try:
-                data = request.get_json()
-                doc_id = data.get("doc_id") if data else None
-                summary_type = data.get("summary_type") if data else None
-            except Exception:
-                logger.warning("Invalid JSON body in summarize request")
-
-        logger.info(f"Received /summarize request with: doc_id='{doc_id}', summary_type='{summary_type}'")
-
-        if not doc_id or not summary_type:
-            logger.warning("Missing required fields in summarize request")
-            return jsonify({"error": "Missing required fields: doc_id and summary_type are required"}), 400
-
-        chroma_result = collection.get(ids=[f"{doc_id}_0"])
-        if not chroma_result.get("documents"):
-            logger.error(f"Document with doc_id {doc_id} not found in ChromaDB")
+        remaining = release_document(doc_id, user_id)
+        if remaining is None:
+            return jsonify({"error": "No reference to this document for this user"}), 404
+        return jsonify({"doc_id": doc_id, "remaining_references": remaining, "deleted": remaining == 0})
+    except Exception as e:
+        logger.error(f"Delete error for doc_id {doc_id}: {str(e)}")
+        return jsonify({"error": "An error occurred while deleting the document"}), 500
+
+@app.route("/documents/<doc_id>/preview", methods=["GET"])
+def document_preview(doc_id):
+    """Instant extractive gist of a document while its abstractive summary is generated."""
+    artifacts = get_document_artifacts(doc_id)
+    if not artifacts:
+        if not get_document_stats(doc_id):
             return jsonify({"error": "Document not found"}), 404
+        schedule_document_artifacts(doc_id)
+        return jsonify({"doc_id": doc_id, "status": "pending"}), 202
+    return jsonify({
+        "doc_id": doc_id,
+        "status": "ready",
+        "digest": artifacts["digest"],
+        "sections": artifacts["sections"],
+        "keywords": artifacts["keywords"],
+        "chunk_count": len(artifacts["chunk_ids"]),
+        "total_tokens": artifacts["total_tokens"],
+    })
+
+ADVANTAGES_QUERY = (
+    f"List two key advantages of the document content in bullet points starting with '-', each max 20 words. "
+    f"Points must be specific to the document's content or purpose."
+)
+DISADVANTAGES_QUERY = (
+    f"List two key disadvantages of the document content in bullet points starting with '-', each max 20 words. "
+    f"Points must be specific to the document's limitations."
+)
 
-        all_chunks = collection.get(where={"doc_id": doc_id})
-        if not all_chunks.get("documents") or sum(len(doc) for doc in all_chunks["documents"]) < 50:
-            logger.error(f"Document with doc_id {doc_id} has insufficient content")
-            return jsonify({"error": "Document contains insufficient content for summarization"}), 400
-
-        logger.info(f"Retrieved {len(all_chunks['documents'])} chunks for doc_id {doc_id}, total length: {sum(len(doc) for doc in all_chunks['documents'])}")
-
-        metadata = all_chunks.get("metadatas", [{}])[0]
-        source = metadata.get("source", "unknown document")
-
-        if "concise" in summary_type.lower():
-            summary_query = (
-                f"Summarize the document's key points, main findings, and high-level themes in at least 250 words. "
-                f"Provide a clear, succinct overview of the core content, prioritizing brevity and clarity. "
-                f"Include essential details like primary topics or outcomes, but avoid deep analysis or extensive background."
+SUMMARY_QUERIES = {
+    "concise": (
+        f"Summarize the document's key points, main findings, and high-level themes in at least 250 words. "
+        f"Provide a clear, succinct overview of the core content, prioritizing brevity and clarity. "
+        f"Include essential details like primary topics or outcomes, but avoid deep analysis or extensive background."
+    ),
+    "analytical": (
+        f"Provide an analytical summary of the document in at least 250 words. "
+        f"Critically evaluate methods, findings, or arguments, highlighting insights, implications, and potential weaknesses. "
+        f"Include specific examples or evidence to support the analysis."
+    ),
+    "comprehensive": (
+        f"Provide a comprehensive summary of the document in at least 250 words. "
+        f"Cover all major aspects, including background, methods, results, and conclusions in detail. "
+        f"Ensure a thorough overview without focusing on critical analysis."
+    ),
+    "default": (
+        f"Summarize the document in at least 250 words, covering key themes, methods, or findings with sufficient detail. "
+        f"Focus on a balanced overview of the content, including main points and outcomes."
+    ),
+}
+
+def get_summary_query(summary_type):
+    """Map a requested summary_type onto its retrieval query and internal summary type."""
+    summary_type_internal = next((name for name in ("concise", "analytical", "comprehensive") if name in summary_type.lower()), "default")
+    return SUMMARY_QUERIES[summary_type_internal], summary_type_internal
+
+def precompute_query_embeddings():
+    """Embed the constant summary prompts in one batch so requests start with a warm cache."""
+    queries = list(SUMMARY_QUERIES.values()) + [ADVANTAGES_QUERY, DISADVANTAGES_QUERY]
+    embeddings = embedding_model.encode(queries, normalize_embeddings=True)
+    for query, embedding in zip(queries, embeddings):
+        embedding.setflags(write=False)
+        query_embedding_cache.put(query, embedding)
+    logger.info(f"Precomputed embeddings for {len(queries)} constant queries")
+
+# Generic points used when the model gives fewer than two usable ones; they say nothing about the document
+FALLBACK_POINTS = {
+    "advantages": ["- Highlights ethical issues in AI-driven publishing.", "- Offers practical guidelines for AI use."],
+    "disadvantages": ["- Limited depth in technical AI analysis.", "- May overlook broader societal impacts."],
+}
+
+def has_fallback_points(result):
+    return any(point in FALLBACK_POINTS[kind] for kind in FALLBACK_POINTS for point in result[kind])
+
+def parse_points(text, query_type, summary, source):
+    lines = text.split('\n')
+    points = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith('-') and len(line.split()) <= 20 and len(line.split()) > 3:
+            cleaned_line = re.sub(r'^[-*]\s*', '', line)
+            if not any(vague in cleaned_line.lower() for vague in ["general", "insufficient", "limited scope", "no specific"]):
+                points.append(f"- {cleaned_line}")
+    if len(points) < 2:
+        logger.info(f"Insufficient valid {query_type} points, generating contextual points")
+        context_info = summary[:100] if summary and "Error" not in summary else source
+        if query_type == "advantages":
+            contextual_query = (
+                f"List two specific advantages of a document about '{context_info}' in bullet points starting with '-', "
+                f"each max 20 words, focusing on its purpose or features."
             )
-            summary_type_internal = "concise"
-        elif "analytical" in summary_type.lower():
-            summary_query = (
-                f"Provide an analytical summary of the document in at least 250 words. "
-                f"Critically evaluate methods, findings, or arguments, highlighting insights, implications, and potential weaknesses. "
-                f"Include specific examples or evidence to support the analysis."
-            )
-            summary_type_internal = "analytical"
-        elif "comprehensive" in summary_type.lower():
-            summary_query = (
-                f"Provide a comprehensive summary of the document in at least 250 words. "
-                f"Cover all major aspects, including background, methods, results, and conclusions in detail. "
-                f"Ensure a thorough overview without focusing on critical analysis."
-            )
-            summary_type_internal = "comprehensive"
         else:
-            summary_query = (
-                f"Summarize the document in at least 250 words, covering key themes, methods, or findings with sufficient detail. "
-                f"Focus on a balanced overview of the content, including main points and outcomes."
+            contextual_query = (
+                f"List two specific disadvantages of a document about '{context_info}' in bullet points starting with '-', "
+                f"each max 20 words, focusing on its limitations."
             )
-            summary_type_internal = "default"
+        contextual_text = rag_pipeline(contextual_query, top_k=15, use_model_knowledge=True, context_info=context_info)
+        contextual_lines = contextual_text.split('\n')
+        for line in contextual_lines:
+            line = line.strip()
+            if line.startswith('-') and len(line.split()) <= 20 and len(line.split()) > 3:
+                cleaned_line = re.sub(r'^[-*]\s*', '', line)
+                if not any(vague in cleaned_line.lower() for vague in ["general", "insufficient", "limited scope", "no specific"]):
+                    points.append(f"- {cleaned_line}")
+                    if len(points) == 2:
+                        break
+    if len(points) < 2:
+        points.extend(FALLBACK_POINTS[query_type][:2 - len(points)])
+    return points[:2]
+
+# Map and intermediate reduce calls are greedy, so their output is a pure function of the input text
+# and can be stored per map window and reused by every summary type.
+MAP_GENERATION_PARAMS = {
+    "max_length": 128,
+    "min_length": 32,
+    "num_beams": 2,
+    "no_repeat_ngram_size": 3,
+    "early_stopping": True
+}
+MAP_PROMPT = (
+    "Summarize the following part of a document in a few sentences. "
+    "Keep its key points, findings and terminology.\nText: {text}\nSummary:"
+)
 
-        max_attempts = 3
-        attempt = 0
-        summary = None
+def chunk_summary_key(text):
+    settings = {
+        "model": MODEL_NAME,
+        "backend": INFERENCE_BACKEND,
+        "prompt": MAP_PROMPT,
+        "generation": MAP_GENERATION_PARAMS,
+        "version": SUMMARY_PIPELINE_VERSION,
+    }
+    return hashlib.sha256(f"{content_fingerprint(text)}:{json.dumps(settings, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+def get_document_chunks(doc_id):
+    """All chunks of a document in ingest order, with their generation token counts."""
+    result = collection.get(where={"doc_id": doc_id}, include=["documents", "metadatas"])
+    chunks = [
+        {"id": chunk_id, "text": text, "tokens": (metadata or {}).get("t5_tokens")}
+        for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+    ]
+    missing = [chunk for chunk in chunks if chunk["tokens"] is None]
+    for chunk, tokens in zip(missing, count_generation_tokens([chunk["text"] for chunk in missing])):
+        chunk["tokens"] = tokens
+    position = lambda chunk: int(chunk["id"].rsplit("_", 1)[-1]) if chunk["id"].rsplit("_", 1)[-1].isdigit() else 0
+    return sorted(chunks, key=position)
+
+def group_windows(texts, token_counts, max_tokens):
+    """Join consecutive texts into windows of at most max_tokens tokens. Returns [(text, tokens)]."""
+    windows = []
+    current, current_tokens = [], 0
+    for text, tokens in zip(texts, token_counts):
+        if current and current_tokens + tokens > max_tokens:
+            windows.append((" ".join(current), current_tokens))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        windows.append((" ".join(current), current_tokens))
+    return windows
+
+def select_windows_within_budget(windows, budget):
+    """Keep evenly spaced windows, in document order, whose tokens fit the budget."""
+    keep = len(windows)
+    while keep > 1:
+        step = len(windows) / keep
+        selected = [windows[int(i * step)] for i in range(keep)]
+        if sum(tokens for _, tokens in selected) <= budget:
+            return selected
+        keep -= 1
+    return windows[:1]
+
+def summarize_windows(texts):
+    """Summarize each text with MAP_GENERATION_PARAMS, reusing and storing per-window summaries in MongoDB.
+
+    Returns (summaries, cached_count, generated_input_tokens).
+    """
+    keys = [chunk_summary_key(text) for text in texts]
+    summaries = {}
+    try:
+        ensure_mongo_indexes()
+        for entry in chunk_summaries_collection.find({"_id": {"$in": list(set(keys))}}, {"summary": 1}):
+            summaries[entry["_id"]] = entry["summary"]
+    except Exception as e:
+        logger.warning(f"Chunk summary lookup failed: {e}")
+    cached_count = sum(1 for key in keys if key in summaries)
+
+    pending = list({key: text for key, text in zip(keys, texts) if key not in summaries}.items())
+    prompts = [MAP_PROMPT.format(text=text) for _, text in pending]
+    token_counts = count_generation_tokens(prompts) if prompts else []
+    # Batch prompts of similar length together so padding wastes little compute
+    order = sorted(range(len(pending)), key=lambda i: token_counts[i])
+    for start in range(0, len(order), SUMMARY_MAP_BATCH_SIZE):
+        batch = order[start:start + SUMMARY_MAP_BATCH_SIZE]
+        # Map prompts are generated once and their summaries are cached in MongoDB, so their encoder states aren't
+        # kept. They run on a batcher worker, so map batches count against the same concurrency as other generation.
+        outputs = generation_batcher.submit(lambda: generate_batch([prompts[i] for i in batch], MAP_GENERATION_PARAMS, reuse_encoder=False)).result()
+        for i, summary in zip(batch, outputs):
+            summaries[pending[i][0]] = summary.strip()
+
+    if pending:
+        try:
+            now = datetime.utcnow()
+            chunk_summaries_collection.bulk_write([
+                UpdateOne({"_id": key}, {"$setOnInsert": {"summary": summaries[key], "createdAt": now}}, upsert=True)
+                for key, _ in pending
+            ], ordered=False)
+        except Exception as e:
+            logger.warning(f"Failed to store chunk summaries: {e}")
+    return [summaries[key] for key in keys], cached_count, sum(token_counts)
+
+def prepare_map_reduce_summary(doc_id, summary_query, summary_type_internal, progress=None):
+    """Map-reduce a document into the prompt and generation settings for its final summary.
+
+    Map windows of consecutive chunks are summarized in batches, then the summaries are reduced
+    level by level until they fit the final prompt's context budget.
+    """
+    if progress is None:
+        progress = lambda percent, stage: None
+    chunks = get_document_chunks(doc_id)
+    windows = group_windows([c["text"] for c in chunks], [c["tokens"] for c in chunks], SUMMARY_MAP_INPUT_TOKENS)
+    selected = select_windows_within_budget(windows, SUMMARY_MAP_REDUCE_TOKEN_BUDGET)
+    if len(selected) < len(windows):
+        logger.info(f"Map-reduce budget of {SUMMARY_MAP_REDUCE_TOKEN_BUDGET} tokens covers {len(selected)}/{len(windows)} windows")
+
+    progress(15, f"summarizing {len(selected)} sections")
+    summaries, cached_count, input_tokens = summarize_windows([text for text, _ in selected])
+    logger.info(f"Map: {len(selected)} windows, {cached_count} from cache, {input_tokens} input tokens generated")
+
+    budget = CONTEXT_TOKEN_BUDGET - get_prompt_overhead(build_prompt(summary_query, "", is_summary=True, summary_type=summary_type_internal))
+    token_counts = count_generation_tokens(summaries)
+    for level in range(1, SUMMARY_REDUCE_MAX_LEVELS + 1):
+        if sum(token_counts) <= budget or len(summaries) == 1:
+            break
+        progress(15 + level * 10, f"reducing summaries (level {level})")
+        groups = group_windows(summaries, token_counts, SUMMARY_MAP_INPUT_TOKENS)
+        summaries, cached_count, input_tokens = summarize_windows([text for text, _ in groups])
+        token_counts = count_generation_tokens(summaries)
+        logger.info(f"Reduce level {level}: {len(groups)} groups, {cached_count} from cache, {input_tokens} input tokens generated")
+
+    # Pass the counts along: ids like summary_0 repeat across documents and levels, so they can't key a cache
+    context, packing = pack_context([{"id": f"summary_{i}", "text": text, "similarity": None, "tokens": tokens} for i, (text, tokens) in enumerate(zip(summaries, token_counts))], budget)
+    logger.info(f"Final reduce context: {packing['used_tokens']}/{budget} tokens from {packing['chunks']} summaries")
+    prompt = build_prompt(summary_query, context, is_summary=True, summary_type=summary_type_internal)
+    return prompt, get_generation_params(summary_query, is_summary=True, summary_type=summary_type_internal)
+
+def generate_summary(doc_id, summary_query, summary_type_internal, source, progress=None, mode="retrieval"):
+    """Run the full summary pipeline for a document.
+
+    Returns (result, cacheable): result holds summary, advantages and disadvantages, and cacheable is
+    set only if the summary passed the quality gate and no generic fallback text was filled in.
+    progress, if given, is called as progress(percent, stage) as the pipeline advances.
+    """
+    if progress is None:
+        progress = lambda percent, stage: None
+
+    retrieval = RetrievalContext(doc_id)
+    # Advantages and disadvantages don't depend on the summary, so generate them alongside it. They use
+    # other settings than the summary, so the batcher runs their batch on a separate worker at the same time.
+    advantages_future = pipeline_executor.submit(rag_pipeline, ADVANTAGES_QUERY, top_k=15, doc_id=doc_id, retrieval=retrieval)
+    disadvantages_future = pipeline_executor.submit(rag_pipeline, DISADVANTAGES_QUERY, top_k=15, doc_id=doc_id, retrieval=retrieval)
+
+    # If anything below fails, the branches are cancelled or waited for, so none outlives the admission slot
+    branches = [advantages_future, disadvantages_future]
+    try:
+        if mode == "map_reduce":
+            prompt, generation_params = prepare_map_reduce_summary(doc_id, summary_query, summary_type_internal, progress)
 
-        while attempt < max_attempts:
+        def attempt_summary(attempt):
+            progress(10 + attempt * 20 if mode == "retrieval" else 50 + attempt * 5, f"summary attempt {attempt + 1}")
+            if mode == "map_reduce":
+                return generate_text(prompt, generation_params)
             summary = rag_pipeline(
                 summary_query,
                 top_k=15,
                 doc_id=doc_id,
                 is_summary=True,
-                summary_type=summary_type_internal
+                summary_type=summary_type_internal,
+                retrieval=retrieval
             )
             if "Error" in summary or "Insufficient" in summary:
                 logger.warning(f"Attempt {attempt + 1}: Failed to generate summary: {summary}")
-                context_info = f"{source} (a document on ChatGPT and ethics in scholarly publishing)"
+                context_info = describe_document(doc_id, source, "a document on ChatGPT and ethics in scholarly publishing")
                 summary = rag_pipeline(
                     summary_query,
                     top_k=15,
@@ -599,20 +2248,28 @@ def summarize():
                     is_summary=True,
                     summary_type=summary_type_internal
                 )
-                logger.info(f"Model knowledge fallback summary: {summary[:100]}...")
-            
-            if is_summary_relevant(summary, doc_id):
-                logger.info(f"Summary is relevant after {attempt + 1} attempts: {summary[:100]}...")
-                break
-            logger.warning(f"Summary not relevant: {summary[:100]}... Attempt {attempt + 1}/{max_attempts}")
-            attempt += 1
-
-        if attempt == max_attempts:
-            logger.error(f"Failed to generate relevant summary after {max_attempts} attempts")
+                log_payload(lambda: f"Model knowledge fallback summary: {summary[:100]}...")
+            return summary
+
+        controller = GenerationController(
+            f"{summary_type_internal} summary",
+            summary_quality_checks,
+            get_generation_params(summary_query, is_summary=True, summary_type=summary_type_internal),
+            SUMMARY_MIN_WORDS,
+            count_generation_tokens,
+        )
+        summary, passed = controller.run(attempt_summary)
+        if passed:
+            logger.info(f"Summary is relevant after {len(controller.attempts)} attempts")
+            log_payload(lambda: f"Accepted summary: {summary[:100]}...")
+        else:
+            logger.error(f"Failed to generate relevant summary after {len(controller.attempts)} attempts, keeping the best one")
 
         word_count = len(summary.split())
+        canned = False
         logger.info(f"Initial {summary_type_internal} summary word count: {word_count}")
         if word_count < 250:
+            progress(70, "extending summary")
             logger.info(f"Summary too short ({word_count} words), attempting to extend")
             context_info = source
             extended_query = (
@@ -626,7 +2283,8 @@ def summarize():
                 top_k=15,
                 doc_id=doc_id,
                 is_summary=True,
-                summary_type=summary_type_internal
+                summary_type=summary_type_internal,
+                retrieval=retrieval
             )
             if "Error" not in additional_text and "Insufficient" not in additional_text and is_summary_relevant(additional_text, doc_id):
                 summary = f"{summary}\n\n{additional_text}"
@@ -634,7 +2292,13 @@ def summarize():
                 logger.info(f"Extended summary word count: {word_count}")
             if word_count < 250:
                 shortfall = 250 - word_count
-                if summary_type_internal == "concise":
+                artifacts = get_document_artifacts(doc_id)
+                # Without a digest the padding below is canned text that isn't about this document
+                canned = not (artifacts and artifacts.get("digest"))
+                if artifacts and artifacts.get("digest"):
+                    # The extractive digest is the document's own most central sentences
+                    fallback_text = artifacts["digest"]
+                elif summary_type_internal == "concise":
                     fallback_text = (
                         f"The document explores ChatGPT’s impact on academia, focusing on automation of scholarly tasks. "
                         f"It addresses ethical challenges, such as ensuring fairness and originality in research outputs. "
@@ -654,99 +2318,456 @@ def summarize():
                 word_count = len(summary.split())
                 logger.info(f"Final summary word count after fallback: {word_count}")
 
-        advantages_query = (
-            f"List two key advantages of the document content in bullet points starting with '-', each max 20 words. "
-            f"Points must be specific to the document's content or purpose."
-        )
-        disadvantages_query = (
-            f"List two key disadvantages of the document content in bullet points starting with '-', each max 20 words. "
-            f"Points must be specific to the document's limitations."
-        )
+        progress(80, "advantages and disadvantages")
+        advantages_text = advantages_future.result()
+        disadvantages_text = disadvantages_future.result()
 
-        advantages_text = rag_pipeline(advantages_query, top_k=15, doc_id=doc_id)
-        disadvantages_text = rag_pipeline(disadvantages_query, top_k=15, doc_id=doc_id)
-
-        logger.info(f"Raw advantages text: {advantages_text}")
-        logger.info(f"Raw disadvantages text: {disadvantages_text}")
-
-        def parse_points(text, query_type):
-            lines = text.split('\n')
-            points = []
-            for line in lines:
-                line = line.strip()
-                if line.startswith('-') and len(line.split()) <= 20 and len(line.split()) > 3:
-                    cleaned_line = re.sub(r'^[-*]\s*', '', line)
-                    if not any(vague in cleaned_line.lower() for vague in ["general", "insufficient", "limited scope", "no specific"]):
-                        points.append(f"- {cleaned_line}")
-            if len(points) < 2:
-                logger.info(f"Insufficient valid {query_type} points, generating contextual points")
-                context_info = summary[:100] if summary and "Error" not in summary else source
-                if query_type == "advantages":
-                    contextual_query = (
-                        f"List two specific advantages of a document about '{context_info}' in bullet points starting with '-', "
-                        f"each max 20 words, focusing on its purpose or features."
-                    )
-                else:
-                    contextual_query = (
-                        f"List two specific disadvantages of a document about '{context_info}' in bullet points starting with '-', "
-                        f"each max 20 words, focusing on its limitations."
-                    )
-                contextual_text = rag_pipeline(contextual_query, top_k=15, use_model_knowledge=True, context_info=context_info)
-                contextual_lines = contextual_text.split('\n')
-                for line in contextual_lines:
-                    line = line.strip()
-                    if line.startswith('-') and len(line.split()) <= 20 and len(line.split()) > 3:
-                        cleaned_line = re.sub(r'^[-*]\s*', '', line)
-                        if not any(vague in cleaned_line.lower() for vague in ["general", "insufficient", "limited scope", "no specific"]):
-                            points.append(f"- {cleaned_line}")
-                            if len(points) == 2:
-                                break
-            if len(points) < 2:
-                if query_type == "advantages":
-                    points.append("- Highlights ethical issues in AI-driven publishing.")
-                    if len(points) < 2:
-                        points.append("- Offers practical guidelines for AI use.")
-                else:
-                    points.append("- Limited depth in technical AI analysis.")
-                    if len(points) < 2:
-                        points.append("- May overlook broader societal impacts.")
-            return points[:2]
+        log_payload(lambda: f"Raw advantages text: {advantages_text}")
+        log_payload(lambda: f"Raw disadvantages text: {disadvantages_text}")
 
-        advantages = parse_points(advantages_text, "advantages")
-        disadvantages = parse_points(disadvantages_text, "disadvantages")
+        progress(90, "parsing points")
+        advantages_future = pipeline_executor.submit(parse_points, advantages_text, "advantages", summary, source)
+        branches.append(advantages_future)
+        disadvantages = parse_points(disadvantages_text, "disadvantages", summary, source)
+        advantages = advantages_future.result()
 
-        logger.info(f"Final advantages: {advantages}")
-        logger.info(f"Final disadvantages: {disadvantages}")
+        log_payload(lambda: f"Final advantages: {advantages}")
+        log_payload(lambda: f"Final disadvantages: {disadvantages}")
 
-        summary_data = {
-            "userId": request.form.get("user_id"),
-            "doc_id": doc_id,
-            "file_id": request.form.get("file_id"),
+        result = {
             "summary": summary,
             "advantages": advantages,
             "disadvantages": disadvantages,
-            "file_name": request.form.get("file_name"),
-            "fileUrl": request.form.get("file_path"),
-            "summary_type": summary_type,
         }
+        return result, passed and not canned and not has_fallback_points(result)
+    finally:
+        settle(branches)
+
+def get_summarize_params():
+    """Read /summarize fields from form data, falling back to a JSON body."""
+    params = {
+        "doc_id": request.form.get("doc_id"),
+        "summary_type": request.form.get("summary_type"),
+        "user_id": request.form.get("user_id"),
+        "file_id": request.form.get("file_id"),
+        "file_name": request.form.get("file_name"),
+        "file_path": request.form.get("file_path"),
+        "stream": request.form.get("stream"),
+        "mode": request.form.get("mode"),
+    }
+    if not params["doc_id"] or not params["summary_type"]:
+        try:
+            data = request.get_json(silent=True) or {}
+            for field in params:
+                params[field] = params[field] or data.get(field)
+        except Exception:
+            logger.warning("Invalid JSON body in summarize request")
+    params["stream"] = str(params["stream"]).lower() in ("1", "true", "yes")
+    params["mode"] = params["mode"] if params["mode"] in SUMMARY_MODES else SUMMARY_MODE
+    return params
+
+def load_summary_document(doc_id):
+    """Look up a document's stats for summarization.
+
+    Returns (stats, None, None), or (None, error_body, status_code) if it can't be summarized.
+    """
+    stats = get_document_stats(doc_id)
+    if not stats:
+        logger.error(f"Document with doc_id {doc_id} not found in ChromaDB")
+        return None, {"error": "Document not found"}, 404
+
+    if stats["total_length"] < 50:
+        logger.error(f"Document with doc_id {doc_id} has insufficient content")
+        return None, {"error": "Document contains insufficient content for summarization"}, 400
+
+    logger.info(f"Document {doc_id} has {stats['chunk_count']} chunks, total length: {stats['total_length']}")
+    return stats, None, None
+
+def save_summary(params, result):
+    """Store a generated summary for the requesting user and return its MongoDB id."""
+    summary_data = {
+        "userId": params.get("user_id"),
+        "doc_id": params.get("doc_id"),
+        "file_id": params.get("file_id"),
+        "summary": result["summary"],
+        "advantages": result["advantages"],
+        "disadvantages": result["disadvantages"],
+        "file_name": params.get("file_name"),
+        "fileUrl": params.get("file_path"),
+        "summary_type": params.get("summary_type"),
+    }
+    with span("mongo_insert"):
         mongo_result = db.Summary.insert_one(summary_data)
-        logger.info(f"Stored summary in MongoDB with ID: {str(mongo_result.inserted_id)}")
+    logger.info(f"Stored summary in MongoDB with ID: {str(mongo_result.inserted_id)}")
+    return str(mongo_result.inserted_id)
+
+def lookup_cached_summary(stats, summary_type, mode):
+    """Return (cache_key, cached result or None) for the summary of a loaded document."""
+    _, summary_type_internal = get_summary_query(summary_type)
+    cache_key = summary_cache_key(stats["content_hash"], summary_type_internal, mode)
+    result = get_cached_summary(cache_key)
+    if result is not None:
+        logger.info(f"Summary cache hit for content hash {stats['content_hash']} ({summary_type_internal}, {mode})")
+    return cache_key, result
+
+def run_summary_request(params, progress=None, admit=None):
+    """Summarize a document and store the result in MongoDB.
+
+    Returns (response_body, status_code) so it can back both the synchronous route and summary jobs.
+    admit, if given, is called on a summary cache miss before generating, so cache hits skip admission.
+    """
+    if progress is None:
+        progress = lambda percent, stage: None
+
+    doc_id = params.get("doc_id")
+    summary_type = params.get("summary_type")
+
+    if not doc_id or not summary_type:
+        logger.warning("Missing required fields in summarize request")
+        return {"error": "Missing required fields: doc_id and summary_type are required"}, 400
 
+    try:
+        progress(5, "loading document")
+        stats, error, status = load_summary_document(doc_id)
+        if error:
+            return error, status
+
+        source = stats["source"] or "unknown document"
+        summary_query, summary_type_internal = get_summary_query(summary_type)
+
+        mode = params.get("mode") or SUMMARY_MODE
+        cache_key, result = lookup_cached_summary(stats, summary_type, mode)
+        cached = result is not None
+        if not cached:
+            if admit is not None:
+                progress(8, "waiting for a generation slot")
+                admit()
+            result, cacheable = generate_summary(doc_id, summary_query, summary_type_internal, source, progress=progress, mode=mode)
+            if cacheable:
+                store_cached_summary(cache_key, result)
+            else:
+                logger.info(f"Not caching the summary for doc_id {doc_id}: it failed the quality gate or uses fallback text")
+
+        progress(95, "saving summary")
         response = {
-            "summary": summary,
-            "advantages": advantages,
-            "disadvantages": disadvantages,
-            "summary_id": str(mongo_result.inserted_id),
+            "summary": result["summary"],
+            "advantages": result["advantages"],
+            "disadvantages": result["disadvantages"],
+            "summary_id": save_summary(params, result),
+            "cached": cached,
         }
 
-        logger.info(f"Sending response: {response}")
-        return jsonify(response)
+        logger.info(f"Sending summary {response['summary_id']} for doc_id {doc_id}, cached: {cached}")
+        log_payload(lambda: f"Sending response: {response}")
+        return response, 200
+    except AdmissionRejected:
+        raise
     except WriteError as e:
         logger.error(f"MongoDB write error: {str(e)}")
-        return jsonify({"error": "Failed to save summary due to database error"}), 500
+        return {"error": "Failed to save summary due to database error"}, 500
     except Exception as e:
         logger.error(f"Summarize error: {str(e)}")
-        return jsonify({"error": "An error occurred during summarization"}), 500
+        return {"error": "An error occurred during summarization"}, 500
+
+def stream_summary(params, stats, cache_key, result):
+    """Yield SSE events for a summary: summary text as it is generated, then the full result.
+
+    cache_key and result come from lookup_cached_summary, and a cached result is sent as it is.
+    Streamed summaries get a single generation attempt, since tokens already sent can't be retracted.
+    """
+    doc_id = params["doc_id"]
+    # Branches running beside the stream; if the client goes away they are cancelled or waited for
+    branches = []
+    try:
+        source = stats["source"] or "unknown document"
+        summary_query, summary_type_internal = get_summary_query(params["summary_type"])
+        cached = result is not None
+        if cached:
+            yield sse_event("token", {"text": result["summary"]})
+        else:
+            artifacts = get_document_artifacts(doc_id)
+            if artifacts and artifacts.get("digest"):
+                yield sse_event("preview", {"digest": artifacts["digest"], "sections": artifacts["sections"], "keywords": artifacts["keywords"]})
+            retrieval = RetrievalContext(doc_id)
+            advantages_future = pipeline_executor.submit(rag_pipeline, ADVANTAGES_QUERY, top_k=15, doc_id=doc_id, retrieval=retrieval)
+            disadvantages_future = pipeline_executor.submit(rag_pipeline, DISADVANTAGES_QUERY, top_k=15, doc_id=doc_id, retrieval=retrieval)
+            branches.extend([advantages_future, disadvantages_future])
+
+            if params["mode"] == "map_reduce":
+                prompt, generation_params = prepare_map_reduce_summary(doc_id, summary_query, summary_type_internal)
+            else:
+                prompt, generation_params = prepare_generation(summary_query, top_k=15, doc_id=doc_id, is_summary=True, summary_type=summary_type_internal, retrieval=retrieval)
+            pieces = []
+            with closing(stream_text(prompt, generation_params)) as stream:
+                for text in stream:
+                    pieces.append(text)
+                    yield sse_event("token", {"text": text})
+            summary = "".join(pieces)
+
+            advantages_future = pipeline_executor.submit(parse_points, advantages_future.result(), "advantages", summary, source)
+            branches.append(advantages_future)
+            disadvantages = parse_points(disadvantages_future.result(), "disadvantages", summary, source)
+            result = {"summary": summary, "advantages": advantages_future.result(), "disadvantages": disadvantages}
+            if summary.strip() and is_summary_relevant(summary, doc_id) and not has_fallback_points(result):
+                store_cached_summary(cache_key, result)
+
+        yield sse_event("done", {**result, "summary_id": save_summary(params, result), "cached": cached})
+    except Exception as e:
+        logger.error(f"Streaming summarize error: {str(e)}")
+        yield sse_event("error", {"error": "An error occurred during summarization"})
+    finally:
+        settle(branches)
+
+@app.route("/summarize", methods=["POST"])
+def summarize():
+    params = get_summarize_params()
+    logger.info(f"Received /summarize request with: doc_id='{params['doc_id']}', summary_type='{params['summary_type']}'")
+    if not params["doc_id"] or not params["summary_type"]:
+        logger.warning("Missing required fields in summarize request")
+        return jsonify({"error": "Missing required fields: doc_id and summary_type are required"}), 400
+    # Cached summaries are served before admission, since they need no generation
+    admit = lambda: admit_request("batch", params["user_id"])
+    if params["stream"]:
+        try:
+            stats, error, status = load_summary_document(params["doc_id"])
+            if not error:
+                cache_key, result = lookup_cached_summary(stats, params["summary_type"], params["mode"])
+        except Exception as e:
+            logger.error(f"Summarize error: {str(e)}")
+            return jsonify({"error": "An error occurred during summarization"}), 500
+        if error:
+            return jsonify(error), status
+        if result is None:
+            admit()
+        return sse_response(stream_summary(params, stats, cache_key, result))
+    body, status = run_summary_request(params, admit=admit)
+    return jsonify(body), status
+
+summary_job_executor = ThreadPoolExecutor(max_workers=SUMMARY_JOB_WORKERS, thread_name_prefix="summary-job")
+summary_job_pending = 0
+summary_job_lock = threading.Lock()
+summary_job_maintenance_thread = None
+
+def update_summary_job(job_id, **fields):
+    fields["updatedAt"] = datetime.utcnow()
+    try:
+        summary_jobs_collection.update_one({"_id": job_id}, {"$set": fields})
+    except Exception as e:
+        logger.warning(f"Failed to update summary job {job_id}: {e}")
+
+def run_summary_job(job_id, params):
+    global summary_job_pending
+    trace, token = start_trace(job_id)
+    releases = []
+
+    def admit():
+        # Jobs already wait in their own queue, so they wait for a batch slot rather than time out
+        user = f"user:{params['user_id']}" if params.get("user_id") else None
+        releases.append(acquire_admission("batch", user))
+
+    try:
+        models_ready.wait()
+        logger.info(f"Starting summary job {job_id} for doc_id {params.get('doc_id')}")
+        update_summary_job(job_id, status="running", progress=0, stage="starting", startedAt=datetime.utcnow())
+        progress = lambda percent, stage: update_summary_job(job_id, progress=percent, stage=stage)
+        body, status = run_summary_request(params, progress=progress, admit=admit)
+        if status == 200:
+            update_summary_job(job_id, status="completed", progress=100, stage="done", result=body, finishedAt=datetime.utcnow())
+            logger.info(f"Summary job {job_id} completed")
+        else:
+            update_summary_job(job_id, status="failed", stage="failed", error=body.get("error"), statusCode=status, finishedAt=datetime.utcnow())
+            logger.error(f"Summary job {job_id} failed: {body.get('error')}")
+    except AdmissionRejected as e:
+        update_summary_job(job_id, status="failed", stage="failed", error=e.message, statusCode=e.status, finishedAt=datetime.utcnow())
+    except Exception as e:
+        logger.error(f"Summary job {job_id} crashed: {str(e)}")
+        update_summary_job(job_id, status="failed", stage="failed", error="An error occurred during summarization", statusCode=500, finishedAt=datetime.utcnow())
+    finally:
+        for release in releases:
+            release()
+        with summary_job_lock:
+            summary_job_pending -= 1
+        logger.info(f"Summary job {job_id} stages (ms): {trace.summary()}")
+        current_trace.reset(token)
+
+def submit_summary_job(job_id, params):
+    """Queue a job on the worker pool. Returns False when the queue is full."""
+    global summary_job_pending
+    with summary_job_lock:
+        if summary_job_pending >= SUMMARY_JOB_MAX_PENDING:
+            return False
+        summary_job_pending += 1
+    summary_job_executor.submit(run_summary_job, job_id, params)
+    return True
+
+def summary_job_owner():
+    """This process's name on the job leases it holds; computed on use, since the pid changes after a fork."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def renew_summary_job_leases():
+    summary_jobs_collection.update_many(
+        {"owner": summary_job_owner(), "status": {"$in": ["queued", "running"]}},
+        {"$set": {"heartbeat": datetime.utcnow()}}
+    )
+
+def claim_stale_summary_job():
+    """Atomically take over one queued or running job whose lease has lapsed. Returns it, or None."""
+    now = datetime.utcnow()
+    return summary_jobs_collection.find_one_and_update(
+        {
+            "status": {"$in": ["queued", "running"]},
+            # Jobs created before leases existed have no heartbeat
+            "$or": [{"heartbeat": {"$lt": now - timedelta(seconds=SUMMARY_JOB_LEASE_SECONDS)}}, {"heartbeat": {"$exists": False}}],
+        },
+        {"$set": {"owner": summary_job_owner(), "heartbeat": now, "status": "queued", "progress": 0, "stage": "requeued after its worker stopped", "updatedAt": now}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def resume_summary_jobs():
+    """Requeue jobs whose worker stopped renewing their lease, for as long as this process's queue has room."""
+    try:
+        ensure_mongo_indexes()
+        while summary_job_pending < SUMMARY_JOB_MAX_PENDING:
+            job = claim_stale_summary_job()
+            if job is None:
+                break
+            if submit_summary_job(job["_id"], job["params"]):
+                logger.info(f"Requeued summary job {job['_id']}")
+            else:
+                # Filled up since the check; drop the lease so another process can take the job
+                summary_jobs_collection.update_one({"_id": job["_id"], "owner": summary_job_owner()}, {"$unset": {"owner": "", "heartbeat": ""}})
+                break
+    except Exception as e:
+        logger.warning(f"Failed to resume summary jobs: {e}")
+
+def maintain_summary_jobs():
+    while True:
+        try:
+            renew_summary_job_leases()
+        except Exception as e:
+            logger.warning(f"Failed to renew summary job leases: {e}")
+        resume_summary_jobs()
+        time.sleep(SUMMARY_JOB_HEARTBEAT_SECONDS)
+
+def start_summary_job_maintenance():
+    """Renew this process's job leases and take over lapsed ones in the background. Call once per process."""
+    global summary_job_maintenance_thread
+    if summary_job_maintenance_thread is None:
+        summary_job_maintenance_thread = threading.Thread(target=maintain_summary_jobs, name="summary-job-leases", daemon=True)
+        summary_job_maintenance_thread.start()
+    return summary_job_maintenance_thread
+
+def summary_job_status(job):
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "progress": job.get("progress", 0),
+        "stage": job.get("stage"),
+        "error": job.get("error"),
+        "created_at": job["createdAt"].isoformat(),
+        "updated_at": job["updatedAt"].isoformat(),
+    }
+
+@app.route("/summarize/jobs", methods=["POST"])
+def create_summary_job():
+    params = get_summarize_params()
+    logger.info(f"Received summary job request with: doc_id='{params['doc_id']}', summary_type='{params['summary_type']}'")
+    if not params["doc_id"] or not params["summary_type"]:
+        return jsonify({"error": "Missing required fields: doc_id and summary_type are required"}), 400
+
+    try:
+        ensure_mongo_indexes()
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        summary_jobs_collection.insert_one({
+            "_id": job_id,
+            "status": "queued",
+            "progress": 0,
+            "stage": "queued",
+            "params": params,
+            "owner": summary_job_owner(),
+            "heartbeat": now,
+            "createdAt": now,
+            "updatedAt": now,
+        })
+        if not submit_summary_job(job_id, params):
+            update_summary_job(job_id, status="failed", stage="failed", error="Job queue is full", statusCode=503)
+            logger.warning(f"Rejected summary job {job_id}: queue is full")
+            response = jsonify({"error": "Too many summaries in progress, please retry shortly"})
+            response.headers["Retry-After"] = "30"
+            return response, 503
+        artifacts = get_document_artifacts(params["doc_id"])
+        preview = artifacts["digest"] if artifacts else None
+        return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}", "preview": preview}), 202
+    except Exception as e:
+        logger.error(f"Failed to create summary job: {str(e)}")
+        return jsonify({"error": "An error occurred while queueing the summary"}), 500
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_summary_job(job_id):
+    job = summary_jobs_collection.find_one({"_id": job_id}, {"result": 0})
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(summary_job_status(job))
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def get_summary_job_result(job_id):
+    job = summary_jobs_collection.find_one({"_id": job_id})
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == "completed":
+        return jsonify(job["result"])
+    if job["status"] == "failed":
+        return jsonify({"error": job.get("error")}), job.get("statusCode", 500)
+    return jsonify(summary_job_status(job)), 202
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    with summary_cache_lock:
+        summary_stats = dict(summary_cache_stats)
+    lookups = summary_stats["hits"] + summary_stats["misses"]
+    summary_stats["hit_rate"] = summary_stats["hits"] / lookups if lookups else 0.0
+    with answer_cache_lock:
+        answer_stats = dict(answer_cache_stats)
+    lookups = answer_stats["exact_hits"] + answer_stats["semantic_hits"] + answer_stats["misses"]
+    answer_stats["hit_rate"] = (answer_stats["exact_hits"] + answer_stats["semantic_hits"]) / lookups if lookups else 0.0
+    return jsonify({
+        "summary_cache": summary_stats,
+        "query_embeddings": query_embedding_cache.stats(),
+        "answer_cache": answer_stats,
+        "sessions": session_cache.stats(),
+        "encoder_states": encoder_cache.stats(),
+    })
+
+@app.route("/generation/stats", methods=["GET"])
+def generation_stats():
+    with context_packing_lock:
+        packing = dict(context_packing_stats)
+    with quality_gate_lock:
+        quality_gates = dict(quality_gate_stats, stop_reasons=dict(quality_gate_stats["stop_reasons"]))
+    return jsonify({"batching": GENERATION_BATCHING, **generation_batcher.snapshot(), "context_packing": packing, "quality_gates": quality_gates, "admission": admission.snapshot()})
+
+def stream_answer(question, doc_id, source, retrieval=None, cache=True):
+    """Yield SSE events for an answer as it is generated, then the cleaned final answer."""
+    try:
+        prompt, generation_params = prepare_generation(question, top_k=15, doc_id=doc_id, retrieval=retrieval, lexical=HYBRID_RETRIEVAL)
+        pieces = []
+        with closing(stream_text(prompt, generation_params)) as stream:
+            for text in stream:
+                pieces.append(text)
+                yield sse_event("token", {"text": text})
+        answer = "".join(pieces)
+        # Streamed answers get a single attempt, so only ones that would pass the quality gate are cached
+        relevant = bool(answer.strip()) and is_answer_relevant(answer, question)
+        if not answer.strip():
+            answer = "No relevant content available to generate a response."
+        answer = clean_and_extend_answer(answer, question, source)
+        if cache and relevant:
+            store_cached_answer(doc_id, question, answer)
+        yield sse_event("done", {"answer": answer, "source": source, "cached": False})
+    except Exception as e:
+        logger.error(f"Streaming ask error: {str(e)}")
+        yield sse_event("error", {"error": f"An error occurred while processing the question: {str(e)}"})
 
 @app.route("/ask", methods=["POST"])
 def ask():
@@ -758,58 +2779,269 @@ def ask():
         return jsonify({"error": "Both question and doc_id are required"}), 400
 
     try:
-        logger.info(f"Processing question: {question} for doc_id: {doc_id}")
+        logger.info(f"Processing question for doc_id: {doc_id}")
+        log_payload(lambda: f"Question: {question}")
 
-        all_chunks = collection.get(where={"doc_id": doc_id})
-        if not all_chunks.get("documents") or sum(len(doc) for doc in all_chunks["documents"]) < 50:
-            logger.error(f"Document with doc_id {doc_id} has insufficient content")
-            return jsonify({"error": "Document contains insufficient content to answer questions"}), 400
-        logger.info(f"Document has {len(all_chunks['documents'])} chunks, total length: {sum(len(doc) for doc in all_chunks['documents'])}")
-
-        chroma_result = collection.get(ids=[f"{doc_id}_0"])
-        if not chroma_result.get("documents"):
+        stats = get_document_stats(doc_id)
+        if not stats:
             logger.error(f"Document with doc_id {doc_id} not found in ChromaDB")
             return jsonify({"error": "Document not found"}), 404
-        metadata = chroma_result.get("metadatas", [{}])[0]
-        source = metadata.get("source", "Unknown")
+        if stats["total_length"] < 50:
+            logger.error(f"Document with doc_id {doc_id} has insufficient content")
+            return jsonify({"error": "Document contains insufficient content to answer questions"}), 400
+        logger.info(f"Document has {stats['chunk_count']} chunks, total length: {stats['total_length']}")
+        source = stats["source"] or "Unknown"
+
+        # Cached answers are served before admission, since they need no generation; "cache": false asks for a fresh one
+        use_cache = data.get("cache", True)
+        cached = get_cached_answer(doc_id, question) if use_cache else None
+        if cached:
+            answer, provenance = cached
+            logger.info(f"Answer cache {provenance['match']} hit for doc_id {doc_id}")
+            if data.get("stream"):
+                return sse_response(iter([sse_event("done", {"answer": answer, "source": source, "cached": True, "cache": provenance})]))
+            return jsonify({"answer": answer, "source": source, "cached": True, "cache": provenance})
+
+        admit_request("interactive", data.get("user_id"))
+        # Questions in a chat share a session unless the client opts out with "session": false
+        if data.get("session", True) and SESSION_CACHE_MAX_BYTES > 0:
+            retrieval = get_document_session(client_key(data.get("user_id")), doc_id)
+        else:
+            retrieval = RetrievalContext(doc_id)
 
-        max_attempts = 3
-        attempt = 0
-        answer = None
+        if data.get("stream"):
+            return sse_response(stream_answer(question, doc_id, source, retrieval, use_cache))
 
-        while attempt < max_attempts:
-            answer = rag_pipeline(question, top_k=15, doc_id=doc_id)
+        def attempt_answer(attempt):
+            answer = rag_pipeline(question, top_k=15, doc_id=doc_id, retrieval=retrieval, lexical=HYBRID_RETRIEVAL)
             if "Error" in answer or "No relevant content" in answer:
                 logger.warning(f"Attempt {attempt + 1}: Failed to generate answer: {answer}")
-                context_info = f"{source} (a paper on ChatGPT and ethics in scholarly publishing)"
+                context_info = describe_document(doc_id, source, "a paper on ChatGPT and ethics in scholarly publishing")
                 answer = rag_pipeline(
                     question,
                     top_k=15,
                     use_model_knowledge=True,
                     context_info=context_info
                 )
-                logger.info(f"Model knowledge fallback answer: {answer[:100]}...")
-            
-            if is_answer_relevant(answer, question):
-                logger.info(f"Answer is relevant after {attempt + 1} attempts: {answer[:100]}...")
-                break
-            logger.warning(f"Answer not relevant for question: {question}. Attempt {attempt + 1}/{max_attempts}")
-            attempt += 1
-
-        if attempt == max_attempts:
-            logger.error(f"Failed to generate relevant answer after {max_attempts} attempts")
-            is_summary_question = any(phrase in question.lower() for phrase in ["summary of this paper", "summarize the paper", "what is the paper about"])
+                log_payload(lambda: f"Model knowledge fallback answer: {answer[:100]}...")
+            return answer
+
+        min_relevant_words, min_words = answer_requirements(question)
+        controller = GenerationController(
+            "answer",
+            lambda answer: answer_quality_checks(answer, question),
+            get_generation_params(question),
+            min_words,
+            count_generation_tokens,
+            # No answer can share more content words with the question than the question has
+            unsatisfiable=["relevant_words"] if len(content_words(question)) < min_relevant_words else [],
+        )
+        answer, passed = controller.run(attempt_answer)
+        if passed:
+            logger.info(f"Answer is relevant after {len(controller.attempts)} attempts")
+        else:
+            logger.error(f"Failed to generate relevant answer after {len(controller.attempts)} attempts, keeping the best one")
 
         answer = clean_and_extend_answer(answer, question, source)
-        logger.info(f"Final answer: {answer}")
+        log_payload(lambda: f"Final answer: {answer}")
+        if passed and use_cache:
+            store_cached_answer(doc_id, question, answer)
 
         return jsonify({
             "answer": answer,
-            "source": source
+            "source": source,
+            "cached": False
         })
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error(f"Ask endpoint error: {str(e)}")
         return jsonify({"error": f"An error occurred while processing the question: {str(e)}"}), 500
 
+models_ready = threading.Event()
+startup_timings = {}
+startup_error = None
+model_loading_thread = None
+
+def open_chroma():
+    client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT) if CHROMA_HOST else PersistentClient(path=CHROMA_PATH)
+    return client, client.get_or_create_collection(name="research_papers")
+
+def _timed(component, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    startup_timings[component] = round(time.perf_counter() - start, 3)
+    logger.info(f"Startup: {component} ready in {startup_timings[component]}s")
+    return result
+
+def warm_up_models():
+    """Run one tiny encode and generate so the first real request doesn't pay for lazy allocation."""
+    embedding_model.encode(["warm up"])
+    generate_batch(["Summarize: warm up."], {"max_new_tokens": 4})
+    precompute_query_embeddings()
+
+def load_models():
+    """Load ChromaDB and both models in parallel, warm them up, then mark the app ready."""
+    global chroma_client, collection, embedding_model, tokenizer, model, startup_error, INFERENCE_BACKEND, EMBEDDING_BACKEND
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="startup") as pool:
+            chroma_future = pool.submit(_timed, "chroma", open_chroma)
+            embedding_future = pool.submit(_timed, "embedding_model", load_embedding_model, EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, MODEL_CACHE_DIR)
+            generation_future = pool.submit(_timed, "generation_model", load_generation_model, MODEL_NAME, INFERENCE_BACKEND, MODEL_CACHE_DIR)
+            chroma_client, collection = chroma_future.result()
+            # The loaders fall back to torch when onnx is unavailable; cache keys and logs use what actually loaded
+            embedding_model, EMBEDDING_BACKEND = embedding_future.result()
+            tokenizer, model, INFERENCE_BACKEND = generation_future.result()
+        _timed("warm_up", warm_up_models)
+        startup_timings["total"] = round(time.perf_counter() - start, 3)
+        logger.info(f"Loaded {MODEL_NAME} on the {INFERENCE_BACKEND} backend and {EMBEDDING_MODEL_NAME} on the {EMBEDDING_BACKEND} backend in {startup_timings['total']}s")
+        models_ready.set()
+    except Exception as e:
+        startup_error = str(e)
+        logger.error(f"Startup failed: {startup_error}")
+
+def start_model_loading():
+    global model_loading_thread
+    if model_loading_thread is None:
+        model_loading_thread = threading.Thread(target=load_models, name="model-loader", daemon=True)
+        model_loading_thread.start()
+    return model_loading_thread
+
+def init_worker(torch_threads=None):
+    """Per-process setup after a gunicorn fork: a fresh Chroma connection and a share of the CPU cores."""
+    global chroma_client, collection
+    # First, while this process still has a single thread, so the extraction processes fork safely
+    start_extraction_pool(PDF_EXTRACT_WORKERS)
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    # Chroma caches one client system per path; drop the master's so this process opens its own connections
+    chromadb.api.client.SharedSystemClient.clear_system_cache()
+    chroma_client, collection = open_chroma()
+    logger.info(f"Worker {os.getpid()} ready with {torch.get_num_threads()} torch threads")
+
+@app.before_request
+def start_request_trace():
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    g.trace, _ = start_trace(request_id[:64])
+
+@app.after_request
+def add_trace_headers(response):
+    trace = g.get("trace")
+    if trace is not None:
+        trace.status = response.status_code
+        response.headers["X-Request-ID"] = trace.request_id
+        # Streamed responses send their headers before generation, so only the stages done by then show up here
+        stages = trace.summary()
+        if stages:
+            response.headers["Server-Timing"] = ", ".join(f"{stage};dur={ms}" for stage, ms in stages.items())
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    """Record the request's latency and log its stage breakdown. Runs after a streamed response has finished."""
+    trace = g.get("trace")
+    if trace is None:
+        return
+    seconds = time.perf_counter() - trace.start
+    endpoint = request.endpoint or "unmatched"
+    request_seconds.observe(seconds, endpoint=endpoint, method=request.method)
+    requests_total.inc(endpoint=endpoint, method=request.method, status=trace.status)
+    stages = trace.summary()
+    if stages:
+        logger.info(f"Request {trace.request_id} {request.method} {endpoint} {trace.status} in {seconds * 1000:.1f}ms, stages (ms): {stages}")
+    current_trace.set(None)
+
+@app.teardown_request
+def release_admission(error=None):
+    release = g.pop("release_admission", None)
+    if release is not None:
+        release()
+
+@app.errorhandler(AdmissionRejected)
+def admission_rejected(error):
+    response = jsonify({"error": error.message})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, error.status
+
+@app.before_request
+def wait_for_models():
+    """Hold early requests briefly while models load, then turn them away with 503 and Retry-After."""
+    if models_ready.is_set() or request.endpoint in ("home", "healthz", "readyz", "export_metrics"):
+        return None
+    if startup_error is None and models_ready.wait(STARTUP_WAIT_SECONDS):
+        return None
+    response = jsonify({"error": "Service is starting up, please retry shortly" if startup_error is None else "Service failed to start"})
+    response.headers["Retry-After"] = str(STARTUP_RETRY_AFTER_SECONDS)
+    return response, 503
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is serving requests and model loading has not failed."""
+    if startup_error is not None:
+        return jsonify({"status": "failed", "error": startup_error, "startup_timings": startup_timings}), 500
+    return jsonify({"status": "ok", "loading": not models_ready.is_set(), "startup_timings": startup_timings})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: models are loaded and warmed up, and Chroma and MongoDB are reachable."""
+    checks = {"models": models_ready.is_set(), "chroma": False, "mongo": False}
+    if checks["models"]:
+        try:
+            chroma_client.heartbeat()
+            checks["chroma"] = True
+        except Exception as e:
+            logger.warning(f"Readiness check: Chroma unreachable: {e}")
+    try:
+        with pymongo.timeout(READINESS_TIMEOUT_SECONDS):
+            mongo_client.admin.command("ping")
+        checks["mongo"] = True
+    except Exception as e:
+        logger.warning(f"Readiness check: MongoDB unreachable: {e}")
+    ready = all(checks.values())
+    response = jsonify({"ready": ready, "checks": checks, "startup_timings": startup_timings})
+    if not ready:
+        response.headers["Retry-After"] = str(STARTUP_RETRY_AFTER_SECONDS)
+    return response, 200 if ready else 503
+
+@app.route("/metrics", methods=["GET"])
+def export_metrics():
+    """Stage and request latency histograms plus the service's counters, in the Prometheus text format."""
+    with summary_cache_lock:
+        summary_stats = dict(summary_cache_stats)
+    with quality_gate_lock:
+        quality_gates = dict(quality_gate_stats)
+    with answer_cache_lock:
+        answer_stats = dict(answer_cache_stats)
+    embeddings = query_embedding_cache.stats()
+    sessions = session_cache.stats()
+    encoder_states = encoder_cache.stats()
+    batcher = generation_batcher.snapshot()
+    admission_state = admission.snapshot()
+    lines = [
+        *metrics.render_samples("gistify_summary_cache_events_total", "Summary cache hits, misses, stores and evictions", "counter", summary_stats, "event"),
+        *metrics.render_samples("gistify_answer_cache_events_total", "Answer cache exact and semantic hits, misses, stores and evictions", "counter", answer_stats, "event"),
+        *metrics.render_samples("gistify_query_embedding_cache_lookups_total", "Query embedding cache lookups", "counter", {"hit": embeddings["hits"], "miss": embeddings["misses"]}, "result"),
+        *metrics.render_samples("gistify_query_embedding_cache_entries", "Query embeddings held in memory", "gauge", embeddings["size"]),
+        *metrics.render_samples("gistify_session_cache_bytes", "Memory held by chat sessions", "gauge", sessions["bytes"]),
+        *metrics.render_samples("gistify_session_cache_lookups_total", "Chat session lookups", "counter", {"hit": sessions["hits"], "miss": sessions["misses"]}, "result"),
+        *metrics.render_samples("gistify_encoder_cache_bytes", "Memory held by cached T5 encoder states", "gauge", encoder_states["bytes"]),
+        *metrics.render_samples("gistify_encoder_cache_lookups_total", "Encoder state cache lookups", "counter", {"hit": encoder_states["hits"], "miss": encoder_states["misses"]}, "result"),
+        *metrics.render_samples("gistify_generation_requests_total", "Prompts sent to the generation batcher", "counter", batcher["requests"]),
+        *metrics.render_samples("gistify_generation_batches_total", "model.generate batches run by the batcher", "counter", batcher["batches"]),
+        *metrics.render_samples("gistify_generation_queue_depth", "Prompts waiting for a generation batch", "gauge", batcher["queue_depth"]),
+        *metrics.render_samples("gistify_quality_gate_attempts_total", "Generation attempts checked by the quality gates", "counter", quality_gates["attempts"]),
+        *metrics.render_samples("gistify_quality_gate_rejected_attempts_total", "Generation attempts rejected by the quality gates", "counter", quality_gates["rejected_attempts"]),
+        *metrics.render_samples("gistify_quality_gate_rejected_seconds_total", "Generation time spent on rejected attempts", "counter", quality_gates["rejected_seconds"]),
+        *metrics.render_samples("gistify_admission_active", "Admitted requests holding a slot", "gauge", admission_state["active"], "priority"),
+        *metrics.render_samples("gistify_admission_queued", "Requests queued for admission", "gauge", admission_state["queued"], "priority"),
+        *metrics.render_samples("gistify_summary_jobs_pending", "Summary jobs queued or running", "gauge", summary_job_pending),
+        *metrics.render_samples("gistify_models_ready", "Whether models are loaded and warmed up", "gauge", int(models_ready.is_set())),
+    ]
+    return Response(metrics.render([stage_seconds, request_seconds, requests_total, admission_wait_seconds, admission_total], lines), mimetype="text/plain; version=0.0.4")
+
+start_model_loading()
+
 if __name__ == "__main__":
+    start_summary_job_maintenance()
     app.run(host="0.0.0.0", port=5001)
\ No newline at end of file
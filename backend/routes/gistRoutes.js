@@ -14,6 +14,41 @@ const path = require('path');
 const os = require('os');
 const fs = require('fs').promises;
 
+const FLASK_URL = 'http://127.0.0.1:5001';
+
+const summaryTypeMap = {
+  'concise': 'summary_concise',
+  'analytical': 'summary_analytical',
+  'comprehensive': 'summary_comprehensive'
+};
+
+const SUMMARY_POLL_INTERVAL_MS = 2000;
+const SUMMARY_JOB_TIMEOUT_MS = 15 * 60 * 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Submit a summary job to Flask and poll until it finishes, so no Flask worker is held for the whole run.
+const runSummaryJob = async (formData) => {
+  const jobResponse = await axios.post(`${FLASK_URL}/summarize/jobs`, formData, {
+    headers: {
+      ...formData.getHeaders(),
+    },
+  });
+  const jobId = jobResponse.data.job_id;
+  console.log('Queued summary job:', jobId);
+
+  const deadline = Date.now() + SUMMARY_JOB_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    await sleep(SUMMARY_POLL_INTERVAL_MS);
+    const resultResponse = await axios.get(`${FLASK_URL}/jobs/${jobId}/result`);
+    if (resultResponse.status === 200) {
+      return resultResponse;
+    }
+    console.log(`Summary job ${jobId}: ${resultResponse.data.stage} (${resultResponse.data.progress}%)`);
+  }
+  throw new Error(`Summary job ${jobId} timed out`);
+};
+
 router.post('/upload', authenticateToken, upload.single('file'), async (req, res) => {
   try {
     console.log('Request body:', JSON.stringify(req.body, null, 2));
@@ -21,11 +56,6 @@ router.post('/upload', authenticateToken, upload.single('file'), async (req, res
     const text = req.body.text;
     const selectedUploadOption = req.body.selectedUploadOption;
 
-    const summaryTypeMap = {
-      'concise': 'summary_concise',
-      'analytical': 'summary_analytical',
-      'comprehensive': 'summary_comprehensive'
-    };
     const summaryType = summaryTypeMap[req.body.summary_type?.toLowerCase()];
     console.log(summaryType)
     if (!summaryType) {
@@ -68,6 +98,7 @@ router.post('/upload', authenticateToken, upload.single('file'), async (req, res
         contentType: fileDoc.fileType === 'application/pdf' ? 'application/pdf' : 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
       });
       uploadFormData.append('secure_url', cloudinaryUrl)
+      uploadFormData.append('user_id', req.user.userId);
 
       console.log('Sending file to Flask /upload...');
       const uploadResponse = await axios.post('http://127.0.0.1:5001/upload', uploadFormData, {
@@ -165,11 +196,7 @@ router.post('/upload', authenticateToken, upload.single('file'), async (req, res
       file_id: fileId || ''
     });
 
-    const ragResponse = await axios.post('http://127.0.0.1:5001/summarize', summarizeFormData, {
-      headers: {
-        ...summarizeFormData.getHeaders(),
-      },
-    });
+    const ragResponse = await runSummaryJob(summarizeFormData);
     console.log('Flask /summarize Response:', JSON.stringify(ragResponse.data, null, 2));
 
     // if (!ragResponse.data.summaryId || !ragResponse.data.chromaId) {
@@ -229,6 +256,75 @@ router.post('/upload', authenticateToken, upload.single('file'), async (req, res
 });
 
 
+// Pipe a streamed Flask response to the client as Server-Sent Events, aborting the upstream request
+// (and with it the generation) if the client goes away
+async function pipeFlaskStream(req, res, path, body, failureMessage) {
+  const controller = new AbortController();
+  // The response, not the request: req emits 'close' as soon as its body has been read
+  res.on('close', () => controller.abort());
+  try {
+    const flaskResponse = await axios.post(`${FLASK_URL}${path}`, body, {
+      responseType: 'stream',
+      signal: controller.signal,
+    });
+
+    res.writeHead(200, {
+      'Content-Type': 'text/event-stream',
+      'Cache-Control': 'no-cache',
+      Connection: 'keep-alive',
+      'X-Accel-Buffering': 'no',
+    });
+    flaskResponse.data.pipe(res);
+  } catch (error) {
+    if (axios.isCancel(error)) {
+      return;
+    }
+    console.error(`Stream error for ${path}:`, error.message);
+    let message = failureMessage;
+    if (error.response?.data) {
+      // Error bodies arrive as a stream because of responseType: 'stream'
+      let errorBody = '';
+      for await (const chunk of error.response.data) {
+        errorBody += chunk;
+      }
+      try {
+        message = JSON.parse(errorBody).error || message;
+      } catch (parseError) {
+        console.error('Unparseable Flask error body:', errorBody);
+      }
+    }
+    res.status(error.response?.status || 500).json({ error: message });
+  }
+}
+
+// Stream an answer from Flask /ask as Server-Sent Events
+router.post('/ask/stream', authenticateToken, async (req, res) => {
+  const { question, doc_id } = req.body;
+  if (!question || !doc_id) {
+    return res.status(400).json({ error: 'Both question and doc_id are required' });
+  }
+  await pipeFlaskStream(req, res, '/ask', { question, doc_id, user_id: req.user.userId, stream: true }, 'Failed to get AI response');
+});
+
+// Stream a summary of an already uploaded document from Flask /summarize as Server-Sent Events
+router.post('/summarize/stream', authenticateToken, async (req, res) => {
+  const { doc_id, file_name, file_path, file_id, mode } = req.body;
+  const summaryType = summaryTypeMap[req.body.summary_type?.toLowerCase()];
+  if (!doc_id || !summaryType) {
+    return res.status(400).json({ error: 'doc_id and a valid summary_type are required' });
+  }
+  await pipeFlaskStream(req, res, '/summarize', {
+    doc_id,
+    summary_type: summaryType,
+    file_name,
+    file_path,
+    file_id,
+    mode,
+    user_id: req.user.userId,
+    stream: true,
+  }, 'Failed to generate summary');
+});
+
 router.get('/recent', authenticateToken, async (req, res) => {
   try {
     const gists = await Gist.find({ userId: req.user.userId })
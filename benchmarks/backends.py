@@ -0,0 +1,97 @@
+"""Check an inference backend against the fp32 PyTorch reference and compare their CPU latency.
+
+Greedy decodes of prompts built from the sample PDFs must match the reference closely enough, and
+MiniLM embeddings must stay within a cosine threshold of the reference vectors. The script exits
+non-zero when a threshold is missed, so it can gate switching INFERENCE_BACKEND in production.
+
+    python benchmarks/backends.py --backend torch-int8 --output backends.json
+"""
+import argparse, glob, json, os, re, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chunking import split_sentences
+from inference_backends import BACKENDS, load_generation_model, load_embedding_model, generation_parity, embedding_parity
+from pdf_extraction import iter_pdf_pages
+
+def build_prompts(pdf_glob, count):
+    prompts = []
+    for path in sorted(glob.glob(pdf_glob)):
+        text = re.sub(r"\s+", " ", " ".join(iter_pdf_pages(path))).strip()
+        context = " ".join(split_sentences(text)[:40])
+        prompts.append(f"Summarize the following text in a few sentences.\n\nText: {context}\n\nSummary:")
+        prompts.append(f"Based on the following context, what problem does the work address?\n\nContext: {context}\n\nAnswer:")
+        if len(prompts) >= count:
+            break
+    return prompts[:count] or ["Summarize: Retrieval augmented generation grounds answers in retrieved text."]
+
+def time_generation(model, tokenizer, prompts, max_new_tokens):
+    start = time.perf_counter()
+    for prompt in prompts:
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024)
+        model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, num_beams=1)
+    return (time.perf_counter() - start) / len(prompts)
+
+def time_embedding(model, texts):
+    start = time.perf_counter()
+    model.encode(texts, batch_size=64)
+    return (time.perf_counter() - start) / len(texts)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=BACKENDS, default="torch-int8")
+    parser.add_argument("--model", default="google/flan-t5-base")
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--cache-dir", default="./model_cache")
+    parser.add_argument("--pdf-glob", default="Uploads/*.pdf")
+    parser.add_argument("--prompts", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=48)
+    parser.add_argument("--min-top1-match", type=float, default=1.0, help="fraction of prompts whose first token must match")
+    parser.add_argument("--min-exact-match", type=float, default=0.75, help="fraction of prompts whose greedy decode must match")
+    parser.add_argument("--min-embedding-cosine", type=float, default=0.99)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    prompts = build_prompts(args.pdf_glob, args.prompts)
+    sentences = [s for p in prompts for s in split_sentences(p)][:256]
+
+    tokenizer, reference, _ = load_generation_model(args.model, "torch", args.cache_dir)
+    _, candidate, generation_backend = load_generation_model(args.model, args.backend, args.cache_dir)
+    reference_embedder, _ = load_embedding_model(args.embedding_model, "torch", args.cache_dir)
+    candidate_embedder, embedding_backend = load_embedding_model(args.embedding_model, args.backend, args.cache_dir)
+
+    generation = generation_parity(reference, candidate, tokenizer, prompts, args.max_new_tokens)
+    cosines = embedding_parity(reference_embedder, candidate_embedder, sentences)
+    summary = {
+        "backend": args.backend,
+        "generation_backend": generation_backend,
+        "embedding_backend": embedding_backend,
+        "prompts": len(prompts),
+        "top1_match_rate": sum(r["top1_match"] for r in generation) / len(generation),
+        "exact_match_rate": sum(r["exact_match"] for r in generation) / len(generation),
+        "max_logit_diff": max(r["max_logit_diff"] for r in generation),
+        "min_embedding_cosine": min(cosines),
+        "generation_seconds_per_prompt": {
+            "torch": round(time_generation(reference, tokenizer, prompts, args.max_new_tokens), 4),
+            args.backend: round(time_generation(candidate, tokenizer, prompts, args.max_new_tokens), 4),
+        },
+        "embedding_seconds_per_text": {
+            "torch": round(time_embedding(reference_embedder, sentences), 6),
+            args.backend: round(time_embedding(candidate_embedder, sentences), 6),
+        },
+    }
+    # A fallback to torch would compare torch with itself, so it never passes
+    summary["passed"] = (
+        generation_backend == embedding_backend == args.backend and
+        summary["top1_match_rate"] >= args.min_top1_match and
+        summary["exact_match_rate"] >= args.min_exact_match and
+        summary["min_embedding_cosine"] >= args.min_embedding_cosine
+    )
+    print(json.dumps(summary, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump({"summary": summary, "generation": generation}, out, indent=2)
+    sys.exit(0 if summary["passed"] else 1)
+
+if __name__ == "__main__":
+    main()
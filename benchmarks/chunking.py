@@ -0,0 +1,105 @@
+"""Compare the token-aware chunker with the old character chunker on the sample PDFs in Uploads/.
+
+Reports chunking throughput, chunk sizes, how much of each document actually fits inside the
+MiniLM embedding window, and a retrieval hit rate: for sentences sampled from the document, how
+often one of the top-k chunks by embedding similarity contains that sentence. The legacy chunker
+usually emits one chunk per document, so its hit rate is trivially perfect; embedded_token_fraction
+shows how little of that chunk the embedding actually sees.
+
+    python benchmarks/chunking.py --top-k 3 --output chunking.json
+"""
+import argparse, glob, json, os, re, sys, time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chunking import iter_token_chunks, split_sentences
+from pdf_extraction import iter_pdf_pages
+
+def clean_text(text):
+    text = re.sub(r"http\S+|www\S+|https\S+", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def legacy_chunk_text(text, max_chunk_size=500):
+    """The character chunker app.py used before; it splits on newlines that clean_text already removed."""
+    chunks = []
+    current_chunk = ""
+    for para in text.split('\n'):
+        para = para.strip()
+        if not para:
+            continue
+        if len(current_chunk) + len(para) + 1 <= max_chunk_size:
+            current_chunk += para + "\n"
+        else:
+            if current_chunk.strip():
+                chunks.append(current_chunk.strip())
+            current_chunk = para + "\n"
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    return chunks if chunks else [text[:max_chunk_size]]
+
+def sample_sentences(text, count):
+    sentences = [s for s in split_sentences(text) if 8 <= len(s.split()) <= 40]
+    step = max(1, len(sentences) // count)
+    return sentences[::step][:count]
+
+def evaluate(name, chunk_fn, text, model, queries, query_embeddings, top_k):
+    count_tokens = lambda texts: [len(ids) for ids in model.tokenizer(texts, add_special_tokens=False)["input_ids"]]
+    start = time.perf_counter()
+    chunks = chunk_fn(text, count_tokens)
+    elapsed = time.perf_counter() - start
+
+    token_counts = count_tokens(chunks)
+    window = model.max_seq_length - 2
+    chunk_embeddings = model.encode(chunks, normalize_embeddings=True, batch_size=64)
+    scores = query_embeddings @ chunk_embeddings.T
+    hits = 0
+    for query, row in zip(queries, scores):
+        top = np.argsort(-row)[:top_k]
+        hits += any(query in chunks[i] for i in top)
+
+    return {
+        "chunker": name,
+        "chunks": len(chunks),
+        "seconds": round(elapsed, 4),
+        "chars_per_second": round(len(text) / elapsed) if elapsed else None,
+        "mean_tokens": round(float(np.mean(token_counts)), 1),
+        "max_tokens": int(max(token_counts)),
+        "embedded_token_fraction": round(sum(min(t, window) for t in token_counts) / max(1, sum(token_counts)), 3),
+        "hit_rate_at_k": round(hits / len(queries), 3) if queries else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf-glob", default="Uploads/*.pdf")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--max-tokens", type=int, default=200)
+    parser.add_argument("--overlap-tokens", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    model = SentenceTransformer(args.model)
+    chunkers = {
+        "legacy_chars": lambda text, count_tokens: legacy_chunk_text(text),
+        "token_sentences": lambda text, count_tokens: list(iter_token_chunks([text], count_tokens, args.max_tokens, args.overlap_tokens)),
+    }
+
+    results = []
+    for path in sorted(glob.glob(args.pdf_glob)):
+        text = clean_text("\n".join(iter_pdf_pages(path)))
+        queries = sample_sentences(text, args.queries)
+        query_embeddings = model.encode(queries, normalize_embeddings=True) if queries else np.zeros((0, 1))
+        for name, chunk_fn in chunkers.items():
+            result = {"document": os.path.basename(path), "characters": len(text), **evaluate(name, chunk_fn, text, model, queries, query_embeddings, args.top_k)}
+            results.append(result)
+            print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Measure the per-query overhead of the retrieval layer before and after working from Chroma's distances.
+
+The legacy path asks Chroma for the stored embeddings of every result, passes the query as a Python
+list and recomputes cosine similarity with sklearn. The current path asks only for distances and
+converts them on numpy arrays. Both run against the same temporary PersistentClient collection of
+random unit vectors, so no models are needed.
+
+    python benchmarks/retrieval.py --chunks 5000 --queries 200 --output retrieval.json
+"""
+import argparse, json, shutil, tempfile, time
+
+import numpy as np
+import chromadb
+
+try:
+    from sklearn.metrics.pairwise import cosine_similarity
+except ImportError:
+    # sklearn is no longer a dependency of the app; this mirrors what it computed
+    def cosine_similarity(a, b):
+        a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+        a = a / np.linalg.norm(a, axis=1, keepdims=True)
+        b = b / np.linalg.norm(b, axis=1, keepdims=True)
+        return a @ b.T
+
+def unit_vectors(rng, count, dim):
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def legacy_query(collection, query, doc_id, top_k):
+    query_embedding = [query.tolist()]
+    results = collection.query(query_embeddings=query_embedding, n_results=top_k, where={"doc_id": doc_id}, include=["documents", "embeddings", "metadatas"])
+    return cosine_similarity([query_embedding[0]], results["embeddings"][0])[0]
+
+def distance_query(collection, query, doc_id, top_k):
+    results = collection.query(query_embeddings=query[np.newaxis, :], n_results=top_k, where={"doc_id": doc_id}, include=["documents", "metadatas", "distances"])
+    return 1.0 - np.asarray(results["distances"][0], dtype=np.float32) / 2.0
+
+def time_queries(fn, collection, queries, doc_ids, top_k):
+    latencies = []
+    for query, doc_id in zip(queries, doc_ids):
+        start = time.perf_counter()
+        fn(collection, query, doc_id, top_k)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.asarray(latencies) * 1000
+    return {"mean_ms": round(float(latencies.mean()), 3), "p50_ms": round(float(np.percentile(latencies, 50)), 3), "p95_ms": round(float(np.percentile(latencies, 95)), 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=15)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    path = tempfile.mkdtemp(prefix="retrieval-bench-")
+    try:
+        collection = chromadb.PersistentClient(path=path).get_or_create_collection(name="research_papers")
+        embeddings = unit_vectors(rng, args.chunks, args.dim)
+        for start in range(0, args.chunks, 1000):
+            stop = min(start + 1000, args.chunks)
+            collection.add(
+                ids=[f"chunk_{i}" for i in range(start, stop)],
+                documents=[f"chunk {i} " * 40 for i in range(start, stop)],
+                embeddings=embeddings[start:stop],
+                metadatas=[{"doc_id": f"doc_{i % args.documents}", "t5_tokens": 200} for i in range(start, stop)],
+            )
+        queries = unit_vectors(rng, args.queries, args.dim)
+        doc_ids = [f"doc_{i % args.documents}" for i in range(args.queries)]
+
+        # Both paths must rank and score the same chunks
+        for query, doc_id in zip(queries[:10], doc_ids[:10]):
+            assert np.allclose(legacy_query(collection, query, doc_id, args.top_k), distance_query(collection, query, doc_id, args.top_k), atol=1e-4)
+
+        time_queries(distance_query, collection, queries[:10], doc_ids[:10], args.top_k)  # warm up
+        results = {
+            "chunks": args.chunks,
+            "queries": args.queries,
+            "top_k": args.top_k,
+            "legacy_embeddings_sklearn": time_queries(legacy_query, collection, queries, doc_ids, args.top_k),
+            "distances_numpy": time_queries(distance_query, collection, queries, doc_ids, args.top_k),
+        }
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, "w") as out:
+                json.dump(results, out, indent=2)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""Benchmark and load-test the Flask RAG service offline with local stand-ins.
+
+Runs app.py in-process against a temporary Chroma PersistentClient, an in-memory MongoDB
+(mongomock), and stubs for Cloudinary uploads and requests.get. No network or external services
+are needed; the models are loaded from the local Hugging Face cache. Measures:
+
+  * ingest throughput of /upload on the PDFs in Uploads/ (pages/s, chunks/s)
+  * /ask and /summarize latency percentiles, summaries both cold and from the summary cache
+  * model.generate throughput in generated tokens/s at several batch sizes
+  * first and follow-up /ask latency in a chat, with and without a session
+  * /ask latency on answer cache misses, exact hits and rephrased (semantic) hits
+  * /ask throughput and latency as concurrency grows
+  * /ask latency while summaries run alongside it, which admission control should keep flat
+
+--tiny swaps in flan-t5-small and a 3-layer MiniLM and shortens generation lengths, so a full run
+takes minutes on a laptop CPU. Results are written as JSON; --baseline prints the change of every
+metric against an earlier results file.
+
+    pip install mongomock
+    python benchmarks/service.py --tiny --output service.json
+    python benchmarks/service.py --tiny --baseline service.json
+"""
+import argparse, glob, json, os, platform, shutil, sys, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TINY_MODELS = {"GENERATION_MODEL_NAME": "google/flan-t5-small", "EMBEDDING_MODEL_NAME": "sentence-transformers/paraphrase-MiniLM-L3-v2"}
+QUESTIONS = [
+    "What is the main objective of this work?",
+    "Which methods or materials were used?",
+    "What are the key findings and results?",
+    "What limitations does the document mention?",
+    "What is the paper about?",
+]
+
+class LocalResponse:
+    """Just enough of requests.Response for streaming a local file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.status_code = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    @property
+    def content(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def iter_content(self, chunk_size=1024 * 1024):
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+def install_stand_ins(workdir):
+    """Swap external services for local stand-ins. Must run before app is imported."""
+    import mongomock, pymongo, requests, cloudinary.uploader
+
+    pymongo.MongoClient = mongomock.MongoClient
+    uploads = []
+
+    def upload(path, public_id=None, **kwargs):
+        uploads.append(public_id)
+        return {"secure_url": f"https://bench.invalid/{public_id}", "public_id": public_id}
+    cloudinary.uploader.upload = upload
+
+    def get(url, *args, **kwargs):
+        # Any URL resolves to the sample file with the same name; nothing leaves the machine
+        path = os.path.join(ROOT, "Uploads", os.path.basename(url))
+        if not os.path.exists(path):
+            raise RuntimeError(f"Offline benchmark refused request to {url}")
+        return LocalResponse(path)
+    requests.get = get
+
+    os.environ["CHROMA_PATH"] = os.path.join(workdir, "chroma_db")
+    os.environ.pop("CHROMA_HOST", None)
+    return uploads
+
+def percentiles(latencies):
+    if not latencies:
+        return {}
+    values = np.asarray(latencies) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": round(float(values.mean()), 1),
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p95_ms": round(float(np.percentile(values, 95)), 1),
+        "p99_ms": round(float(np.percentile(values, 99)), 1),
+    }
+
+def shrink_generation_lengths(gistify, factor=4):
+    for params in [*gistify.SUMMARY_GENERATION_PARAMS.values(), gistify.SUMMARY_QUESTION_GENERATION_PARAMS, gistify.ANSWER_GENERATION_PARAMS]:
+        params["max_length"] = max(16, params["max_length"] // factor)
+        params["min_length"] = max(8, params["min_length"] // factor)
+        params["num_beams"] = min(2, params.get("num_beams", 1))
+
+def bench_ingest(gistify, client, pdfs):
+    from PyPDF2 import PdfReader
+    documents = []
+    for path in pdfs:
+        pages = len(PdfReader(path).pages)
+        with open(path, "rb") as f:
+            start = time.perf_counter()
+            response = client.post("/upload", data={"file": (f, os.path.basename(path))}, content_type="multipart/form-data")
+            seconds = time.perf_counter() - start
+        body = response.get_json()
+        if response.status_code != 200:
+            print(f"Upload of {path} failed: {body}", file=sys.stderr)
+            continue
+        stats = gistify.get_document_stats(body["doc_id"])
+
+        # Artifacts are built in the background after the upload returns
+        start = time.perf_counter()
+        while gistify.get_document_artifacts(body["doc_id"]) is None and time.perf_counter() - start < 300:
+            time.sleep(0.05)
+        artifact_seconds = time.perf_counter() - start
+
+        documents.append({
+            "document": os.path.basename(path),
+            "doc_id": body["doc_id"],
+            "pages": pages,
+            "chunks": stats["chunk_count"],
+            "seconds": round(seconds, 3),
+            "pages_per_second": round(pages / seconds, 2),
+            "chunks_per_second": round(stats["chunk_count"] / seconds, 2),
+            "artifact_seconds": round(artifact_seconds, 3),
+        })
+        print(json.dumps(documents[-1]))
+    return documents
+
+def timed_post(client, path, payload, as_json=True):
+    start = time.perf_counter()
+    response = client.post(path, json=payload) if as_json else client.post(path, data=payload)
+    return time.perf_counter() - start, response.status_code
+
+def bench_ask(client, doc_ids, repeats):
+    latencies, statuses = [], {}
+    for _ in range(repeats):
+        for doc_id in doc_ids:
+            for question in QUESTIONS:
+                seconds, status = timed_post(client, "/ask", {"question": question, "doc_id": doc_id, "cache": False})
+                latencies.append(seconds)
+                statuses[status] = statuses.get(status, 0) + 1
+    return {**percentiles(latencies), "statuses": statuses}
+
+def bench_chat(client, doc_ids):
+    """Latency of the first question of a chat about a document against its follow-ups, with and without a session."""
+    results = {}
+    for session in (False, True):
+        first, follow_ups = [], []
+        for doc_id in doc_ids:
+            user_id = f"bench-chat-{'session' if session else 'cold'}"
+            for i, question in enumerate(QUESTIONS):
+                seconds, _ = timed_post(client, "/ask", {"question": question, "doc_id": doc_id, "user_id": user_id, "session": session, "cache": False})
+                (follow_ups if i else first).append(seconds)
+        results["session" if session else "no_session"] = {"first": percentiles(first), "follow_up": percentiles(follow_ups)}
+    print(json.dumps({"chat": results}))
+    return results
+
+def bench_answer_cache(client, doc_ids):
+    """/ask latency when answers are generated and stored, then asked again verbatim and rephrased.
+
+    The other /ask stages send "cache": false, so they measure generation.
+    """
+    latencies = {"miss": [], "exact": [], "rephrased": []}
+    matches = {}
+    for doc_id in doc_ids:
+        for stage, questions in (("miss", QUESTIONS), ("exact", QUESTIONS), ("rephrased", [f"Please tell me: {q.lower()}" for q in QUESTIONS])):
+            for question in questions:
+                start = time.perf_counter()
+                response = client.post("/ask", json={"question": question, "doc_id": doc_id})
+                latencies[stage].append(time.perf_counter() - start)
+                body = response.get_json() or {}
+                match = body["cache"]["match"] if body.get("cached") else "miss"
+                matches[f"{stage}.{match}"] = matches.get(f"{stage}.{match}", 0) + 1
+    result = {stage: percentiles(values) for stage, values in latencies.items()}
+    result["matches"] = matches
+    print(json.dumps({"answer_cache": result}))
+    return result
+
+def bench_summarize(client, doc_ids, summary_types, modes):
+    results = {}
+    for mode in modes:
+        cold, warm = [], []
+        for doc_id in doc_ids:
+            for summary_type in summary_types:
+                payload = {"doc_id": doc_id, "summary_type": summary_type, "mode": mode}
+                seconds, _ = timed_post(client, "/summarize", payload, as_json=False)
+                cold.append(seconds)
+                seconds, _ = timed_post(client, "/summarize", payload, as_json=False)
+                warm.append(seconds)
+        results[mode] = {"cold": percentiles(cold), "cached": percentiles(warm)}
+        print(json.dumps({"summarize": mode, **results[mode]}))
+    return results
+
+def bench_generation(gistify, prompts, batch_sizes, new_tokens):
+    import torch
+    results = []
+    for batch_size in batch_sizes:
+        batch = (prompts * batch_size)[:batch_size]
+        inputs = gistify.tokenizer(batch, return_tensors="pt", padding=True, truncation=True, max_length=gistify.CONTEXT_TOKEN_BUDGET).to(gistify.model.device)
+        start = time.perf_counter()
+        with torch.no_grad():
+            # min_new_tokens pins the output length so runs generate the same number of tokens
+            gistify.model.generate(**inputs, max_new_tokens=new_tokens, min_new_tokens=new_tokens, num_beams=1, do_sample=False)
+        seconds = time.perf_counter() - start
+        results.append({
+            "batch_size": batch_size,
+            "input_tokens": int(inputs["attention_mask"].sum()),
+            "seconds": round(seconds, 3),
+            "tokens_per_second": round(batch_size * new_tokens / seconds, 1),
+        })
+        print(json.dumps({"generation": results[-1]}))
+    return results
+
+def bench_concurrency(gistify, doc_ids, levels, requests_per_worker):
+    results = []
+    for level in levels:
+        latencies, statuses = [], {}
+        lock = threading.Lock()
+
+        def worker(index):
+            client = gistify.app.test_client()
+            for i in range(requests_per_worker):
+                question = QUESTIONS[(index + i) % len(QUESTIONS)]
+                # One user per worker, so the per-user admission cap doesn't turn the load test away
+                payload = {"question": question, "doc_id": doc_ids[(index + i) % len(doc_ids)], "user_id": f"bench-{index}", "cache": False}
+                seconds, status = timed_post(client, "/ask", payload)
+                with lock:
+                    latencies.append(seconds)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            list(pool.map(worker, range(level)))
+        wall = time.perf_counter() - start
+        results.append({"concurrency": level, "requests_per_second": round(len(latencies) / wall, 3), **percentiles(latencies), "statuses": statuses})
+        print(json.dumps({"concurrency": results[-1]}))
+    return results
+
+def bench_mixed(gistify, doc_ids, summarizers, asks):
+    """/ask latency on an idle service, then with summarizers users requesting summaries back to back."""
+    def ask_latencies():
+        client = gistify.app.test_client()
+        latencies, statuses = [], {}
+        for i in range(asks):
+            payload = {"question": QUESTIONS[i % len(QUESTIONS)], "doc_id": doc_ids[i % len(doc_ids)], "user_id": "bench-asker", "cache": False}
+            seconds, status = timed_post(client, "/ask", payload)
+            latencies.append(seconds)
+            statuses[status] = statuses.get(status, 0) + 1
+        return {**percentiles(latencies), "statuses": statuses}
+
+    idle = ask_latencies()
+    stop = threading.Event()
+    summary_statuses = {}
+    lock = threading.Lock()
+
+    def summarizer(index):
+        client = gistify.app.test_client()
+        while not stop.is_set():
+            payload = {"doc_id": doc_ids[index % len(doc_ids)], "summary_type": "concise", "user_id": f"bench-summarizer-{index}"}
+            _, status = timed_post(client, "/summarize", payload, as_json=False)
+            with lock:
+                summary_statuses[status] = summary_statuses.get(status, 0) + 1
+
+    # Every summary must really generate, or the cache would make the background load vanish
+    get_cached_summary = gistify.get_cached_summary
+    gistify.get_cached_summary = lambda cache_key: None
+    try:
+        with ThreadPoolExecutor(max_workers=summarizers) as pool:
+            futures = [pool.submit(summarizer, index) for index in range(summarizers)]
+            time.sleep(1)
+            loaded = ask_latencies()
+            stop.set()
+            for future in futures:
+                future.result()
+    finally:
+        gistify.get_cached_summary = get_cached_summary
+    result = {"idle": idle, "with_summaries": loaded, "summaries": summary_statuses, "admission": gistify.admission.snapshot()}
+    print(json.dumps({"mixed": result}))
+    return result
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            label = item.get("document") or item.get("batch_size") or item.get("concurrency") if isinstance(item, dict) else i
+            yield from flatten(item, f"{prefix}{label}.")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix.rstrip("."), value
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = dict(flatten(json.load(f)))
+    print(f"\nChange against {baseline_path}:")
+    for key, value in flatten(results):
+        if key.startswith(("config.", "environment.")) or key not in baseline or not baseline[key]:
+            continue
+        change = (value - baseline[key]) / abs(baseline[key]) * 100
+        print(f"  {key}: {baseline[key]} -> {value} ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf-glob", default=os.path.join(ROOT, "Uploads", "*.pdf"))
+    parser.add_argument("--tiny", action="store_true", help="small models and short generations")
+    parser.add_argument("--allow-downloads", action="store_true", help="let Hugging Face fetch models that aren't cached")
+    parser.add_argument("--ask-repeats", type=int, default=1)
+    parser.add_argument("--summary-types", default="concise")
+    parser.add_argument("--summary-modes", default="retrieval,map_reduce")
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--concurrency", default="1,2,4,8")
+    parser.add_argument("--requests-per-worker", type=int, default=3)
+    parser.add_argument("--mixed-summarizers", type=int, default=2, help="users summarizing in the background of the mixed stage")
+    parser.add_argument("--mixed-asks", type=int, default=10)
+    parser.add_argument("--skip", default="", help="comma separated stages to skip: ask,chat,answer_cache,summarize,generation,concurrency,mixed")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO logging")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+    skip = set(filter(None, args.skip.split(",")))
+    # The app resolves Uploads/ and its model cache relative to the repository, so paths are fixed before chdir
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    workdir = tempfile.mkdtemp(prefix="gistify-bench-")
+    try:
+        if args.tiny:
+            os.environ.update(TINY_MODELS)
+        if not args.allow_downloads:
+            os.environ.setdefault("HF_HUB_OFFLINE", "1")
+            os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+        uploads = install_stand_ins(workdir)
+
+        os.chdir(ROOT)
+        import app as gistify
+        import logging
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+            gistify.logger.setLevel(logging.WARNING)
+
+        gistify.start_model_loading().join()
+        if gistify.startup_error is not None:
+            raise SystemExit(f"Model loading failed: {gistify.startup_error}")
+        if args.tiny:
+            shrink_generation_lengths(gistify)
+        client = gistify.app.test_client()
+
+        results = {
+            "config": {
+                "tiny": args.tiny,
+                "generation_model": gistify.MODEL_NAME,
+                "embedding_model": gistify.EMBEDDING_MODEL_NAME,
+                "inference_backend": gistify.INFERENCE_BACKEND,
+                "embedding_backend": gistify.EMBEDDING_BACKEND,
+                "generation_batching": gistify.GENERATION_BATCHING,
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+            },
+            "startup": dict(gistify.startup_timings),
+        }
+
+        documents = bench_ingest(gistify, client, sorted(glob.glob(args.pdf_glob)))
+        if not documents:
+            raise SystemExit(f"No documents ingested from {args.pdf_glob}")
+        total_seconds = sum(d["seconds"] for d in documents)
+        results["ingest"] = {
+            "documents": documents,
+            "pages_per_second": round(sum(d["pages"] for d in documents) / total_seconds, 2),
+            "chunks_per_second": round(sum(d["chunks"] for d in documents) / total_seconds, 2),
+            "cloudinary_uploads": len(uploads),
+        }
+        doc_ids = [d["doc_id"] for d in documents]
+
+        if "ask" not in skip:
+            results["ask"] = bench_ask(client, doc_ids, args.ask_repeats)
+            print(json.dumps({"ask": results["ask"]}))
+        if "chat" not in skip:
+            results["chat"] = bench_chat(client, doc_ids)
+        if "answer_cache" not in skip:
+            results["answer_cache"] = bench_answer_cache(client, doc_ids)
+        if "summarize" not in skip:
+            results["summarize"] = bench_summarize(client, doc_ids, args.summary_types.split(","), args.summary_modes.split(","))
+        if "generation" not in skip:
+            prompts = [f"Summarize: {chunk}" for chunk in gistify.collection.get(where={"doc_id": doc_ids[0]}, limit=8)["documents"]]
+            results["generation"] = bench_generation(gistify, prompts, [int(b) for b in args.batch_sizes.split(",")], args.new_tokens)
+        if "concurrency" not in skip:
+            results["concurrency"] = bench_concurrency(gistify, doc_ids, [int(c) for c in args.concurrency.split(",")], args.requests_per_worker)
+            results["generation_batcher"] = gistify.generation_batcher.snapshot()
+        if "mixed" not in skip:
+            results["mixed"] = bench_mixed(gistify, doc_ids, args.mixed_summarizers, args.mixed_asks)
+
+        if output:
+            with open(output, "w") as out:
+                json.dump(results, out, indent=2, default=str)
+        if baseline:
+            compare(results, baseline)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import re
+from collections import deque
+
+# A sentence ends at ., ! or ? followed by whitespace and something that can start a new sentence.
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=["\'(\[]?[A-Z0-9])')
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+def _split_long_sentence(sentence, tokens, max_tokens, count_tokens):
+    """Break a sentence longer than max_tokens into word windows that each fit the budget."""
+    words = sentence.split()
+    words_per_piece = max(1, int(len(words) * max_tokens / tokens))
+    pieces = [" ".join(words[i:i + words_per_piece]) for i in range(0, len(words), words_per_piece)]
+    for piece, piece_tokens in zip(pieces, count_tokens(pieces)):
+        if piece_tokens > max_tokens and len(piece.split()) > 1:
+            yield from _split_long_sentence(piece, piece_tokens, max_tokens, count_tokens)
+        else:
+            yield piece, piece_tokens
+
+def iter_token_chunks(paragraphs, count_tokens, max_tokens=200, overlap_tokens=40):
+    """Pack sentences from paragraphs into chunks of at most max_tokens tokens.
+
+    count_tokens takes a list of strings and returns their token counts. Consecutive chunks share
+    up to overlap_tokens tokens of whole sentences. Each sentence enters and leaves the window once,
+    so the work is linear in the length of the text. Chunks are yielded as soon as they are full,
+    so paragraphs can be a generator over pages that are still being extracted.
+    """
+    window = deque()
+    window_tokens = 0
+    has_new = False
+
+    for paragraph in paragraphs:
+        sentences = split_sentences(paragraph)
+        if not sentences:
+            continue
+        for sentence, tokens in zip(sentences, count_tokens(sentences)):
+            pieces = [(sentence, tokens)] if tokens <= max_tokens else _split_long_sentence(sentence, tokens, max_tokens, count_tokens)
+            for piece, piece_tokens in pieces:
+                if window and window_tokens + piece_tokens > max_tokens:
+                    if has_new:
+                        yield " ".join(text for text, _ in window)
+                    # Keep trailing sentences as overlap, but always leave room for the incoming piece
+                    while window and (window_tokens > overlap_tokens or window_tokens + piece_tokens > max_tokens):
+                        window_tokens -= window.popleft()[1]
+                    has_new = False
+                window.append((piece, piece_tokens))
+                window_tokens += piece_tokens
+                has_new = True
+
+    if window and has_new:
+        yield " ".join(text for text, _ in window)
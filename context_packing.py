@@ -0,0 +1,46 @@
+import hashlib
+
+# Packs ranked chunks into the generator's context window. No model imports, so the tokenizer comes in as functions.
+
+def pack_context(chunks, budget, count_tokens, truncate, min_partial_tokens=32, token_cache=None):
+    """Fill a token budget with distinct chunks in their rank order, cutting the last one at a token boundary.
+
+    count_tokens takes a list of texts and returns their token counts; truncate(text, tokens) returns the
+    text cut to its first tokens tokens. Chunks whose "tokens" is None are counted, memoized in token_cache
+    (anything with get and put) by a hash of their text, since ids like summary_0 repeat across documents.
+    Returns (context, stats) where stats reports used, dropped and duplicate tokens.
+    """
+    keys = [hashlib.sha1(chunk["text"].encode("utf-8")).digest() for chunk in chunks]
+    token_counts = [chunk["tokens"] for chunk in chunks]
+    if token_cache is not None:
+        token_counts = [tokens if tokens is not None else token_cache.get(key) for tokens, key in zip(token_counts, keys)]
+    missing = [i for i, tokens in enumerate(token_counts) if tokens is None]
+    if missing:
+        for i, tokens in zip(missing, count_tokens([chunks[i]["text"] for i in missing])):
+            token_counts[i] = tokens
+            if token_cache is not None:
+                token_cache.put(keys[i], tokens)
+
+    parts = []
+    seen = set()
+    stats = {"budget": budget, "used_tokens": 0, "dropped_tokens": 0, "duplicate_chunks": 0, "chunks": 0}
+    for chunk, tokens in zip(chunks, token_counts):
+        fingerprint = hashlib.sha1(chunk["text"].strip().lower().encode("utf-8")).digest()
+        if fingerprint in seen:
+            stats["duplicate_chunks"] += 1
+            continue
+        seen.add(fingerprint)
+
+        remaining = budget - stats["used_tokens"]
+        if tokens <= remaining:
+            parts.append(chunk["text"])
+            stats["used_tokens"] += tokens
+            stats["chunks"] += 1
+        elif remaining >= min_partial_tokens:
+            parts.append(truncate(chunk["text"], remaining))
+            stats["used_tokens"] += remaining
+            stats["dropped_tokens"] += tokens - remaining
+            stats["chunks"] += 1
+        else:
+            stats["dropped_tokens"] += tokens
+    return " ".join(parts), stats
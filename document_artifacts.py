@@ -0,0 +1,140 @@
+import re, math, heapq
+from collections import Counter, defaultdict
+import numpy as np
+from chunking import split_sentences
+
+# Cheap per-document artifacts computed once after ingest from the chunks and their MiniLM embeddings.
+
+SECTION_NAMES = [
+    "Abstract", "Introduction", "Background", "Related Work", "Literature Review", "Methods", "Method", "Methodology",
+    "Materials and Methods", "Approach", "Experiments", "Experiment", "Evaluation", "Results", "Result", "Discussion",
+    "Limitations", "Future Work", "Conclusions", "Conclusion", "References", "Bibliography",
+]
+# Headings that are unambiguous even in running text; the rest need a section number or all-caps to count
+STANDALONE_SECTIONS = {"abstract", "introduction", "conclusion", "conclusions", "references", "bibliography"}
+SECTION_HEADING = re.compile(
+    r'(?:^|(?<=[\s.]))((?:\d+|[IVX]+)(?:\.\d+)*\.?\s+|CHAPTER\s+\d+\s+)?'
+    r'(' + "|".join(sorted({name for title in SECTION_NAMES for name in (title, title.upper())}, key=len, reverse=True)) + r')'
+    r'(?=\s+[A-Z0-9])'
+)
+# Words, names and numbers; no dots, so terms stay valid MongoDB field names. Single digits count, as in
+# "figure 3", but single letters don't
+TERM = re.compile(r"[a-z0-9][a-z0-9\-]*[a-z0-9]|[0-9]")
+STOPWORDS = frozenset("""
+the and for are but not you all any can had her was one our out has have from they this that with which their
+there been were will would could should what when where who why how into than then them these those such also
+more most other some only over very just about after before between both each few many much same may might must
+its his she him our ours your yours upon within without while during through using used use based however thus
+in on at by of to is it as an be or we if so no do up us my me he
+""".split())
+
+def tokenize_terms(text):
+    return [term for term in TERM.findall(text.lower()) if term not in STOPWORDS]
+
+def detect_sections(texts):
+    """Find the first chunk each standard paper section heading appears in. Returns [{"title", "chunk"}]."""
+    sections = []
+    seen = set()
+    for i, text in enumerate(texts):
+        for match in SECTION_HEADING.finditer(text):
+            numbered, title = match.groups()
+            key = title.lower()
+            if not (numbered or title.isupper() or key in STANDALONE_SECTIONS):
+                continue
+            title = title.title() if title.isupper() else title
+            key = key.rstrip("s")
+            if key not in seen:
+                seen.add(key)
+                sections.append({"title": title, "chunk": i})
+    return sections
+
+def textrank(embeddings, damping=0.85, iterations=50, tolerance=1e-6):
+    """PageRank over the cosine similarity graph of normalized embeddings. Returns one score per row."""
+    n = len(embeddings)
+    if n == 0:
+        return np.zeros(0)
+    similarity = np.clip(embeddings @ embeddings.T, 0, None)
+    np.fill_diagonal(similarity, 0)
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    transition = np.divide(similarity, row_sums, out=np.full_like(similarity, 1.0 / n), where=row_sums > 0)
+    scores = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        updated = (1 - damping) / n + damping * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < tolerance:
+            return updated
+        scores = updated
+    return scores
+
+def extractive_digest(texts, embeddings, scores, encode, max_words=150, max_chunks=8):
+    """Pick the sentence closest to each of the most central chunks and join them in document order.
+
+    encode takes a list of sentences and returns their normalized embeddings.
+    """
+    top_chunks = [int(i) for i in np.argsort(-scores)[:max_chunks]]
+    candidates = [(i, sentence) for i in top_chunks for sentence in split_sentences(texts[i]) if 6 <= len(sentence.split()) <= 50]
+    if not candidates:
+        return ""
+    sentence_embeddings = encode([sentence for _, sentence in candidates])
+    best = {}
+    for (i, sentence), embedding in zip(candidates, sentence_embeddings):
+        similarity = float(embedding @ embeddings[i])
+        if i not in best or similarity > best[i][0]:
+            best[i] = (similarity, sentence)
+
+    # Most central chunks first until the word limit, then restore document order
+    selected, words, seen = [], 0, set()
+    for i in top_chunks:
+        if i not in best or best[i][1] in seen:
+            continue
+        sentence = best[i][1]
+        if selected and words + len(sentence.split()) > max_words:
+            break
+        selected.append((i, sentence))
+        seen.add(sentence)
+        words += len(sentence.split())
+    return " ".join(sentence for _, sentence in sorted(selected))
+
+def build_keyword_index(texts, top_keywords=15):
+    """Inverted index of chunk term frequencies, plus the document's most distinctive terms.
+
+    Returns {"postings": {term: [[chunk, tf], ...]}, "chunk_lengths": [...], "keywords": [...]}.
+    """
+    postings = {}
+    chunk_lengths = []
+    totals = Counter()
+    for i, text in enumerate(texts):
+        counts = Counter(tokenize_terms(text))
+        chunk_lengths.append(sum(counts.values()))
+        totals.update(counts)
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append([i, tf])
+    n = max(1, len(texts))
+    weight = lambda term: totals[term] * math.log(1 + n / len(postings[term]))
+    keywords = sorted((term for term in postings if term[0].isalpha() and len(term) > 2), key=weight, reverse=True)[:top_keywords]
+    return {"postings": postings, "chunk_lengths": chunk_lengths, "keywords": keywords}
+
+def bm25_search(index, terms, top_k, k1=1.2, b=0.75):
+    """Rank chunks of a keyword index against query terms with BM25. Returns [(chunk, score)], best first."""
+    postings = index["postings"]
+    chunk_lengths = index["chunk_lengths"]
+    n = len(chunk_lengths)
+    if not n:
+        return []
+    average_length = max(1.0, sum(chunk_lengths) / n)
+    scores = defaultdict(float)
+    for term in set(terms):
+        matches = postings.get(term)
+        if not matches:
+            continue
+        idf = math.log(1 + (n - len(matches) + 0.5) / (len(matches) + 0.5))
+        for chunk, tf in matches:
+            scores[chunk] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * chunk_lengths[chunk] / average_length))
+    return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked lists of ids into one list of (id, score), best first."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
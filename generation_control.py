@@ -0,0 +1,95 @@
+import logging, threading, time
+from collections import Counter
+
+# Generate-and-check retry loop for the quality gates. No model imports, so token counting comes in as a function.
+logger = logging.getLogger(__name__)
+
+# Rough FLAN-T5 tokens per English word, used until an attempt's own output gives a better estimate
+GENERATION_TOKENS_PER_WORD = 1.4
+quality_gate_stats = {"requests": 0, "attempts": 0, "rejected_attempts": 0, "rejected_seconds": 0.0, "rejected_tokens": 0, "stop_reasons": Counter()}
+quality_gate_lock = threading.Lock()
+
+class GenerationController:
+    """Generate-and-check retry loop that keeps the best attempt and stops once another retry can't pass.
+
+    A retry is predicted to fail when the settings cap output below the gate's word count, when decoding is
+    deterministic so it would repeat the rejected output, or when a check can't pass for any output at all.
+    checks(text) returns {check name: passed} and count_tokens takes a list of texts and returns their token counts.
+    """
+
+    def __init__(self, name, checks, generation_params, min_words, count_tokens, max_attempts=3, unsatisfiable=()):
+        self.name = name
+        self.checks = checks
+        self.generation_params = generation_params
+        self.min_words = min_words
+        self.count_tokens = count_tokens
+        self.max_attempts = max_attempts
+        self.unsatisfiable = set(unsatisfiable)
+        self.attempts = []
+        self.best = None
+        self.stop_reason = None
+
+    def futile_retry_reason(self, text, failed, output_tokens):
+        if failed & self.unsatisfiable:
+            return f"unsatisfiable:{','.join(sorted(failed & self.unsatisfiable))}"
+        if not self.generation_params.get("do_sample"):
+            return "deterministic"
+        if "word_count" in failed:
+            words = max(1, len(text.split()))
+            tokens_per_word = output_tokens / words if output_tokens else GENERATION_TOKENS_PER_WORD
+            max_length = self.generation_params.get("max_length", 20)
+            if max_length / tokens_per_word < self.min_words:
+                return "length_ceiling"
+        return None
+
+    def run(self, generate):
+        """Call generate(attempt) until its text passes the checks or a retry is predicted futile.
+
+        Returns (text, passed), where text is the accepted attempt or the best rejected one.
+        """
+        passed = False
+        for attempt in range(self.max_attempts):
+            start = time.perf_counter()
+            text = generate(attempt)
+            seconds = time.perf_counter() - start
+            checks = self.checks(text)
+            failed = {name for name, ok in checks.items() if not ok}
+            output_tokens = self.count_tokens([text])[0] if text else 0
+            self.attempts.append({"seconds": seconds, "tokens": output_tokens, "failed": sorted(failed)})
+
+            # Carry the closest attempt forward: fewest failed checks, then the longest text
+            score = (-len(failed), len(text.split()))
+            if self.best is None or score > self.best[0]:
+                self.best = (score, text, attempt)
+            if not failed:
+                passed = True
+                self.stop_reason = "accepted"
+                break
+            self.stop_reason = self.futile_retry_reason(text, failed, output_tokens)
+            if self.stop_reason:
+                logger.info(f"{self.name}: attempt {attempt + 1} failed {sorted(failed)}, not retrying ({self.stop_reason})")
+                break
+            logger.warning(f"{self.name}: attempt {attempt + 1}/{self.max_attempts} failed {sorted(failed)}")
+        else:
+            self.stop_reason = "max_attempts"
+
+        self.record()
+        return self.best[1], passed
+
+    def record(self):
+        # Every attempt except the one returned was wasted compute
+        rejected = [a for i, a in enumerate(self.attempts) if i != self.best[2]]
+        rejected_seconds = sum(a["seconds"] for a in rejected)
+        rejected_tokens = sum(a["tokens"] for a in rejected)
+        total_seconds = sum(a["seconds"] for a in self.attempts)
+        logger.info(
+            f"{self.name}: {len(self.attempts)} attempts, stop reason {self.stop_reason}, "
+            f"{rejected_seconds:.2f}s of {total_seconds:.2f}s and {rejected_tokens} tokens spent on rejected attempts"
+        )
+        with quality_gate_lock:
+            quality_gate_stats["requests"] += 1
+            quality_gate_stats["attempts"] += len(self.attempts)
+            quality_gate_stats["rejected_attempts"] += len(rejected)
+            quality_gate_stats["rejected_seconds"] += rejected_seconds
+            quality_gate_stats["rejected_tokens"] += rejected_tokens
+            quality_gate_stats["stop_reasons"][self.stop_reason] += 1
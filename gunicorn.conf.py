@@ -0,0 +1,27 @@
+import os
+
+# Load the models once in the master and fork workers that share them copy-on-write (see wsgi.py)
+preload_app = True
+bind = os.getenv("BIND", "0.0.0.0:5001")
+# ADMISSION_*, the generation batcher, PDF_EXTRACT_WORKERS and SUMMARY_JOB_WORKERS are all per worker, so the
+# host runs up to WEB_WORKERS times each of those limits
+workers = int(os.getenv("WEB_WORKERS", 2))
+# Threads let one worker hold SSE streams open and feed several requests into the generation batcher
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", 8))
+# Summaries on CPU can take minutes
+timeout = int(os.getenv("WEB_TIMEOUT", 300))
+graceful_timeout = 30
+
+# Split the cores between workers so their torch thread pools don't oversubscribe the CPU
+torch_threads = int(os.getenv("TORCH_THREADS_PER_WORKER", max(1, (os.cpu_count() or 1) // workers)))
+
+def on_starting(server):
+    if workers > 1 and not os.getenv("CHROMA_HOST"):
+        raise RuntimeError("WEB_WORKERS > 1 needs a shared Chroma server: set CHROMA_HOST (run `chroma run --path ./chroma_db`)")
+
+def post_fork(server, worker):
+    import app as gistify
+    gistify.init_worker(torch_threads)
+    # Every worker, including ones gunicorn restarts, takes over summary jobs whose lease has lapsed
+    gistify.start_summary_job_maintenance()
@@ -0,0 +1,106 @@
+import os, logging
+import torch
+from transformers import T5Tokenizer, T5ForConditionalGeneration
+from sentence_transformers import SentenceTransformer
+
+# Pluggable CPU inference backends for the FLAN-T5 generator and the MiniLM embedder.
+#   torch       fp32 PyTorch, the reference implementation
+#   torch-int8  PyTorch with int8 dynamic quantization of every Linear layer
+#   onnx        ONNX Runtime through optimum, exported once and cached under MODEL_CACHE_DIR
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+def _cache_path(cache_dir, name, backend):
+    return os.path.join(cache_dir, name.replace("/", "--"), backend)
+
+def _is_cached(path):
+    return os.path.isdir(path) and any(f.endswith(".onnx") for f in os.listdir(path))
+
+def quantize_linear_layers(module):
+    """Apply int8 dynamic quantization to the Linear layers of a PyTorch module."""
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _load_onnx_seq2seq(name, cache_dir):
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    path = _cache_path(cache_dir, name, "onnx")
+    if _is_cached(path):
+        logger.info(f"Loading cached ONNX export of {name} from {path}")
+        return ORTModelForSeq2SeqLM.from_pretrained(path)
+    logger.info(f"Exporting {name} to ONNX at {path}, this only happens once")
+    model = ORTModelForSeq2SeqLM.from_pretrained(name, export=True)
+    model.save_pretrained(path)
+    return model
+
+def load_generation_model(name, backend="torch", cache_dir="./model_cache"):
+    """Return (tokenizer, model, backend) for a seq2seq generator, backend being the one actually loaded."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+    tokenizer = T5Tokenizer.from_pretrained(name, legacy=False)
+
+    if backend == "onnx":
+        try:
+            return tokenizer, _load_onnx_seq2seq(name, cache_dir), backend
+        except ImportError:
+            logger.warning("optimum[onnxruntime] is not installed, falling back to the torch backend")
+            backend = "torch"
+
+    if backend == "torch-int8":
+        # Dynamic quantization runs on CPU only
+        model = T5ForConditionalGeneration.from_pretrained(name)
+        return tokenizer, quantize_linear_layers(model), backend
+    return tokenizer, T5ForConditionalGeneration.from_pretrained(name, device_map="auto"), backend
+
+def load_embedding_model(name, backend="torch", cache_dir="./model_cache"):
+    """Return (model, backend) for a SentenceTransformer, backend being the one actually loaded."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+    if backend == "onnx":
+        path = _cache_path(cache_dir, name, "onnx")
+        try:
+            if _is_cached(os.path.join(path, "onnx")):
+                logger.info(f"Loading cached ONNX export of {name} from {path}")
+                return SentenceTransformer(path, backend="onnx"), backend
+            logger.info(f"Exporting {name} to ONNX at {path}, this only happens once")
+            model = SentenceTransformer(name, backend="onnx")
+            model.save_pretrained(path)
+            return model, backend
+        except (ImportError, TypeError) as e:
+            # TypeError: sentence-transformers older than 3.2 has no backend argument
+            logger.warning(f"ONNX embeddings unavailable ({e}), falling back to the torch backend")
+            backend = "torch"
+
+    model = SentenceTransformer(name)
+    if backend == "torch-int8":
+        model[0].auto_model = quantize_linear_layers(model[0].auto_model)
+    return model, backend
+
+def generation_parity(reference, candidate, tokenizer, prompts, max_new_tokens=48):
+    """Compare a candidate generator with the reference on greedy decodes and first-step logits."""
+    results = []
+    for prompt in prompts:
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024)
+        decoder_input_ids = torch.full((1, 1), reference.config.decoder_start_token_id, dtype=torch.long)
+        with torch.no_grad():
+            reference_logits = reference(**inputs, decoder_input_ids=decoder_input_ids).logits[0, -1]
+            candidate_logits = candidate(**inputs, decoder_input_ids=decoder_input_ids).logits[0, -1]
+            reference_ids = reference.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, num_beams=1)
+            candidate_ids = candidate.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, num_beams=1)
+        reference_text = tokenizer.decode(reference_ids[0], skip_special_tokens=True)
+        candidate_text = tokenizer.decode(candidate_ids[0], skip_special_tokens=True)
+        results.append({
+            "prompt": prompt[:80],
+            "exact_match": reference_text == candidate_text,
+            "top1_match": int(reference_logits.argmax()) == int(candidate_logits.argmax()),
+            "max_logit_diff": float((reference_logits - candidate_logits).abs().max()),
+            "reference": reference_text,
+            "candidate": candidate_text,
+        })
+    return results
+
+def embedding_parity(reference, candidate, texts):
+    """Cosine similarity between reference and candidate embeddings of the same texts."""
+    reference_embeddings = reference.encode(texts, normalize_embeddings=True)
+    candidate_embeddings = candidate.encode(texts, normalize_embeddings=True)
+    return [float(a @ b) for a, b in zip(reference_embeddings, candidate_embeddings)]
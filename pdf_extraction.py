@@ -0,0 +1,59 @@
+import os, logging, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+
+# Kept separate from app.py so extraction worker processes never import the models.
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+def _extract_page_range(path, start, stop):
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def start_extraction_pool(max_workers):
+    """Fork the page extraction processes now, replacing any earlier pool.
+
+    Forking a process that already runs threads can deadlock the child on a lock one of them held, so call
+    this before the process starts any, e.g. right after a gunicorn fork. Without a pool, or with fewer than
+    two workers, PDFs are extracted serially.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if max_workers < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    # Fork so workers don't re-import the web app's __main__ (and its models) the way spawn and forkserver would
+    _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork"))
+    # With fork the pool starts all of its processes on the first submit, so this forks them before any thread exists
+    _executor.submit(os.getpid).result()
+    logger.info(f"Started {max_workers} PDF extraction processes")
+    return _executor
+
+def iter_pdf_pages(path, pages_per_task=16, min_parallel_pages=64):
+    """Yield the text of each page of the PDF at path, in order, as soon as it is extracted.
+
+    With an extraction pool started, PDFs of at least min_parallel_pages are split into page ranges extracted
+    in parallel. Each range re-parses the PDF's cross-reference table, so shorter documents are extracted
+    serially, and ranges should be large enough to amortize that.
+    """
+    reader = PdfReader(path)
+    page_count = len(reader.pages)
+    executor = _executor
+    if executor is None or page_count < max(min_parallel_pages, pages_per_task + 1):
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    futures = [
+        executor.submit(_extract_page_range, path, start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ]
+    try:
+        for future in futures:
+            for page_text in future.result():
+                yield page_text
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,106 @@
+import threading, time
+import pytest
+from admission_control import AdmissionController, AdmissionRejected
+
+QUEUE_SIZES = {"interactive": 4, "batch": 4}
+
+def controller(max_active=1, max_active_batch=1, max_per_user=2, queue_sizes=QUEUE_SIZES, batch_aging_seconds=None):
+    return AdmissionController(max_active, max_active_batch, max_per_user, queue_sizes, batch_aging_seconds)
+
+def acquire_in_background(admission, priority, admitted, user=None):
+    """Queue an acquire on its own thread, appending priority to admitted once it gets a slot."""
+    releases = []
+
+    def run():
+        releases.append(admission.acquire(priority, user))
+        admitted.append(priority)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, releases
+
+def wait_until_queued(admission, priority, count):
+    deadline = time.monotonic() + 2
+    while admission.snapshot()["queued"][priority] < count:
+        assert time.monotonic() < deadline, f"{priority} queue never reached {count}"
+        time.sleep(0.005)
+
+def test_client_over_its_cap_gets_429():
+    admission = controller(max_active=4, max_per_user=1)
+    release = admission.acquire("interactive", "user:a")
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("interactive", "user:a")
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after >= 1
+    # Other clients, and anonymous requests, are unaffected
+    admission.acquire("interactive", "user:b")()
+    admission.acquire("interactive")()
+    release()
+    admission.acquire("interactive", "user:a")()
+
+def test_full_queue_gets_503():
+    admission = controller(queue_sizes={"interactive": 1, "batch": 1})
+    release = admission.acquire("interactive")
+    admitted = []
+    thread, releases = acquire_in_background(admission, "interactive", admitted)
+    wait_until_queued(admission, "interactive", 1)
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("interactive", timeout=1)
+    assert rejected.value.status == 503
+    release()
+    thread.join(1)
+    releases[0]()
+    assert admitted == ["interactive"]
+
+def test_queue_timeout_gets_503_and_frees_the_client():
+    admission = controller(max_per_user=1)
+    release = admission.acquire("interactive")
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("interactive", "user:a", timeout=0.05)
+    assert rejected.value.status == 503
+    assert admission.snapshot()["queued"]["interactive"] == 0
+    assert admission.snapshot()["users"] == 0
+    release()
+
+def test_interactive_requests_go_before_batch():
+    admission = controller()
+    release = admission.acquire("interactive")
+    admitted = []
+    batch_thread, batch_releases = acquire_in_background(admission, "batch", admitted)
+    wait_until_queued(admission, "batch", 1)
+    interactive_thread, interactive_releases = acquire_in_background(admission, "interactive", admitted)
+    wait_until_queued(admission, "interactive", 1)
+    release()
+    interactive_thread.join(1)
+    assert admitted == ["interactive"]
+    interactive_releases[0]()
+    batch_thread.join(1)
+    batch_releases[0]()
+    assert admitted == ["interactive", "batch"]
+
+def test_batch_work_is_capped_below_the_total():
+    admission = controller(max_active=3, max_active_batch=1)
+    release = admission.acquire("batch")
+    with pytest.raises(AdmissionRejected):
+        admission.acquire("batch", timeout=0.05)
+    # The remaining slots stay free for interactive requests
+    admission.acquire("interactive", timeout=0.05)()
+    release()
+    admission.acquire("batch", timeout=0.05)()
+
+def test_aged_batch_request_goes_before_interactive():
+    admission = controller(batch_aging_seconds=0.05)
+    release = admission.acquire("interactive")
+    admitted = []
+    batch_thread, batch_releases = acquire_in_background(admission, "batch", admitted)
+    wait_until_queued(admission, "batch", 1)
+    interactive_thread, interactive_releases = acquire_in_background(admission, "interactive", admitted)
+    wait_until_queued(admission, "interactive", 1)
+    time.sleep(0.1)
+    release()
+    batch_thread.join(1)
+    assert admitted == ["batch"]
+    batch_releases[0]()
+    interactive_thread.join(1)
+    interactive_releases[0]()
+    assert admitted == ["batch", "interactive"]
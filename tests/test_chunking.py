@@ -0,0 +1,52 @@
+from chunking import split_sentences, iter_token_chunks
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+def sentence(i, words=5):
+    return " ".join([f"Word{i}"] + [f"w{i}x{j}" for j in range(words - 2)]) + f" end{i}."
+
+def test_split_sentences_only_breaks_before_a_sentence_start():
+    assert split_sentences("First one. Second one! e.g. third one? 4 is a number.") == [
+        "First one.", "Second one! e.g. third one?", "4 is a number."
+    ]
+
+def test_chunks_stay_within_budget():
+    text = " ".join(sentence(i) for i in range(40))
+    chunks = list(iter_token_chunks([text], count_words, max_tokens=20, overlap_tokens=5))
+    assert chunks
+    assert all(len(chunk.split()) <= 20 for chunk in chunks)
+
+def test_consecutive_chunks_overlap_by_whole_sentences():
+    text = " ".join(sentence(i) for i in range(12))
+    chunks = list(iter_token_chunks([text], count_words, max_tokens=20, overlap_tokens=5))
+    for previous, current in zip(chunks, chunks[1:]):
+        last_sentence = split_sentences(previous)[-1]
+        assert current.startswith(last_sentence)
+
+def test_every_sentence_is_kept_in_order():
+    sentences = [sentence(i) for i in range(25)]
+    chunks = list(iter_token_chunks([" ".join(sentences[:10]), " ".join(sentences[10:])], count_words, max_tokens=17, overlap_tokens=4))
+    # Overlap repeats sentences, so compare first occurrences
+    assert list(dict.fromkeys(s for chunk in chunks for s in split_sentences(chunk))) == sentences
+
+def test_long_sentence_is_split_into_pieces_that_fit():
+    long_sentence = " ".join(f"w{i}" for i in range(55)) + "."
+    chunks = list(iter_token_chunks([long_sentence], count_words, max_tokens=10, overlap_tokens=0))
+    assert all(len(chunk.split()) <= 10 for chunk in chunks)
+    assert " ".join(chunks).split() == long_sentence.split()
+
+def test_chunks_are_yielded_before_later_paragraphs_are_read():
+    read = []
+
+    def paragraphs():
+        for i in range(10):
+            read.append(i)
+            yield " ".join(sentence(i * 10 + j) for j in range(4))
+
+    chunks = iter_token_chunks(paragraphs(), count_words, max_tokens=20, overlap_tokens=0)
+    next(chunks)
+    assert len(read) < 10
+
+def test_empty_input_yields_nothing():
+    assert list(iter_token_chunks(["", "   "], count_words)) == []
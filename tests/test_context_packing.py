@@ -0,0 +1,75 @@
+from context_packing import pack_context
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+def truncate_words(text, tokens):
+    return " ".join(text.split()[:tokens])
+
+class DictCache(dict):
+    def put(self, key, value):
+        self[key] = value
+
+def chunk(chunk_id, words, tokens=None, word="w"):
+    return {"id": chunk_id, "text": " ".join(f"{word}{i}" for i in range(words)), "tokens": tokens}
+
+def pack(chunks, budget, **kwargs):
+    return pack_context(chunks, budget, count_words, truncate_words, min_partial_tokens=4, **kwargs)
+
+def test_chunks_are_packed_whole_in_rank_order():
+    context, stats = pack([chunk("a", 3, word="a"), chunk("b", 4, word="b")], 10)
+    assert context == "a0 a1 a2 b0 b1 b2 b3"
+    assert stats == {"budget": 10, "used_tokens": 7, "dropped_tokens": 0, "duplicate_chunks": 0, "chunks": 2}
+
+def test_last_chunk_is_cut_to_the_remaining_budget():
+    context, stats = pack([chunk("a", 6, word="a"), chunk("b", 8, word="b")], 12)
+    assert context == "a0 a1 a2 a3 a4 a5 b0 b1 b2 b3 b4 b5"
+    assert stats["used_tokens"] == 12
+    assert stats["dropped_tokens"] == 2
+
+def test_remainder_too_small_for_a_partial_chunk_is_left_empty():
+    context, stats = pack([chunk("a", 9, word="a"), chunk("b", 8, word="b"), chunk("c", 2, word="c")], 12)
+    # 3 tokens left is below the partial minimum, but the short chunk after it still fits
+    assert context.split() == [f"a{i}" for i in range(9)] + ["c0", "c1"]
+    assert stats["dropped_tokens"] == 8
+    assert stats["chunks"] == 2
+
+def test_duplicate_text_is_only_packed_once():
+    duplicate = {"id": "b", "text": "  A0 A1 A2 ", "tokens": None}
+    context, stats = pack([chunk("a", 3, word="a"), duplicate], 10)
+    assert context == "a0 a1 a2"
+    assert stats["duplicate_chunks"] == 1
+
+def test_stored_token_counts_are_trusted():
+    calls = []
+
+    def counting(texts):
+        calls.append(texts)
+        return count_words(texts)
+
+    _, stats = pack_context([chunk("a", 3, tokens=5)], 10, counting, truncate_words)
+    assert calls == []
+    assert stats["used_tokens"] == 5
+
+def test_counted_tokens_are_memoized_by_text():
+    cache = DictCache()
+    calls = []
+
+    def counting(texts):
+        calls.append(list(texts))
+        return count_words(texts)
+
+    chunks = [chunk("a", 3, word="a"), chunk("b", 4, word="b")]
+    pack_context(chunks, 20, counting, truncate_words, token_cache=cache)
+    pack_context(chunks, 20, counting, truncate_words, token_cache=cache)
+    assert len(calls) == 1
+    assert sorted(cache.values()) == [3, 4]
+
+def test_same_ids_with_different_text_are_counted_separately():
+    # Map-reduce summaries of two documents are both called summary_0, summary_1, ...
+    cache = DictCache()
+    first = [chunk(f"summary_{i}", 3, word=f"a{i}_") for i in range(2)]
+    second = [chunk(f"summary_{i}", 6, word=f"b{i}_") for i in range(2)]
+    pack(first, 20, token_cache=cache)
+    _, stats = pack(second, 20, token_cache=cache)
+    assert stats["used_tokens"] == 12
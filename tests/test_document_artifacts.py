@@ -0,0 +1,85 @@
+import numpy as np
+from document_artifacts import detect_sections, textrank, extractive_digest, build_keyword_index, tokenize_terms, bm25_search, reciprocal_rank_fusion
+
+def normalized(rows):
+    rows = np.array(rows, dtype=float)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+def test_numbered_and_standalone_headings_are_detected_once():
+    texts = [
+        "Abstract We study retrieval. 1 Introduction Retrieval matters.",
+        "2. Methods We train models. The methods section continues here.",
+        "3 Results Accuracy improves. 4 Conclusions Retrieval helps. 5 Conclusion Again.",
+    ]
+    assert detect_sections(texts) == [
+        {"title": "Abstract", "chunk": 0},
+        {"title": "Introduction", "chunk": 0},
+        {"title": "Methods", "chunk": 1},
+        {"title": "Results", "chunk": 2},
+        {"title": "Conclusions", "chunk": 2},
+    ]
+
+def test_section_words_in_running_text_are_not_headings():
+    texts = ["Our results show the method works. See the discussion Below for details."]
+    assert detect_sections(texts) == []
+
+def test_all_caps_headings_are_title_cased():
+    assert detect_sections(["RELATED WORK Prior systems exist."]) == [{"title": "Related Work", "chunk": 0}]
+
+def test_textrank_scores_the_most_connected_chunk_highest():
+    # Chunk 1 sits between the other two, which share nothing with each other
+    embeddings = normalized([[1, 0], [1, 1], [0, 1]])
+    scores = textrank(embeddings)
+    assert scores.argmax() == 1
+    assert abs(scores.sum() - 1) < 1e-6
+    assert abs(scores[0] - scores[2]) < 1e-9
+
+def test_textrank_of_no_chunks_is_empty():
+    assert textrank(np.zeros((0, 4))).shape == (0,)
+
+def test_digest_keeps_document_order_within_the_word_limit():
+    texts = [
+        "The first chunk opens with this sentence about retrieval systems.",
+        "A second chunk explains how the ranking model is trained end to end.",
+    ]
+    embeddings = normalized([[1, 0], [0, 1]])
+    # The second chunk is more central, but the digest still reads in document order
+    scores = np.array([0.4, 0.6])
+    encode = lambda sentences: normalized([[1, 0] if "first" in s else [0, 1] for s in sentences])
+    assert extractive_digest(texts, embeddings, scores, encode) == " ".join(texts)
+    assert extractive_digest(texts, embeddings, scores, encode, max_words=14) == texts[1]
+
+def test_keyword_index_counts_terms_per_chunk():
+    index = build_keyword_index(["Retrieval and ranking, retrieval again.", "Ranking models"])
+    assert index["postings"]["retrieval"] == [[0, 2]]
+    assert index["postings"]["ranking"] == [[0, 1], [1, 1]]
+    assert "and" not in index["postings"]
+    assert index["chunk_lengths"] == [4, 2]
+
+def test_keywords_prefer_frequent_distinctive_words():
+    texts = ["transformer attention transformer", "transformer layers", "attention 2024 ok"]
+    keywords = build_keyword_index(texts, top_keywords=2)["keywords"]
+    assert keywords == ["transformer", "attention"]
+    assert "2024" not in build_keyword_index(texts)["keywords"]
+
+def test_terms_keep_numbers_of_any_length_but_not_single_letters():
+    assert tokenize_terms("See Figure 3, table 12 and the x-ray in a b") == ["see", "figure", "3", "table", "12", "x-ray"]
+
+def test_bm25_finds_a_figure_by_its_number():
+    texts = ["Figure 1 shows the architecture.", "Figure 3 plots accuracy against data size.", "Figure 2 lists the datasets."]
+    index = build_keyword_index(texts)
+    ranked = bm25_search(index, tokenize_terms("what does figure 3 show"), top_k=3)
+    assert ranked[0][0] == 1
+
+def test_bm25_prefers_shorter_chunks_with_the_same_matches():
+    texts = ["ranking ranking retrieval", "ranking retrieval filler words pad this chunk out", "ranking"]
+    index = build_keyword_index(texts)
+    ranked = bm25_search(index, ["retrieval"], top_k=3)
+    assert [chunk for chunk, _ in ranked] == [0, 1]
+    assert bm25_search(index, ["missing"], top_k=3) == []
+    assert bm25_search(build_keyword_index([]), ["ranking"], top_k=3) == []
+
+def test_rrf_rewards_items_ranked_well_in_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]], k=1)
+    assert [item for item, _ in fused] == ["b", "c", "a", "d"]
+    assert fused[0][1] == 1 / 3 + 1 / 2
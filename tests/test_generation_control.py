@@ -0,0 +1,69 @@
+from generation_control import GenerationController, quality_gate_stats
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+def word_count_check(min_words):
+    return lambda text: {"word_count": len(text.split()) >= min_words}
+
+def controller(checks, params=None, min_words=3, **kwargs):
+    params = {"do_sample": True, "max_length": 100} if params is None else params
+    return GenerationController("test", checks, params, min_words, count_words, **kwargs)
+
+def replies(*texts):
+    calls = []
+    def generate(attempt):
+        calls.append(attempt)
+        return texts[attempt]
+    return generate, calls
+
+def test_first_passing_attempt_is_accepted():
+    gate = controller(word_count_check(3))
+    generate, calls = replies("too short", "long enough answer here", "never reached at all")
+    assert gate.run(generate) == ("long enough answer here", True)
+    assert calls == [0, 1]
+    assert gate.stop_reason == "accepted"
+
+def test_deterministic_decoding_is_not_retried():
+    gate = controller(word_count_check(3), params={"do_sample": False, "max_length": 100})
+    generate, calls = replies("too short", "long enough answer here")
+    assert gate.run(generate) == ("too short", False)
+    assert calls == [0]
+    assert gate.stop_reason == "deterministic"
+
+def test_output_capped_below_the_word_count_is_not_retried():
+    # Ten tokens at one token per word can never reach fifty words
+    gate = controller(word_count_check(50), params={"do_sample": True, "max_length": 10}, min_words=50)
+    generate, calls = replies("a few words only", "more words but still short")
+    assert gate.run(generate) == ("a few words only", False)
+    assert calls == [0]
+    assert gate.stop_reason == "length_ceiling"
+
+def test_unsatisfiable_check_stops_retrying():
+    gate = controller(lambda text: {"relevant_words": False, "word_count": True}, unsatisfiable=["relevant_words"])
+    generate, calls = replies("any answer at all", "another answer here")
+    assert gate.run(generate) == ("any answer at all", False)
+    assert calls == [0]
+    assert gate.stop_reason == "unsatisfiable:relevant_words"
+
+def test_max_attempts_returns_the_best_rejected_attempt():
+    def checks(text):
+        return {"word_count": len(text.split()) >= 10, "no_digits": not any(c.isdigit() for c in text)}
+    gate = controller(checks, max_attempts=3)
+    generate, calls = replies("one 2", "three words here", "four 5 words here")
+    text, passed = gate.run(generate)
+    # Fewest failed checks wins, the longest text breaks ties
+    assert (text, passed) == ("three words here", False)
+    assert calls == [0, 1, 2]
+    assert gate.stop_reason == "max_attempts"
+
+def test_rejected_attempts_are_recorded():
+    before = dict(quality_gate_stats, stop_reasons=quality_gate_stats["stop_reasons"].copy())
+    gate = controller(word_count_check(3))
+    generate, _ = replies("short", "long enough answer here")
+    gate.run(generate)
+    assert quality_gate_stats["requests"] == before["requests"] + 1
+    assert quality_gate_stats["attempts"] == before["attempts"] + 2
+    assert quality_gate_stats["rejected_attempts"] == before["rejected_attempts"] + 1
+    assert quality_gate_stats["rejected_tokens"] == before["rejected_tokens"] + 1
+    assert quality_gate_stats["stop_reasons"]["accepted"] == before["stop_reasons"]["accepted"] + 1
@@ -0,0 +1,16 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app the gunicorn master imports this module once, waits for the models to load and warm up,
+then forks the web workers. Each worker shares the master's model weights copy-on-write instead of loading
+its own copy, so adding workers adds throughput without multiplying RAM.
+"""
+import logging
+
+import app as gistify
+
+gistify.start_model_loading().join()
+if gistify.startup_error is not None:
+    raise SystemExit(f"Model loading failed: {gistify.startup_error}")
+logging.getLogger(__name__).info(f"Models loaded for forking: {gistify.startup_timings}")
+
+app = gistify.app